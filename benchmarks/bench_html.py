@@ -0,0 +1,96 @@
+# Compares the streaming HTML extractor against the old BeautifulSoup path of process_files
+# Run from the repository root: python -m benchmarks.bench_html [--docs 500] [--corpus DEV]
+# Without --corpus, pages come from the synthetic corpus generator.
+
+import json
+import pathlib
+import re
+import statistics
+import warnings
+
+from argparse import ArgumentParser
+from collections import defaultdict
+from time import perf_counter
+
+from bs4 import BeautifulSoup
+
+from benchmarks.synthetic import SyntheticCorpus
+from search import HTMLExtractor, tokenize
+
+BEAUTIFUL_SOUP_TAGS = ['b', re.compile('^h[4-6]$'), re.compile('^h[1-3]$'), 'title']
+
+
+def beautiful_soup_counts(html: str) -> {str: int}:
+    """
+    Token counts the way process_files computed them before the streaming extractor: a full tree, getText() for the
+    body and one findAll walk per weighted tag.
+    """
+    counts = defaultdict(int)
+    soup = BeautifulSoup(html, 'html.parser')
+    for token in tokenize(soup.getText()):
+        counts[token] += 1
+    for tag_power, tag in enumerate(BEAUTIFUL_SOUP_TAGS):
+        for result in soup.find_all(tag):
+            for token in tokenize(str(result.string)):
+                counts[token] += 2 ** (tag_power + 1) - 1
+    return counts
+
+
+def streaming_counts(html: str) -> {str: int}:
+    counts = defaultdict(int)
+    for text, weight in HTMLExtractor().extract(html):
+        for token in tokenize(text):
+            counts[token] += 1 + weight
+    return counts
+
+
+def load_pages(corpus: str, docs: int) -> [str]:
+    if corpus is None:
+        synthetic = SyntheticCorpus()
+        return [synthetic.page() for _ in range(docs)]
+
+    pages = []
+    for file in sorted(pathlib.Path(corpus).rglob("*.json"))[:docs]:
+        with file.open() as contents:
+            pages.append(json.load(contents)["content"])
+    return pages
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--corpus", type=str, default=None, help="Crawl folder in the DEV layout")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore", category=UserWarning, module='bs4')
+    pages = load_pages(args.corpus, args.docs)
+
+    timings = {}
+    counts = {}
+    for name, method in (("BeautifulSoup", beautiful_soup_counts), ("streaming", streaming_counts)):
+        timings[name] = []
+        counts[name] = []
+        for page in pages:
+            start = perf_counter()
+            counts[name].append(method(page))
+            timings[name].append(perf_counter() - start)
+
+    # How much of the weighted token mass both paths agree on
+    agreement = []
+    for old, new in zip(counts["BeautifulSoup"], counts["streaming"]):
+        total = sum(old.values()) + sum(new.values())
+        shared = sum(min(old.get(_, 0), new.get(_, 0)) for _ in old) * 2
+        agreement.append(shared / total if total else 1.0)
+
+    page_bytes = sum(len(_) for _ in pages)
+    print(f"{len(pages)} pages, {page_bytes / 2 ** 20:.2f} MB of HTML\n")
+    for name in timings:
+        total = sum(timings[name])
+        print(f"{name:>13}: {total:.3f}s total, {statistics.median(timings[name]) * 1000:.3f}ms median per page, "
+              f"{page_bytes / 2 ** 20 / total:.2f} MB/s")
+    print(f"\nSpeedup: {sum(timings['BeautifulSoup']) / sum(timings['streaming']):.1f}x, "
+          f"token count agreement: {statistics.fmean(agreement):.1%}")
+
+
+if __name__ == '__main__':
+    main()
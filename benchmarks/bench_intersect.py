@@ -0,0 +1,75 @@
+# Compares the galloping intersection engine against the old dict-probe intersection on queries drawn from the index
+# Run from the repository root: python -m benchmarks.bench_intersect [--queries 200] [--index-dir final_indices]
+
+import pathlib
+import random
+import statistics
+
+from argparse import ArgumentParser
+from time import perf_counter
+
+from crungus_search import CrungySearchEngine
+from search import intersect
+
+
+def sample_queries(engine: CrungySearchEngine, amount: int, seed: int) -> [[str]]:
+    """
+    Draw multi-term queries from the lexicon. Every query mixes one common term with rarer ones, which is the case
+    where probing a long list for every doc of a short one hurts the most.
+    """
+    engine.load_lexicon()
+    rng = random.Random(seed)
+    terms = list(engine.lexicon)
+    common = [_ for _ in terms if engine.lexicon.get(_).doc_freq >= 1000]
+    regular = [_ for _ in terms if engine.lexicon.get(_).doc_freq >= 20]
+    if not common or not regular:
+        raise ValueError("The index is too small to draw queries from")
+
+    return [[rng.choice(common)] + rng.sample(regular, rng.choice([1, 2, 3])) for _ in range(amount)]
+
+
+def dict_probe(engine: CrungySearchEngine, query: [str]) -> int:
+    entries = [engine.find_term(_) for _ in query]
+    _, num_results = engine.and_results(entries)
+    return num_results
+
+
+def galloping(engine: CrungySearchEngine, query: [str]) -> int:
+    doc_ids, _ = intersect([engine.find_postings(_) for _ in query])
+    return len(doc_ids)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=121)
+    parser.add_argument("--index-dir", type=str, default="final_indices")
+    args = parser.parse_args()
+
+    # No cache, or the second method would read the postings the first one left in it
+    engine = CrungySearchEngine(cache_bytes=0)
+    engine.index_dir = pathlib.Path(args.index_dir)
+    queries = sample_queries(engine, args.queries, args.seed)
+
+    timings = {"dict probe": {}, "galloping": {}}
+    for query in queries:
+        for name, method in (("dict probe", dict_probe), ("galloping", galloping)):
+            start = perf_counter()
+            matches = method(engine, query)
+            timings[name].setdefault(len(query), []).append(perf_counter() - start)
+            if name == "dict probe":
+                expected = matches
+            elif matches != expected:
+                raise AssertionError(f"Intersections disagree on {query}: {expected} vs {matches}")
+
+    print(f"{args.queries} queries from {engine.index_dir}\n")
+    print(f"{'terms':>5}  {'queries':>7}  {'dict probe (ms)':>15}  {'galloping (ms)':>14}  {'speedup':>7}")
+    for terms in sorted(timings["dict probe"]):
+        probe = statistics.median(timings["dict probe"][terms]) * 1000
+        gallop = statistics.median(timings["galloping"][terms]) * 1000
+        print(f"{terms:>5}  {len(timings['dict probe'][terms]):>7}  {probe:>15.3f}  {gallop:>14.3f}  "
+              f"{probe / gallop:>6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
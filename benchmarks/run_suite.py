@@ -0,0 +1,154 @@
+# End-to-end benchmark: generates a synthetic corpus, then times indexing, merging and querying on it
+# Run from the repository root: python -m benchmarks.run_suite [--docs 2000] [--output bench_results.json]
+# Every phase runs in a fresh process so its peak RSS is its own. Nothing here needs the real DEV corpus.
+
+import json
+import os
+import pathlib
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter, strftime
+
+from benchmarks.synthetic import DEFAULT_TAG_MIX, SyntheticCorpus
+from crungus_search import CrungySearchEngine
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is just not reported there
+    resource = None
+
+QUERY_LENGTHS = (1, 2, 5)
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_phase(function, *args) -> dict:
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(function, *args).result()
+
+
+def index_phase(work_dir: str, corpus_dir: str) -> dict:
+    os.chdir(work_dir)
+    engine = CrungySearchEngine()
+    start = perf_counter()
+    # Every synthetic page is its own, the docs per second should count all of them
+    engine.process_files(pathlib.Path(corpus_dir), pathlib.Path("docID.txt"), skip_duplicates=False)
+    elapsed = perf_counter() - start
+    docs = sum(1 for _ in pathlib.Path("docID.txt").open())
+    return {"seconds": elapsed, "docs": docs, "docs_per_second": docs / elapsed, "peak_rss_bytes": peak_rss_bytes()}
+
+
+def merge_phase(work_dir: str) -> dict:
+    os.chdir(work_dir)
+    engine = CrungySearchEngine()
+    engine.doc_id_path = pathlib.Path("docID.txt")
+    start = perf_counter()
+    engine.merge_final_indices()
+    elapsed = perf_counter() - start
+
+    index_bytes = sum(_.stat().st_size for _ in engine.index_dir.iterdir())
+    doc_store_bytes = sum(_.stat().st_size for _ in pathlib.Path(".").glob("docID.*"))
+    engine.load_lexicon()
+    return {"seconds": elapsed, "index_bytes": index_bytes, "doc_store_bytes": doc_store_bytes,
+            "terms": len(engine.lexicon), "peak_rss_bytes": peak_rss_bytes()}
+
+
+def query_phase(work_dir: str, queries: {int: [str]}) -> dict:
+    os.chdir(work_dir)
+    # No cache, so every query pays for its own postings
+    engine = CrungySearchEngine(cache_bytes=0)
+    engine.doc_id_path = pathlib.Path("docID.txt")
+    engine.load_lexicon()
+
+    results = {}
+    for terms, term_queries in queries.items():
+        latencies = []
+        zero_results = 0
+        for query in term_queries:
+            start = perf_counter()
+            zero_results += not engine.search(query, 10)
+            latencies.append((perf_counter() - start) * 1000)
+        latencies.sort()
+        results[f"{terms}_term"] = {"queries": len(latencies),
+                                    "mean_ms": statistics.fmean(latencies),
+                                    "p50_ms": latencies[len(latencies) // 2],
+                                    "p90_ms": latencies[int(len(latencies) * 0.9)],
+                                    "p99_ms": latencies[int(len(latencies) * 0.99)],
+                                    "zero_result_rate": zero_results / len(latencies)}
+    results["peak_rss_bytes"] = peak_rss_bytes()
+    return results
+
+
+def parse_tag_mix(tag_mix: str) -> dict:
+    """
+    :param tag_mix: Comma separated tag=share pairs, like 'p=0.7,b=0.2,h1=0.1'
+    """
+    return {tag.strip(): float(share) for tag, share in (_.split('=') for _ in tag_mix.split(','))}
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--tag-mix", type=str, default=','.join(f"{k}={v}" for k, v in DEFAULT_TAG_MIX.items()))
+    parser.add_argument("--queries", type=int, default=200, help="Queries per query length")
+    parser.add_argument("--seed", type=int, default=121)
+    parser.add_argument("--work-dir", type=str, default=None, help="Where to build the index (default: temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Keep the work directory afterwards")
+    parser.add_argument("--output", type=str, default="bench_results.json")
+    args = parser.parse_args()
+
+    work_dir = pathlib.Path(args.work_dir or tempfile.mkdtemp(prefix="crungy_bench_")).resolve()
+    work_dir.mkdir(parents=True, exist_ok=True)
+    corpus_dir = work_dir / "DEV"
+    tag_mix = parse_tag_mix(args.tag_mix)
+
+    try:
+        corpus = SyntheticCorpus(args.vocabulary, args.zipf, tag_mix, args.seed)
+        start = perf_counter()
+        corpus.write(corpus_dir, args.docs)
+        print(f"Generated {args.docs} synthetic pages in {perf_counter() - start:.3f}s")
+        corpus_bytes = sum(_.stat().st_size for _ in corpus_dir.rglob("*.json"))
+        queries = {terms: corpus.queries(args.queries, terms) for terms in QUERY_LENGTHS}
+
+        results = {
+            "timestamp": strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "corpus": {"docs": args.docs, "vocabulary": args.vocabulary, "zipf": args.zipf, "tag_mix": tag_mix,
+                       "seed": args.seed, "bytes": corpus_bytes},
+            "index": run_phase(index_phase, str(work_dir), str(corpus_dir)),
+            "merge": run_phase(merge_phase, str(work_dir)),
+            "query": run_phase(query_phase, str(work_dir), queries),
+        }
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf8') as output:
+        json.dump(results, output, indent=2)
+
+    print(f"\nIndexing: {results['index']['docs_per_second']:.1f} docs/s ({results['index']['seconds']:.3f}s)\n"
+          f"Merging:  {results['merge']['seconds']:.3f}s, {results['merge']['index_bytes']} index bytes\n"
+          + '\n'.join(f"Query {terms}: p50 {results['query'][f'{terms}_term']['p50_ms']:.3f}ms, "
+                      f"p99 {results['query'][f'{terms}_term']['p99_ms']:.3f}ms" for terms in QUERY_LENGTHS) +
+          f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
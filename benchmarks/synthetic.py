@@ -0,0 +1,92 @@
+# Generates a synthetic crawl in the same layout as the DEV corpus: one folder per domain, one JSON file per page with
+# "url", "content" and "encoding" keys. Word frequencies follow a Zipf distribution.
+# Run from the repository root: python -m benchmarks.synthetic OUT_DIR [--docs 2000] [--zipf 1.1]
+
+import json
+import pathlib
+import random
+
+from argparse import ArgumentParser
+from itertools import accumulate
+
+# Default share of text spans wrapped in each tag
+DEFAULT_TAG_MIX = {"p": 0.6, "div": 0.15, "b": 0.1, "h1": 0.03, "h2": 0.03, "h3": 0.02, "h4": 0.02, "h5": 0.02,
+                   "h6": 0.01, "a": 0.02}
+
+SYLLABLES = ["ka", "ro", "mi", "ne", "tu", "sa", "li", "po", "de", "va", "chi", "gor", "ben", "tal", "fen", "quo"]
+
+
+class SyntheticCorpus:
+    def __init__(self, vocabulary_size: int = 20000, zipf_skew: float = 1.1, tag_mix: dict = None, seed: int = 121):
+        """
+        :param vocabulary_size: Number of distinct words
+        :param zipf_skew: Exponent s of the Zipf distribution, word of rank r is drawn with weight 1 / r^s
+        :param tag_mix: Share of text spans wrapped in each tag, the title is always present
+        :param seed: Seed for the random generator, the same seed always gives the same corpus
+        """
+        self.random = random.Random(seed)
+        self.vocabulary = self.make_vocabulary(vocabulary_size)
+        self.cumulative_weights = list(accumulate(1 / rank ** zipf_skew for rank in range(1, vocabulary_size + 1)))
+        self.tag_mix = tag_mix or DEFAULT_TAG_MIX
+        self.tags = list(self.tag_mix)
+        self.tag_weights = list(accumulate(self.tag_mix.values()))
+
+    def make_vocabulary(self, size: int) -> [str]:
+        words = set()
+        while len(words) < size:
+            words.add(''.join(self.random.choices(SYLLABLES, k=self.random.randint(1, 4))))
+        words = sorted(words)
+        self.random.shuffle(words)
+        return words
+
+    def words(self, amount: int) -> [str]:
+        return self.random.choices(self.vocabulary, cum_weights=self.cumulative_weights, k=amount)
+
+    def page(self, min_words: int = 50, max_words: int = 1500) -> str:
+        title = ' '.join(self.words(self.random.randint(2, 8)))
+        spans = []
+        remaining = self.random.randint(min_words, max_words)
+        while remaining > 0:
+            span_length = min(remaining, self.random.randint(3, 60))
+            tag = self.random.choices(self.tags, cum_weights=self.tag_weights)[0]
+            spans.append(f"<{tag}>{' '.join(self.words(span_length))}</{tag}>")
+            remaining -= span_length
+        return (f"<!DOCTYPE html>\n<html><head><title>{title}</title></head>\n"
+                f"<body>\n" + '\n'.join(spans) + "\n</body></html>\n")
+
+    def write(self, out_dir: pathlib.Path, docs: int, domains: int = 10):
+        """
+        Write the corpus to disk in the DEV layout.
+        :param out_dir: Directory to create the domain folders in
+        :param docs: Number of pages
+        :param domains: Number of domain folders to spread the pages over
+        """
+        for doc in range(docs):
+            domain = f"www.synthetic{doc % domains}.ics.uci.edu"
+            folder = out_dir / domain
+            folder.mkdir(parents=True, exist_ok=True)
+            with (folder / f"{doc:08x}.json").open('w', encoding='utf8') as page_file:
+                json.dump({"url": f"https://{domain}/page/{doc}", "content": self.page(), "encoding": "utf-8"},
+                          page_file)
+
+    def queries(self, amount: int, terms: int) -> [str]:
+        """
+        Queries drawn from the same Zipf distribution as the pages, so common words show up as often as they would.
+        """
+        return [' '.join(self.words(terms)) for _ in range(amount)]
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("out_dir", type=str)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=121)
+    args = parser.parse_args()
+
+    SyntheticCorpus(args.vocabulary, args.zipf, seed=args.seed).write(pathlib.Path(args.out_dir), args.docs)
+
+
+if __name__ == '__main__':
+    main()
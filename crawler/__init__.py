@@ -1,18 +1,41 @@
+import os
+
+from pathlib import Path
+
 from utils import get_logger
+from utils.crawl_store import CrawlStoreWriter
+from utils.link_graph import LinkGraphWriter
 from crawler.frontier import Frontier
-from crawler.worker import Worker
+from crawler.worker import AsyncWorker, Worker
 
 class Crawler(object):
-    def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
+    def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=None):
         self.config = config
         self.logger = get_logger("CRAWLER")
         self.frontier = frontier_factory(config, restart)
         self.workers = list()
-        self.worker_factory = worker_factory
+        # Workers with an asyncio downloader if ASYNCCONNECTIONS asks for one
+        self.worker_factory = worker_factory or (AsyncWorker if config.async_connections > 0 else Worker)
+
+        # Every worker appends the pages it downloads to one shared crawl store
+        self.crawl_store = None
+        if config.crawl_store:
+            if restart and os.path.exists(config.crawl_store):
+                self.logger.info(f"Found crawl store {config.crawl_store}, deleting it.")
+                os.remove(config.crawl_store)
+            self.crawl_store = CrawlStoreWriter(Path(config.crawl_store))
+
+        # And the outlinks of every page to one shared link log
+        self.link_graph = None
+        if config.link_graph:
+            if restart and os.path.exists(config.link_graph):
+                self.logger.info(f"Found link log {config.link_graph}, deleting it.")
+                os.remove(config.link_graph)
+            self.link_graph = LinkGraphWriter(Path(config.link_graph))
 
     def start_async(self):
         self.workers = [
-            self.worker_factory(worker_id, self.config, self.frontier)
+            self.worker_factory(worker_id, self.config, self.frontier, self.crawl_store, self.link_graph)
             for worker_id in range(self.config.threads_count)]
         for worker in self.workers:
             worker.start()
@@ -24,3 +47,8 @@ class Crawler(object):
     def join(self):
         for worker in self.workers:
             worker.join()
+        self.frontier.close()
+        if self.crawl_store is not None:
+            self.crawl_store.close()
+        if self.link_graph is not None:
+            self.link_graph.close()
@@ -0,0 +1,63 @@
+# Checkpoint of the frontier, so a restart does not have to go through every URL in the save file.
+#
+#   MAGIC
+#   header   generation of the save log (u64), offset into the save log (u64), crc32 of the rest (u32),
+#            length of the URLs (u64), length of the seen filter (u64)
+#   URLs     waiting and in flight URLs, UTF-8, one per line
+#   filter   the frontier's seen URL filter, see utils.bloom.ScalableBloomFilter.to_bytes
+#
+# The checkpoint holds the frontier's state as of the offset into the generation of the log it was taken from, so a
+# restart loads it and replays only the log records after that offset.
+
+import os
+import zlib
+
+from struct import Struct
+
+from utils.bloom import ScalableBloomFilter
+
+MAGIC = b"CRNGCKP1"
+HEADER = Struct("<QQIQQ")
+
+
+def write_checkpoint(path, generation: int, offset: int, urls: [str], seen: bytes):
+    """
+    Write a checkpoint next to where it goes and swap it in with an atomic rename, so there is always either the old
+    or the new one.
+    :param path: Checkpoint file
+    :param generation: Generation of the save log, 0 for a save file that is not a log
+    :param offset: Offset into the save log the state is as of
+    :param urls: URLs waiting or in flight
+    :param seen: Serialized seen URL filter
+    """
+    url_bytes = '\n'.join(urls).encode('utf-8')
+    crc = zlib.crc32(seen, zlib.crc32(url_bytes))
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'wb') as checkpoint_file:
+        checkpoint_file.write(MAGIC + HEADER.pack(generation, offset, crc, len(url_bytes), len(seen)))
+        checkpoint_file.write(url_bytes)
+        checkpoint_file.write(seen)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temporary_path, path)
+
+
+def read_checkpoint(path):
+    """
+    :return: Generation and offset of the save log, the URLs and the seen URL filter, or None if there is no intact
+             checkpoint
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as checkpoint_file:
+        data = checkpoint_file.read()
+    if data[:len(MAGIC)] != MAGIC or len(data) < len(MAGIC) + HEADER.size:
+        return None
+    generation, offset, crc, url_length, seen_length = HEADER.unpack_from(data, len(MAGIC))
+    start = len(MAGIC) + HEADER.size
+    url_bytes = data[start:start + url_length]
+    seen = data[start + url_length:start + url_length + seen_length]
+    if len(seen) != seen_length or zlib.crc32(seen, zlib.crc32(url_bytes)) != crc:
+        return None
+    urls = url_bytes.decode('utf-8').split('\n') if url_bytes else []
+    return generation, offset, urls, ScalableBloomFilter.from_bytes(seen)
@@ -1,17 +1,109 @@
+import heapq
 import os
-import shelve
+import re
+import time
 
-from threading import Thread, RLock
+from threading import Thread, RLock, Condition
 from queue import Queue, Empty
+from urllib.parse import urlparse
 
 from utils import get_logger, get_urlhash, normalize
+from utils.bloom import ScalableBloomFilter
 from scraper import is_valid
+from crawler.checkpoint import read_checkpoint, write_checkpoint
+from crawler.frontier_store import LogStore, open_store
+
+# Host of an absolute URL, without going through all of urlparse for every URL added
+HOST_PATTERN = re.compile(r"[^:/?#]+://([^/?#]*)")
+
+
+class HostScheduler(object):
+    """
+    Pending URLs kept in one queue per host, with a heap of the time each host may be fetched from next, so the
+    politeness delay holds per host no matter how many workers there are. Workers crawl different hosts at once and
+    only wait when every host with pending URLs was fetched from too recently.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.condition = Condition()
+        self.queues = dict()
+        self.next_allowed = dict()
+        self.heap = list()
+        self.in_flight = set()
+        self.pending = 0
+
+    def __len__(self):
+        return self.pending
+
+    def add(self, url):
+        match = HOST_PATTERN.match(url)
+        host = match.group(1) if match else urlparse(url).netloc
+        with self.condition:
+            queue = self.queues.setdefault(host, list())
+            if not queue:
+                # The host was not waiting in the heap, so it goes in at whenever it may be fetched from again
+                heapq.heappush(self.heap, (self.next_allowed.get(host, 0.0), host))
+            queue.append(url)
+            self.pending += 1
+            self.condition.notify()
+
+    def get(self):
+        """
+        Block until some host may be fetched from, then hand out its next URL.
+        :return: The URL, or None once nothing is pending and no handed out URL can add more
+        """
+        with self.condition:
+            while True:
+                if self.heap:
+                    allowed, host = self.heap[0]
+                    wait = allowed - time.monotonic()
+                    if wait <= 0:
+                        heapq.heappop(self.heap)
+                        queue = self.queues[host]
+                        url = queue.pop()
+                        self.next_allowed[host] = time.monotonic() + self.delay
+                        if queue:
+                            heapq.heappush(self.heap, (self.next_allowed[host], host))
+                        else:
+                            del self.queues[host]
+                        self.pending -= 1
+                        self.in_flight.add(url)
+                        return url
+                    self.condition.wait(wait)
+                elif not self.in_flight:
+                    self.condition.notify_all()
+                    return None
+                else:
+                    # Whatever is being crawled may still add URLs
+                    self.condition.wait()
+
+    def done(self, url):
+        """
+        A URL handed out by get() has been crawled
+        """
+        with self.condition:
+            self.in_flight.discard(url)
+            self.condition.notify_all()
+
+    def snapshot(self):
+        """
+        :return: Every URL waiting or handed out but not done yet
+        """
+        with self.condition:
+            return [url for queue in self.queues.values() for url in queue] + list(self.in_flight)
+
 
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
+        self.lock = RLock()
+        self.to_be_downloaded = HostScheduler(self.config.time_delay)
+        # Every URL ever added, so known ones are turned away without hashing them or touching the save file
+        self.seen = ScalableBloomFilter(self.config.seen_error_rate)
+        self.checkpoint_file = f"{self.config.save_file}.checkpoint"
+        self.next_checkpoint = time.monotonic() + self.config.checkpoint_interval
         
         if not os.path.exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
@@ -23,14 +115,17 @@ class Frontier(object):
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
             os.remove(self.config.save_file)
+        if not os.path.exists(self.config.save_file) and os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
+        self.save = open_store(self.config.save_file, self.config.save_format)
         if restart:
             for url in self.config.seed_urls:
                 self.add_url(url)
         else:
-            # Set the frontier state with contents of save file.
-            self._parse_save_file()
+            # Set the frontier state from the checkpoint, or with contents of save file if there is no good one.
+            if not self._load_checkpoint():
+                self._parse_save_file()
             if not self.save:
                 for url in self.config.seed_urls:
                     self.add_url(url)
@@ -40,33 +135,107 @@ class Frontier(object):
         total_count = len(self.save)
         tbd_count = 0
         for url, completed in self.save.values():
+            self.seen.add(self._seen_key(url))
             if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
+                self.to_be_downloaded.add(url)
                 tbd_count += 1
         self.logger.info(
             f"Found {tbd_count} urls to be downloaded from {total_count} "
             f"total urls discovered.")
 
+    def _load_checkpoint(self):
+        """
+        Restore the URLs to be downloaded and the seen URL filter from the checkpoint, then replay the save log
+        records written after it. URLs are not checked with is_valid again, they were when they were added.
+        :return: False if there is no checkpoint that matches the save file
+        """
+        checkpoint = read_checkpoint(self.checkpoint_file)
+        if checkpoint is None:
+            return False
+        generation, offset, urls, seen = checkpoint
+
+        if isinstance(self.save, LogStore):
+            if generation != self.save.generation:
+                self.logger.info(f"Checkpoint {self.checkpoint_file} is from an older save log, not using it.")
+                return False
+            delta = list(self.save.frames_after(offset))
+        else:
+            # A shelve does not say what changed since the checkpoint, so its checkpoint is only written by close()
+            # and only good for the next start
+            os.remove(self.checkpoint_file)
+            if generation != 0:
+                return False
+            delta = []
+
+        pending = dict.fromkeys(urls)
+        for _, url, completed in delta:
+            seen.add(self._seen_key(url))
+            if completed:
+                pending.pop(url, None)
+            else:
+                pending[url] = None
+        self.seen = seen
+        for url in pending:
+            self.to_be_downloaded.add(url)
+        self.logger.info(
+            f"Found {len(pending)} urls to be downloaded in checkpoint {self.checkpoint_file}, "
+            f"replayed {len(delta)} save records written after it.")
+        return True
+
+    def checkpoint(self):
+        """
+        Write the URLs to be downloaded and the seen URL filter as of the current end of the save log
+        """
+        with self.lock:
+            generation, offset = self.save.position() if isinstance(self.save, LogStore) else (0, 0)
+            urls = self.to_be_downloaded.snapshot()
+            seen = self.seen.to_bytes()
+        write_checkpoint(self.checkpoint_file, generation, offset, urls, seen)
+
     def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
+        # Blocks until a host is past its politeness delay
+        return self.to_be_downloaded.get()
+
+    @staticmethod
+    def _seen_key(url):
+        # The scheme is not part of the URL hash either, so http and https are the same URL
+        return url.partition("://")[2] or url
 
     def add_url(self, url):
         url = normalize(url)
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
-            self.to_be_downloaded.append(url)
+        with self.lock:
+            # Most scraped links were seen before and stop at the filter, before hashing or a save file lookup. The
+            # filter's false positives (SEENERRORRATE of the new URLs) are dropped along with them.
+            if not self.seen.add(self._seen_key(url)):
+                return
+            urlhash = get_urlhash(url)
+            if urlhash not in self.save:
+                self.save[urlhash] = (url, False)
+                self.save.sync()
+                self.to_be_downloaded.add(url)
     
     def mark_url_complete(self, url):
         urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            # This should not happen.
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
+        with self.lock:
+            if urlhash not in self.save:
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
+
+            self.save[urlhash] = (url, True)
+            self.save.sync()
+            # Still under the lock, so a checkpoint never has a URL both completed and in flight
+            self.to_be_downloaded.done(url)
+
+            # Only a log save file can be replayed from a checkpoint onwards, a shelve one is only checkpointed by close
+            checkpoint_due = isinstance(self.save, LogStore) and self.config.checkpoint_interval > 0 and \
+                time.monotonic() >= self.next_checkpoint
+            if checkpoint_due:
+                self.next_checkpoint = time.monotonic() + self.config.checkpoint_interval
+        if checkpoint_due:
+            self.checkpoint()
 
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+    def close(self):
+        # Checkpoint, then write the last group commit of a log save file
+        self.checkpoint()
+        self.save.close()
@@ -0,0 +1,271 @@
+import os
+import shelve
+import threading
+import time
+import zlib
+
+from struct import Struct
+
+# Log layout: MAGIC, generation (u64), then one frame per write:
+#   crc32 of the rest of the frame (u32), key length (u16), url length (u16), completed (bool), key, url
+# The generation is new for every log written from scratch, including by compaction, so an offset into the log is only
+# good for the generation it was taken from.
+MAGIC = b"CRNGFRN2"
+HEADER = Struct("<Q")
+FRAME = Struct("<IHH?")
+
+
+def pack_frame(key: str, url: str, completed: bool) -> bytes:
+    key_bytes = key.encode('utf-8')
+    url_bytes = url.encode('utf-8')
+    body = FRAME.pack(0, len(key_bytes), len(url_bytes), completed)[4:] + key_bytes + url_bytes
+    return zlib.crc32(body).to_bytes(4, 'little') + body
+
+
+class LogStore(object):
+    """
+    Frontier save file kept as an append-only log instead of a shelve. It has the part of the shelve interface the
+    Frontier uses. Only the URLs still to be downloaded are held in memory. Completed entries are just a hash of their
+    key in a set, and their URL is read back from the log the few times it is asked for.
+
+    Writes are group committed: they collect in a buffer that is written and fsync'ed once batch_records writes are
+    waiting, or batch_ms after the first of them, whichever comes first. sync() only asks for that, so a crash loses at
+    most the last batch instead of every write paying for its own flush. When the log holds compact_ratio times more
+    records than there are entries, it is rewritten with just the latest value of every entry.
+
+    On open, the log is replayed and anything after the last intact frame (a write cut short by a crash) is dropped.
+    Readers that already know the state up to some offset of this generation, like a frontier checkpoint, can read
+    only the frames after it with frames_after.
+    """
+
+    def __init__(self, path, batch_records=1024, batch_ms=200, compact_ratio=4.0, min_compact_records=100000):
+        self.path = path
+        self.batch_records = batch_records
+        self.batch_ms = batch_ms
+        self.compact_ratio = compact_ratio
+        self.min_compact_records = min_compact_records
+        self.lock = threading.RLock()
+        self.uncompleted = dict()
+        self.completed = set()
+        self.buffer = bytearray()
+        self.pending = 0
+        self.first_pending = None
+        self.log_records = 0
+        self.generation = None
+
+        self._recover()
+        self.file = open(self.path, 'ab')
+        self.closed = False
+        self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+    @staticmethod
+    def new_generation():
+        return time.time_ns()
+
+    def _recover(self):
+        if not os.path.exists(self.path) or not os.path.getsize(self.path):
+            self.generation = self.new_generation()
+            with open(self.path, 'wb') as log_file:
+                log_file.write(MAGIC + HEADER.pack(self.generation))
+            return
+
+        with open(self.path, 'rb') as log_file:
+            data = log_file.read()
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not a frontier log, start with --restart or change SAVEFORMAT")
+        self.generation = HEADER.unpack_from(data, len(MAGIC))[0]
+
+        position = len(MAGIC) + HEADER.size
+        for key, url, completed, end in self._read_frames(data, position):
+            self._apply(key, url, completed)
+            self.log_records += 1
+            position = end
+
+        if position < len(data):
+            with open(self.path, 'r+b') as log_file:
+                log_file.truncate(position)
+
+    @staticmethod
+    def _read_frames(data, position):
+        """
+        :return: Generator of (key, url, completed, end offset) for the intact frames from position on
+        """
+        while position + FRAME.size <= len(data):
+            crc, key_length, url_length, completed = FRAME.unpack_from(data, position)
+            end = position + FRAME.size + key_length + url_length
+            if end > len(data) or zlib.crc32(data[position + 4:end]) != crc:
+                return
+            key_start = position + FRAME.size
+            yield data[key_start:key_start + key_length].decode('utf-8'), \
+                data[key_start + key_length:end].decode('utf-8'), completed, end
+            position = end
+
+    def _apply(self, key, url, completed):
+        if completed:
+            self.uncompleted.pop(key, None)
+            self.completed.add(hash(key))
+        else:
+            self.completed.discard(hash(key))
+            self.uncompleted[key] = url
+
+    def _completed_frames(self):
+        """
+        :return: Generator of (key, url) for every completed entry, read from the log
+        """
+        with self.lock:
+            self._flush()
+            with open(self.path, 'rb') as log_file:
+                data = log_file.read()
+            completed = set(self.completed)
+        # The key is a hash of the URL, so any completed frame of a key has the URL its latest one has
+        for key, url, frame_completed, _ in self._read_frames(data, len(MAGIC) + HEADER.size):
+            if frame_completed and hash(key) in completed:
+                completed.discard(hash(key))
+                yield key, url
+
+    def position(self):
+        """
+        Write out every waiting write.
+        :return: Generation of the log and the offset of its end, everything written so far is before it
+        """
+        with self.lock:
+            self._flush()
+            return self.generation, self.file.tell()
+
+    def frames_after(self, offset):
+        """
+        :param offset: Offset returned by position() for the current generation of the log
+        :return: Generator of (key, url, completed) for every write after the offset, in the order they were made
+        """
+        with self.lock:
+            self._flush()
+            with open(self.path, 'rb') as log_file:
+                log_file.seek(offset)
+                data = log_file.read()
+        for key, url, completed, _ in self._read_frames(data, 0):
+            yield key, url, completed
+
+    def __len__(self):
+        return len(self.uncompleted) + len(self.completed)
+
+    def __contains__(self, key):
+        return key in self.uncompleted or hash(key) in self.completed
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        url, completed = value
+        with self.lock:
+            self._apply(key, url, completed)
+            self.buffer += pack_frame(key, url, completed)
+            self.pending += 1
+            if self.first_pending is None:
+                self.first_pending = time.monotonic()
+            if self.pending >= self.batch_records:
+                self._flush()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __bool__(self):
+        return bool(self.uncompleted) or bool(self.completed)
+
+    def get(self, key, default=None):
+        url = self.uncompleted.get(key)
+        if url is not None:
+            return url, False
+        if hash(key) in self.completed:
+            for completed_key, url in self._completed_frames():
+                if completed_key == key:
+                    return url, True
+        return default
+
+    def keys(self):
+        return list(self.uncompleted) + [key for key, _ in self._completed_frames()]
+
+    def values(self):
+        """
+        :return: Generator of (url, completed) for every entry, the completed ones streamed from the log
+        """
+        for _, value in self.items():
+            yield value
+
+    def items(self):
+        """
+        :return: Generator of (key, (url, completed)) for every entry, the completed ones streamed from the log
+        """
+        for key, url in list(self.uncompleted.items()):
+            yield key, (url, False)
+        for key, url in self._completed_frames():
+            yield key, (url, True)
+
+    def sync(self):
+        # Group commit: only flush once the oldest waiting write has waited long enough
+        with self.lock:
+            if self.first_pending is not None and (time.monotonic() - self.first_pending) * 1000 >= self.batch_ms:
+                self._flush()
+
+    def _flush_loop(self):
+        while not self.closed:
+            time.sleep(self.batch_ms / 1000)
+            self.sync()
+
+    def _flush(self):
+        if self.closed or not self.pending:
+            return
+        self.file.write(self.buffer)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.log_records += self.pending
+        self.buffer = bytearray()
+        self.pending = 0
+        self.first_pending = None
+        if self.log_records >= self.min_compact_records and \
+                self.log_records > self.compact_ratio * len(self):
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrite the log with only the latest value of every entry, the completed ones copied over from the old log. The
+        new log is written next to the old one and swapped in with an atomic rename, so a crash in the middle leaves one
+        or the other.
+        """
+        with self.lock:
+            self._flush()
+            compact_path = f"{self.path}.compact"
+            generation = self.new_generation()
+            with open(compact_path, 'wb') as compact_file:
+                compact_file.write(MAGIC + HEADER.pack(generation))
+                for key, (url, completed) in self.items():
+                    compact_file.write(pack_frame(key, url, completed))
+                compact_file.flush()
+                os.fsync(compact_file.fileno())
+            self.file.close()
+            os.replace(compact_path, self.path)
+            self.file = open(self.path, 'ab')
+            self.log_records = len(self)
+            self.generation = generation
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.closed = True
+            self.file.close()
+
+
+def open_store(save_file, save_format="shelve"):
+    """
+    Open the frontier save file in the format picked by SAVEFORMAT in config.ini.
+    :param save_file: Path of the save file
+    :param save_format: "shelve" for a shelve that is synced on every write, "log" for a group committed LogStore
+    """
+    if save_format == "log":
+        return LogStore(save_file)
+    if save_format == "shelve":
+        return shelve.open(save_file)
+    raise ValueError(f"Unknown frontier save format {save_format}, use shelve or log")
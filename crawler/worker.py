@@ -1,16 +1,20 @@
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
 from threading import Thread
 
-from utils.download import download
+from utils.download import AsyncDownloader, download
 from utils import get_logger
 from scraper import scraper
-import time
 
 
 class Worker(Thread):
-    def __init__(self, worker_id, config, frontier):
+    def __init__(self, worker_id, config, frontier, crawl_store=None, link_graph=None):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier = frontier
+        self.crawl_store = crawl_store
+        self.link_graph = link_graph
         super().__init__(daemon=True)
         
     def run(self):
@@ -19,12 +23,59 @@ class Worker(Thread):
             if not tbd_url:
                 self.logger.info("Frontier is empty. Stopping Crawler.")
                 break
-            resp = download(tbd_url, self.config, self.logger)
-            self.logger.info(
-                f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
-            scraped_urls = scraper(tbd_url, resp)
-            for scraped_url in scraped_urls:
-                self.frontier.add_url(scraped_url)
+            try:
+                self.handle(tbd_url, download(tbd_url, self.config, self.logger))
+            except Exception as error:
+                # One broken page should not take the thread down, the frontier would wait on it forever
+                self.logger.error(f"Failed to crawl {tbd_url}: {error!r}")
+            # Politeness is enforced per host by the frontier, so there is no sleep here
             self.frontier.mark_url_complete(tbd_url)
-            time.sleep(self.config.time_delay)
+
+    def handle(self, tbd_url, resp):
+        self.logger.info(
+            f"Downloaded {tbd_url}, status <{resp.status}>, "
+            f"using cache {self.config.cache_server}.")
+        self.save_page(resp)
+        scraped_urls = scraper(tbd_url, resp, self.link_graph)
+        for scraped_url in scraped_urls:
+            self.frontier.add_url(scraped_url)
+
+    def save_page(self, resp):
+        # Only pages that actually came back are worth indexing
+        if self.crawl_store is None or resp.status != 200 or resp.raw_response is None:
+            return
+        raw = resp.raw_response
+        self.crawl_store.add(resp.url, resp.status, dict(getattr(raw, "headers", None) or {}),
+                             getattr(raw, "content", None) or b'', getattr(raw, "encoding", None) or 'utf-8')
+
+
+class AsyncWorker(Worker):
+    """
+    Crawler thread that keeps up to ASYNCCONNECTIONS requests to the cache server in flight through one
+    AsyncDownloader, instead of waiting on one request at a time. The event loop only moves bytes: waiting on the
+    frontier and handling pages block, so they run on a pool with a thread per connection.
+    """
+
+    def run(self):
+        asyncio.run(self.crawl())
+
+    async def crawl(self):
+        host, port = self.config.cache_server
+        connections = self.config.async_connections
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            async with AsyncDownloader(host, port, self.config.user_agent, connections) as downloader:
+                await asyncio.gather(*(self.crawl_loop(downloader, executor) for _ in range(connections)))
+        self.logger.info("Frontier is empty. Stopping Crawler.")
+
+    async def crawl_loop(self, downloader, executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            tbd_url = await loop.run_in_executor(executor, self.frontier.get_tbd_url)
+            if not tbd_url:
+                break
+            try:
+                resp = await downloader.fetch(tbd_url)
+                await loop.run_in_executor(executor, self.handle, tbd_url, resp)
+            except Exception as error:
+                self.logger.error(f"Failed to crawl {tbd_url}: {error!r}")
+            await loop.run_in_executor(executor, self.frontier.mark_url_complete, tbd_url)
@@ -2,24 +2,55 @@
 # Intended for UCI CS121: Information Retrieval project
 
 import json
+import os
 import pathlib
-import re
 import math
-import warnings
+import re
+import shutil
 
-from bs4 import BeautifulSoup
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from itertools import count
-from linecache import getline
-from nltk.stem import PorterStemmer
-from time import time
+from time import perf_counter, time
+
+from search import MAX_OPEN_PARTIALS, DocStore, DocStoreWriter, DuplicateIndex, HTMLExtractor, Lexicon, Manifest, \
+    MemoryIndex, PositionIndex, PositionsReader, PositionsWriter, PostingsReader, PostingsWriter, QueryCache, \
+    SegmentIndex, ShardedLexicon, Stemmer, convert_doc_id_file, convert_text_index, export_text, fingerprint, \
+    merge_entries, merge_positions, phrase_match, plan_shards, read_partial, read_positions_partial, reduce_partials, \
+    reduce_position_partials, tokenize, top_k
+from search.pagerank import STATIC_SCORES_NAME, load_static_scores, page_scores, write_static_scores
+from search.positions import SUFFIX as POSITIONS_SUFFIX
+from utils.crawl_store import CrawlStoreReader
+
+# Groups of files each indexing worker gets, see CrungySearchEngine.process_files
+GROUPS_PER_WORKER = 4
+
+# How much a page's static score (1 for the best ranked page of the link graph) counts next to its term scores
+STATIC_WEIGHT = 1.0
+
+# A quoted phrase in a query, optionally followed by ~slop for how many other words may come between its words
+PHRASE_PATTERN = re.compile(r'"([^"]*)"(?:~(\d+))?')
 
 
 class CrungySearchEngine:
-    def __init__(self):
+    def __init__(self, cache_bytes=64 * 2 ** 20, static_weight=STATIC_WEIGHT):
+        """
+        :param cache_bytes: Memory budget of the query cache (hot postings plus ranked results)
+        :param static_weight: Factor for the static scores of an index built with a link graph
+        """
         self.doc_id_path = None
         self.postings = None
-        self.stemmer = PorterStemmer()
+        self.positions = None
+        self.stemmer = Stemmer()
+        self.index_dir = pathlib.Path("final_indices")
+        self.partial_dir = pathlib.Path("partial_indices")
+        self.segment_dir = pathlib.Path("segments")
+        self.segments = None
+        self.lexicon = None
+        self.documents = None
+        self.static_weight = static_weight
+        self.static_scores = None
+        self.cache = QueryCache(cache_bytes)
 
     class TokenEntry:
         def __init__(self, line, source_doc=None):
@@ -36,186 +67,400 @@ class CrungySearchEngine:
         def get_postings(self):
             self.doc_score = {int(posting.split(": ")[0]): float(posting.split(": ")[1]) for posting in self.postings}
 
-    def process_files(self, path_to_index: pathlib.Path, doc_id_path: pathlib.Path, file_group_amount=1000):
+        @classmethod
+        def from_postings(cls, token, postings_list):
+            """
+            Create an entry from a binary PostingsList instead of a text line
+            """
+            entry = cls.__new__(cls)
+            entry.source_doc = None
+            entry.token = token
+            entry.postings = postings_list
+            entry.doc_score = dict(zip(*postings_list.decode()))
+            return entry
+
+    def process_files(self, path_to_index: pathlib.Path, doc_id_path: pathlib.Path, memory_budget=256 * 2 ** 20,
+                      workers=1, skip_duplicates=True, positions=False, link_graph: pathlib.Path = None):
         """
-        Process files within the given path and subdirectories.
+        Process files within the given path and subdirectories. Besides the partial indices, this writes the
+        document IDs and a document store next to them (see search.docstore).
+
+        Files are split into a few contiguous groups per worker, in sorted path order. Each group is indexed into a
+        search.memindex.MemoryIndex, which is written out as a partial index whenever it grows past the worker's share
+        of the memory budget, so memory use depends on the budget rather than on how big the pages are. Doc IDs come
+        from a file's position in the sorted order, so they are the same however many workers run.
+
+        Instead of a directory, path_to_index can be a packed crawl store (see utils.crawl_store). Its records are
+        read through a memory map, in the order they were written.
+
+        Workers also send back a fingerprint of every page (see search.simhash), and pages that are exact or near
+        duplicates of an earlier doc ID are recorded in duplicates.txt, so merge_final_indices folds them into that
+        doc ID by leaving their postings out.
+
+        With positions, every group also keeps where each term occurs in each page (see search.positions), flushed to
+        partial positions files next to the partial indices and within the same memory budget, so merge_final_indices
+        can write a positional side index for phrase queries.
+
+        With a link graph (see utils.link_graph), every page gets a static score from its PageRank and doc IDs are
+        handed out from the best ranked page down instead of in path order. The scores are saved as a flat array in
+        doc ID order, and as they only go down from one doc ID to the next, a query can stop going through postings
+        once the static scores left cannot change its top k (see search.topk).
         :param doc_id_path: Path to write document IDs to
-        :param path_to_index: Directory from which to create indices
-        :param file_group_amount: Number of files in each index before a merge
+        :param path_to_index: Directory or crawl store from which to create indices
+        :param memory_budget: Approximate bytes of postings all workers together hold before flushing a partial index
+        :param workers: Number of processes building partial indices at once
+        :param skip_duplicates: Whether to look for duplicate pages
+        :param positions: Whether to record term positions for phrase queries
+        :param link_graph: Packed link graph to order doc IDs by static rank with
         """
-        if not path_to_index.is_dir():
-            raise NotADirectoryError("Path to index given to CrungySearch is not a directory.")
-
         if not path_to_index.exists():
             raise NotADirectoryError("Path to index given to CrungySearch does not exist.")
 
+        if not path_to_index.is_dir() and not path_to_index.is_file():
+            raise NotADirectoryError("Path to index given to CrungySearch is not a directory or crawl store.")
+
         # Recreate document ID file for integrity
+        self.close_documents()
         doc_id_path.unlink() if doc_id_path.exists() else None
         doc_id_path.touch(exist_ok=True)
         self.doc_id_path = doc_id_path
-        doc_id_line_counter = 0
 
-        partial_token_dict = defaultdict(lambda: defaultdict(int))
-        group_counter = 0
-        partial_index_counter = 0
+        # A full rebuild replaces any incremental index built with update_index
+        self.close_index()
+        if self.segment_dir.is_dir():
+            print(f"\tRemoving the incremental index in \"{self.segment_dir}\"")
+            shutil.rmtree(self.segment_dir)
+
+        # Create a folder for partial indices if it doesn't exist, and clear out any left from an earlier run
+        self.partial_dir.mkdir() if not self.partial_dir.is_dir() else None
+        for old_partial in self.partial_dir.iterdir():
+            old_partial.unlink()
+
+        # Pages are files of a directory, or record offsets of a crawl store
+        if path_to_index.is_file():
+            store_path = str(path_to_index)
+            with CrawlStoreReader(path_to_index) as crawl_store:
+                files = list(crawl_store.offsets())
+        else:
+            store_path = None
+            files = [file for folder in sorted(path_to_index.iterdir()) if folder.is_dir()
+                     for file in sorted(folder.iterdir())]
+
+        # Best ranked pages first, pages with the same score stay in path order
+        static_scores = None
+        if link_graph is not None:
+            print(f"\tRanking {len(files)} pages by the link graph in \"{link_graph}\"...")
+            static_scores = page_scores(link_graph, self.page_urls(files, store_path))
+            order = sorted(range(len(files)), key=lambda _: -static_scores[_])
+            files = [files[_] for _ in order]
+            static_scores = [static_scores[_] for _ in order]
+
+        # A single process takes everything in one go, several get a few groups each so a slow group does not leave the
+        # others idle at the end
+        group_amount = workers * GROUPS_PER_WORKER if workers > 1 else 1
+        group_size = max(1, -(-len(files) // group_amount))
+        groups = [(group_number, first_doc_id, files[first_doc_id:first_doc_id + group_size],
+                   str(self.partial_dir), memory_budget // workers, store_path, positions)
+                  for group_number, first_doc_id in enumerate(range(0, len(files), group_size))]
 
         # Read files from the given directory and do something idk I started writing this comment two weeks ago
-        print("\tCreating partial indices... \n\t", end='')
-
-        # Ignore stinky warnings IKWID
-        warnings.filterwarnings("ignore", category=UserWarning, module='bs4', message='.*looks like a URL.*')
-        with doc_id_path.open('a') as doc_ids:
-            for folder in path_to_index.iterdir():
-                for file in folder.iterdir():
-                    # Get tokens from the file and store them in a temporary dict
-                    with file.open() as contents:
-                        file_json = json.load(contents)
-                        soup = BeautifulSoup(file_json["content"], 'html.parser')
-                        url = file_json["url"]
-
-                        # Record the doc ID
-                        doc_ids.write(f"{url}\n")
-
-                        for token in re.split(r"[^0-9A-Za-z']+", soup.getText()):
-                            key = self.stemmer.stem(token.replace('\'', ''))
-                            partial_token_dict[key][doc_id_line_counter] += 1
-
-                        for tag_power, tag in enumerate(['b', re.compile('^h[4-6]$'), re.compile('^h[1-3]$'), 'title']):
-                            for result in soup.findAll(tag):
-                                for token in re.split(r"[^0-9A-Za-z']+", str(result.string)):
-                                    key = self.stemmer.stem(token.replace('\'', ''))
-                                    partial_token_dict[key][doc_id_line_counter] += 2**(tag_power+1) - 1
+        print(f"\tCreating partial indices{f' with {workers} workers' if workers > 1 else ''}... \n\t", end='')
 
-                    doc_id_line_counter += 1
-                    group_counter += 1
-
-                    # Create a folder for partial indices if it doesn't exist
-                    pathlib.Path("partial_indices").mkdir() if not pathlib.Path("partial_indices").is_dir() else None
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_index_worker) if workers > 1 else None
+        try:
+            # Groups come back in order, so doc IDs can be recorded as they finish. Workers also send back the words
+            # they stemmed, so one stem table covering the whole corpus can be saved for the query path.
+            group_results = pool.map(index_group_worker, groups) if pool else \
+                ((self.index_group(*_), {}) for _ in groups)
+            # Duplicates are decided here in doc ID order, so the first copy of a page is the one that is kept
+            duplicates = DuplicateIndex()
+            with doc_id_path.open('a') as doc_ids, DocStoreWriter(doc_id_path) as doc_store:
+                for (group_number, first_doc_id, *_), ((documents, fingerprints), stems) in zip(groups, group_results):
+                    self.stemmer.update(stems)
+                    for url, title, doc_length, crawl_time in documents:
+                        doc_ids.write(f"{url}\n")
+                        doc_store.add(url, title, doc_length, crawl_time)
+                    if skip_duplicates:
+                        for doc_id, page_fingerprint in enumerate(fingerprints, start=first_doc_id):
+                            duplicates.check(*page_fingerprint, doc_id)
+                    print(group_number, end=', ')
+        finally:
+            pool.shutdown() if pool else None
+
+        self.index_dir.mkdir() if not self.index_dir.is_dir() else None
+        self.stemmer.save(self.index_dir / Stemmer.FILE_NAME)
+        duplicates.save(self.index_dir / DuplicateIndex.FILE_NAME)
+        # Static scores of an earlier build do not fit doc IDs in path order
+        if static_scores is not None:
+            write_static_scores(self.index_dir / STATIC_SCORES_NAME, static_scores)
+        else:
+            (self.index_dir / STATIC_SCORES_NAME).unlink(missing_ok=True)
+        print(f"\n\t...done, {sum(1 for _ in self.partial_dir.glob('*.txt'))} partial indices written, "
+              f"{len(duplicates.duplicates)} duplicate pages found")
 
-                    # Create a partial index after reaching the max for a group
-                    if group_counter >= file_group_amount:
-                        print(partial_index_counter, end=', ')
+    @staticmethod
+    def page_urls(files: list, store_path: str = None) -> [str]:
+        """
+        :param files: Files of pages, or record offsets in the crawl store
+        :param store_path: Crawl store the record offsets point into, if the pages come from one
+        :return: URL of every page
+        """
+        if store_path:
+            with CrawlStoreReader(pathlib.Path(store_path)) as crawl_store:
+                return [crawl_store.read(offset).url for offset in files]
+        urls = []
+        for file in files:
+            with file.open() as contents:
+                urls.append(json.load(contents)["url"])
+        return urls
+
+    def index_group(self, group_number: int, first_doc_id: int, files: [pathlib.Path], partial_dir: str,
+                    memory_budget: int, store_path: str = None, positions=False):
+        """
+        Index a group of files into as many partial indices as the memory budget calls for.
+        :param group_number: Number of the group, partial indices are named partial_index_{group}_{part}.txt and
+                             partial positions positions_{group}_{part}.pos
+        :param first_doc_id: Doc ID of the first file
+        :param files: Files of the group, or record offsets in the crawl store, in doc ID order
+        :param partial_dir: Directory to write the partial indices to
+        :param memory_budget: Approximate size the in-memory index may reach before it is flushed
+        :param store_path: Crawl store the record offsets point into, if the pages come from one
+        :param positions: Whether to also write partial positions
+        :return: (url, title, length, crawl time) and (checksum, SimHash) of each file, in doc ID order
+        """
+        memory_index = MemoryIndex()
+        position_index = PositionIndex() if positions else None
+        parts = count(0)
+        documents = []
+        fingerprints = []
+        crawl_store = CrawlStoreReader(pathlib.Path(store_path)) if store_path else None
+        try:
+            for doc_id, file in enumerate(files, start=first_doc_id):
+                if crawl_store is not None:
+                    record = crawl_store.read(file)
+                    documents.append(self.index_page(record.url, record.text(), record.crawl_time, doc_id,
+                                                     memory_index, fingerprints, position_index))
+                else:
+                    documents.append(self.index_document(file, doc_id, memory_index, fingerprints, position_index))
+                if memory_index.bytes + (position_index.bytes if position_index is not None else 0) >= memory_budget:
+                    self.flush_group(memory_index, position_index, pathlib.Path(partial_dir), group_number, next(parts))
+        finally:
+            crawl_store.close() if crawl_store is not None else None
 
-                        # Delete empty key, if it exists
-                        del partial_token_dict['']
+        if memory_index.docs:
+            self.flush_group(memory_index, position_index, pathlib.Path(partial_dir), group_number, next(parts))
+        return documents, fingerprints
 
-                        # Write the partial index to disk
-                        index_path = pathlib.Path(f"partial_indices/partial_index_{partial_index_counter}.txt")
-                        with index_path.open('w') as partial_index_file:
-                            for token in sorted(partial_token_dict.keys()):
-                                # This writes 'term - posting: occurrences, ...' on one line
-                                # Yes, it is scuffed
-                                partial_index_file.write(
-                                    f"{token} - " +
-                                    ', '.join(
-                                        [f"{k}: {v}" for k, v in sorted(partial_token_dict[token].items(),
-                                                                        key=lambda _: _[1],
-                                                                        reverse=True)]) +
-                                    "\n")
+    @staticmethod
+    def flush_group(memory_index: MemoryIndex, position_index: PositionIndex, partial_dir: pathlib.Path,
+                    group_number: int, part: int):
+        """
+        Write out and empty the in-memory index of a group, and its positions if it keeps them
+        """
+        memory_index.write(partial_dir / f"partial_index_{group_number}_{part}.txt")
+        memory_index.clear()
+        if position_index is not None:
+            position_index.write(partial_dir / f"positions_{group_number}_{part}{POSITIONS_SUFFIX}")
+            position_index.clear()
+
+    def index_document(self, file: pathlib.Path, doc_id: int, memory_index: MemoryIndex,
+                       fingerprints: list = None, position_index: PositionIndex = None) -> (str, str, int, float):
+        """
+        Index a crawled page saved as a JSON file, see index_page.
+        :param file: JSON file of the page
+        """
+        with file.open() as contents:
+            file_json = json.load(contents)
+        return self.index_page(file_json["url"], file_json["content"], file.stat().st_mtime, doc_id, memory_index,
+                               fingerprints, position_index)
 
-                        # Reset temporary variables and increase partial index count
-                        partial_token_dict = defaultdict(lambda: defaultdict(int))
-                        group_counter = 0
-                        partial_index_counter += 1
-        print("\n\t...done")
+    def index_page(self, url: str, content: str, crawl_time: float, doc_id: int, memory_index: MemoryIndex,
+                   fingerprints: list = None, position_index: PositionIndex = None) -> (str, str, int, float):
+        """
+        Count the (tag weighted) occurrences of every token in a crawled page. Every token counts once, plus the
+        weight of each b (1), h4-h6 (3), h1-h3 (7) and title (15) tag around it.
+        :param url: URL of the page
+        :param content: HTML of the page
+        :param crawl_time: When the page was crawled
+        :param doc_id: Doc ID of the page
+        :param memory_index: In-memory index to add the counts to
+        :param fingerprints: List to append the page's (checksum, SimHash) to, if any
+        :param position_index: In-memory positions to add where each token occurs to, if any
+        :return: URL, title, length in tokens and crawl time of the page
+        """
+        # Get tokens from the page and store them in a temporary dict
+        doc_length = 0
+        token_counts = defaultdict(int)
+        token_positions = defaultdict(list) if position_index is not None else None
+        page_tokens = []
+        extractor = HTMLExtractor()
+        for text, weight in extractor.extract(content):
+            tokens = tokenize(text)
+            for token in tokens:
+                stemmed_token = self.stemmer.stem(token)
+                token_counts[stemmed_token] += 1 + weight
+                if token_positions is not None:
+                    token_positions[stemmed_token].append(doc_length)
+                doc_length += 1
+            if fingerprints is not None:
+                page_tokens += tokens
+
+        # Delete empty key, if it exists
+        token_counts.pop('', None)
+        memory_index.add_document(doc_id, token_counts)
+        if token_positions is not None:
+            token_positions.pop('', None)
+            position_index.add_document(doc_id, token_positions)
+        if fingerprints is not None:
+            fingerprints.append(fingerprint(page_tokens))
+
+        return url, extractor.title, doc_length, crawl_time
+
+    def update_index(self, path_to_index: pathlib.Path, memory_budget=256 * 2 ** 20):
+        """
+        Bring the incremental index in segment_dir up to date with the given directory without a full rebuild. Files
+        that are new or changed since the last update are indexed into a new segment, the documents of changed and
+        deleted files are tombstoned, and segments are merged in the background as they pile up (see search.segments).
+        Once an incremental index exists, queries use it instead of the final indices.
+        :param path_to_index: Directory to index, laid out like for process_files
+        :param memory_budget: Approximate bytes of postings held before flushing a partial index of the new segment
+        """
+        if not path_to_index.is_dir():
+            raise NotADirectoryError("Path to index given to CrungySearch is not a directory.")
 
-    def merge_final_indices(self):
+        if self.segments is None:
+            self.close_index()
+            self.close_documents()
+            self.segments = SegmentIndex(self.segment_dir)
+
+        files = {str(file): file.stat().st_mtime for folder in sorted(path_to_index.iterdir()) if folder.is_dir()
+                 for file in sorted(folder.iterdir())}
+        changed, removed = self.segments.changes(files)
+        print(f"\t{len(changed)} new or changed files, {len(removed)} removed files")
+
+        builder = self.segments.builder(memory_budget)
+        for file in changed:
+            document = self.index_document(pathlib.Path(file), builder.next_doc_id(), builder.memory_index)
+            builder.add(file, files[file], document)
+        self.segments.commit(builder, removed)
+
+        self.index_dir.mkdir() if not self.index_dir.is_dir() else None
+        self.stemmer.save(self.index_dir / Stemmer.FILE_NAME)
+        self.lexicon = self.segments
+        self.documents = self.segments
+        print(f"\t...done, {len(self.segments.segments)} segments with {len(self.segments)} live documents")
+
+    def merge_final_indices(self, max_open_partials=MAX_OPEN_PARTIALS, workers=1, shard_amount=None):
         """
-        Merge the partial indices into final indices, sorted by first character
+        Merge the partial indices into final index shards. A sizing pass over the partials splits the term space into
+        contiguous ranges of about the same size (see search.shards), and every range is merged into its own shard with
+        its own lexicon, in parallel when there are several workers. The ranges are recorded in a manifest that the
+        query path uses to route terms to their shard. If process_files recorded positions, every shard also gets a
+        positions file next to it.
+        :param max_open_partials: Most partial indices open at once, more than that are merged in several passes
+        :param workers: Number of processes merging shards at once
+        :param shard_amount: Number of shards, by default one per TARGET_SHARD_BYTES of partial indices (at least one
+                             per worker)
         """
 
         if self.doc_id_path is None:
             print("Most likely, partial indices do not exist. Please create them!")
             return
 
-        # Count the number of docs FIXME: Pretty inefficient :(
-        doc_num = 0
-        with self.doc_id_path.open() as f:
-            for _ in f:
-                doc_num += 1
+        # Count the number of docs, duplicates are folded into the doc they duplicate
+        if self.documents is None:
+            self.load_documents()
+        duplicates = frozenset(DuplicateIndex.load_duplicates(self.index_dir / DuplicateIndex.FILE_NAME))
+        doc_num = len(self.documents) - len(duplicates)
 
         # Make a folder  for the final indices if it doesn't already exist
-        pathlib.Path("final_indices").mkdir() if not pathlib.Path("final_indices").is_dir() else None
-
-        partial_index_files = [_.open() for _ in pathlib.Path("partial_indices").iterdir()]
-        index_char = ''
-        final_index_file = None
-
-        # Get the first "entry" of each partial index, along with the fd number and the list of frequencies
+        self.index_dir.mkdir() if not self.index_dir.is_dir() else None
+
+        # Release and clear out the old shards, text or binary, along with their lexicons and manifest
+        self.close_index()
+        for pattern in ("final_index_*", "shard_*", "lexicon*.txt", Manifest.FILE_NAME):
+            for old_file in self.index_dir.glob(pattern):
+                old_file.unlink()
+
+        merge_start_time = perf_counter()
+        partials = reduce_partials([_ for _ in self.partial_dir.iterdir() if _.suffix == '.txt'], max_open_partials)
+        position_partials = [str(_) for _ in reduce_position_partials(
+            self.partial_dir.glob(f"*{POSITIONS_SUFFIX}"), max_open_partials)]
+        plan = plan_shards(partials, shard_amount, workers)
+        shards = [(shard_number, low, high, [(str(partial), start) for partial, start in starts], doc_num, duplicates,
+                   position_partials)
+                  for shard_number, ((low, high), starts) in enumerate(plan)]
+        print(f"\tMerging {len(shards)} shards{f' with {workers} workers' if workers > 1 else ''}...")
+
+        manifest = Manifest(self.index_dir / Manifest.FILE_NAME)
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_index_worker) if workers > 1 else None
         try:
-            entries = [self.TokenEntry(_.readline(), source_doc=_) for _ in partial_index_files]
-            for e in entries:
-                e.get_postings()
-
-            # While there are still more entries to add, find the highest lexicographical entry, merge the frequencies
-            # found, and add them to the final_index
-            while entries:
-                # Sort entries for easier processing
-                sorted_entries = sorted(entries, key=lambda _: _.token)
-
-                # List of files that will need to be pulled from at the end of this iteration
-                to_pull = [sorted_entries[0].source_doc]
-                pending_token = sorted_entries[0].token
-                pending_token_dict = defaultdict(float)
-                for url_id in sorted_entries[0].doc_score.keys():
-                    pending_token_dict[url_id] += sorted_entries[0].doc_score[url_id]
-
-                # Merge duplicate entries
-                last_valid_index = 1
-                for entry in sorted_entries[1:]:
-                    if entry.token > pending_token:
-                        break
-                    for url_id in entry.doc_score.keys():
-                        pending_token_dict[url_id] += entry.doc_score[url_id]
-                    to_pull.append(entry.source_doc)
-                    last_valid_index += 1
-
-                entries = [e for e in entries if e.token != pending_token]
-
-                # Ensure this is written to the correct sub-index
-                if index_char < pending_token[0]:
-                    final_index_file.close() if final_index_file is not None else None
-
-                    index_char = pending_token[0]
-                    final_path = pathlib.Path(f"final_indices/final_index_{index_char}.txt")
-                    try:
-                        final_index_file = open(final_path, "w")
-                        print(f"\tWriting {final_path.name}...")
-                    except IOError:
-                        print(f"\tCould not open new file {final_path.name}")
-                        return
-
-                # Update pending token dict with weights instead of counts
-                for k in pending_token_dict:
-                    pending_token_dict[k] = self.calculate_weight(int(pending_token_dict[k]),
-                                                                  len(pending_token_dict.keys()),
-                                                                  doc_num)
-
-                # Write to final index in same format as partial indices
-                final_index_file.write(
-                    f"{pending_token} - " +
-                    ', '.join(
-                        [f"{k}: {v:.3f}" for k, v in sorted(pending_token_dict.items(),
-                                                            key=lambda _: _[1],
-                                                            reverse=True)]) +
-                    "\n")
-
-                # Pull a new line from files used FIXME: lol this ain't the best solution
-                try:
-                    entries += [self.TokenEntry(_.readline(), source_doc=_) for _ in to_pull]
-                    for e in entries:
-                        e.get_postings()
-                except IndexError:
-                    pass
+            shard_results = pool.map(merge_shard_worker, shards) if pool else (self.merge_shard(*_) for _ in shards)
+            for shard in shard_results:
+                manifest.shards.append(shard)
+                terms = sum(_["terms"] for _ in manifest.shards)
+                print(f"\tWrote {shard['postings']} ({shard['terms']} terms, {shard['bytes']} bytes), "
+                      f"{terms / (perf_counter() - merge_start_time):.0f} terms/s so far")
         finally:
-            for f in partial_index_files:
-                f.close()
-            final_index_file.close() if final_index_file is not None else None
+            pool.shutdown() if pool else None
+        manifest.write()
+
+        merge_time = perf_counter() - merge_start_time
+        terms = sum(_["terms"] for _ in manifest.shards)
+        print(f"\tMerged {terms} terms in {merge_time:.3f}s ({terms / merge_time if merge_time else 0:.0f} terms/s)")
 
         # Delete partial indices once they are used
-        for partial_index in pathlib.Path("partial_indices").iterdir():
+        for partial_index in self.partial_dir.iterdir():
             partial_index.unlink(missing_ok=True)
 
+    def merge_shard(self, shard_number: int, low: str, high: str, partial_starts: [(str, int)], doc_num: int,
+                    skipped_docs: frozenset = frozenset(), position_partials: [str] = ()) -> dict:
+        """
+        Merge the terms in [low, high) of every partial index into one shard and its lexicon.
+        :param shard_number: Number of the shard to write
+        :param low: First term of the range, None for the start of the term space
+        :param high: First term after the range, None for the end of the term space
+        :param partial_starts: (partial index, byte offset at or before the range) pairs
+        :param doc_num: Total number of documents, for the weights
+        :param skipped_docs: Doc IDs to leave out, like duplicates
+        :param position_partials: Partial positions files, if positions were recorded
+        :return: The shard's manifest entry
+        """
+        shard_path = self.index_dir / f"shard_{shard_number:03}.bin"
+        lexicon = Lexicon(self.index_dir / f"lexicon_{shard_number:03}.txt")
+        positions_writer = PositionsWriter(shard_path.with_suffix(POSITIONS_SUFFIX)) if position_partials else None
+        # Positions hold exactly the terms and docs the partial indices do, so both streams are walked in step
+        term_positions = merge_positions([read_positions_partial(pathlib.Path(_), low, high)
+                                          for _ in position_partials]) if position_partials else None
+        try:
+            with PostingsWriter(shard_path) as final_index_file:
+                sources = [read_partial(pathlib.Path(partial), start, low, high) for partial, start in partial_starts]
+                for pending_token, postings in merge_entries(sources):
+                    doc_positions = None
+                    if term_positions is not None:
+                        positions_token, doc_positions = next(term_positions)
+                        if positions_token != pending_token:
+                            raise ValueError(f"Partial positions have \"{positions_token}\" where the partial "
+                                             f"indices have \"{pending_token}\"")
+                    if skipped_docs:
+                        postings = [posting for posting in postings if posting[0] not in skipped_docs]
+                        if not postings:
+                            continue
+                        if doc_positions is not None:
+                            doc_positions = [_ for _ in doc_positions if _[0] not in skipped_docs]
+                    # Write the postings to the binary shard with weights instead of counts, they are sorted by doc ID
+                    offset, length = final_index_file.add(
+                        [doc for doc, _ in postings],
+                        [self.calculate_weight(doc_count, len(postings), doc_num) for _, doc_count in postings])
+                    positions_offset = positions_writer.add([positions for _, positions in doc_positions]) \
+                        if positions_writer is not None else -1
+                    lexicon.add(pending_token, shard_path.name, offset, length, len(postings), positions_offset)
+        finally:
+            positions_writer.close() if positions_writer is not None else None
+        lexicon.write()
+        return {"low": low or '', "postings": shard_path.name, "lexicon": lexicon.path.name, "terms": len(lexicon),
+                "bytes": shard_path.stat().st_size}
+
     @staticmethod
     def calculate_weight(term_freq: int, doc_freq: int, total_docs: int) -> float:
         """
@@ -232,7 +477,233 @@ class CrungySearchEngine:
         idf = math.log(total_docs / doc_freq, 10)
         return tf_weight * idf
 
-    def process_query(self, query: str, num_to_retrieve: int):
+    def load_lexicon(self):
+        """
+        Load the lexicon of the final indices: the per-shard lexicons of the manifest if there is one, otherwise the
+        single lexicon of an older index, converting text shards from before the binary format if needed. If an
+        incremental index was built with update_index, that is opened instead.
+        """
+        stems_path = self.index_dir / Stemmer.FILE_NAME
+        if stems_path.exists():
+            self.stemmer.load(stems_path)
+
+        if (self.segment_dir / SegmentIndex.FILE_NAME).exists():
+            if self.segments is None:
+                self.segments = SegmentIndex(self.segment_dir)
+            self.lexicon = self.segments
+            return
+
+        manifest_path = self.index_dir / Manifest.FILE_NAME
+        lexicon_path = self.index_dir / Lexicon.FILE_NAME
+        if manifest_path.exists():
+            self.lexicon = ShardedLexicon(self.index_dir, Manifest.load(manifest_path))
+        elif lexicon_path.exists():
+            self.lexicon = Lexicon.load(lexicon_path)
+        else:
+            print("\tNo lexicon found, converting the final indices to the binary format...")
+            self.lexicon = convert_text_index(self.index_dir)
+        self.postings = PostingsReader(self.index_dir)
+        self.positions = PositionsReader(self.index_dir)
+        static_scores_path = self.index_dir / STATIC_SCORES_NAME
+        if static_scores_path.exists():
+            self.static_scores = load_static_scores(static_scores_path, self.static_weight)
+
+    def load_documents(self):
+        """
+        Open the document store, building one from the document ID file if it was written without one. With an
+        incremental index, its segments hold the documents.
+        """
+        if self.segments is None and (self.segment_dir / SegmentIndex.FILE_NAME).exists():
+            self.load_lexicon()
+        if self.segments is not None:
+            self.documents = self.segments
+            return
+        if not self.doc_id_path.with_suffix('.idx').exists():
+            print("\tNo document store found, building one from the document IDs...")
+            convert_doc_id_file(self.doc_id_path)
+        self.documents = DocStore(self.doc_id_path)
+
+    def close_documents(self):
+        if self.documents is not None and self.documents is not self.segments:
+            self.documents.close()
+        self.documents = None
+
+    def close_index(self):
+        """
+        Unmap the final index shards and empty the query cache. The shards are mapped again on the next query.
+        """
+        self.cache.clear()
+        if self.postings is not None:
+            self.postings.close()
+        if self.positions is not None:
+            self.positions.close()
+        if self.segments is not None:
+            if self.documents is self.segments:
+                self.documents = None
+            self.segments.close()
+        self.postings = None
+        self.positions = None
+        self.static_scores = None
+        self.segments = None
+        self.lexicon = None
+
+    def find_postings(self, stemmed_term: str):
+        """
+        Seek straight to a term's postings in its final index shard. Lists that fit the query cache are decoded whole
+        and cached, any other list is handed out lazy, so cursors only ever decode the blocks they land in.
+        :param stemmed_term: Term to find, already stemmed
+        :return: PostingsList of the term, or None if the term is not indexed
+        """
+        if self.lexicon is None:
+            self.load_lexicon()
+
+        postings = self.cache.get_postings(stemmed_term)
+        if postings is not None:
+            return postings
+
+        lexicon_entry = self.lexicon.get(stemmed_term)
+        if lexicon_entry is None:
+            return None
+        postings = self.postings.postings(lexicon_entry)
+        if self.cache.fits_postings(postings.loaded_nbytes()):
+            self.cache.put_postings(stemmed_term, postings.load())
+        return postings
+
+    def find_term(self, stemmed_term: str):
+        """
+        :param stemmed_term: Term to find, already stemmed
+        :return: TokenEntry with the term's fully decoded postings, or None if the term is not indexed
+        """
+        postings = self.find_postings(stemmed_term)
+        return self.TokenEntry.from_postings(stemmed_term, postings) if postings is not None else None
+
+    def has_positions(self, stemmed_term: str) -> bool:
+        """
+        :return: Whether the final indices hold the term's positions, the incremental index never does
+        """
+        if self.lexicon is None:
+            self.load_lexicon()
+        if self.segments is not None:
+            return False
+        lexicon_entry = self.lexicon.get(stemmed_term)
+        return lexicon_entry is not None and lexicon_entry.positions >= 0
+
+    def export_text_indices(self, out_dir: pathlib.Path):
+        """
+        Write the final indices out as 'token - doc: score, ...' text shards for debugging.
+        :param out_dir: Directory to write the text shards to
+        """
+        if self.lexicon is None:
+            self.load_lexicon()
+        export_text(self.index_dir, self.lexicon, out_dir)
+
+    def parse_query(self, query: str) -> [(str, str)]:
+        """
+        Split a query into terms and stem them, dropping repeated terms.
+        :param query: Raw query string
+        :return: (term as typed, stemmed term) pairs in query order
+        """
+        parsed_terms = []
+        seen = set()
+        # Words of a phrase are terms like any other, the ~slop after it is not
+        for term in tokenize(PHRASE_PATTERN.sub(r' \1 ', query)):
+            stemmed_term = self.stemmer.stem(term)
+            if stemmed_term not in seen:
+                seen.add(stemmed_term)
+                parsed_terms.append((term, stemmed_term))
+        return parsed_terms
+
+    def parse_phrases(self, query: str) -> [((str, ...), int)]:
+        """
+        Find the quoted phrases of a query. "a b c" matches the words right after each other, "a b c"~2 lets up to two
+        other words come between each word and the next.
+        :param query: Raw query string
+        :return: (stemmed terms in phrase order, slop) of every phrase of more than one word
+        """
+        phrases = []
+        for match in PHRASE_PATTERN.finditer(query):
+            phrase = tuple(self.stemmer.stem(term) for term in tokenize(match.group(1)))
+            if len(phrase) > 1:
+                phrases.append((phrase, int(match.group(2) or 0)))
+        return phrases
+
+    def search(self, query: str, k: int, conjunctive=True) -> [(int, float)]:
+        """
+        Find the k most relevant documents for a query.
+        :param query: Raw query string
+        :param k: Number of results to retrieve
+        :param conjunctive: Whether results must contain every term found in the index, or any of them
+        :return: Up to k (doc ID, score) pairs, best first
+        """
+        return self.retrieve([stemmed_term for _, stemmed_term in self.parse_query(query)], k, conjunctive,
+                             self.parse_phrases(query))
+
+    def retrieve(self, stemmed_terms: [str], k: int, conjunctive=True, phrases: [((str, ...), int)] = ()) \
+            -> [(int, float)]:
+        """
+        Rank documents for already stemmed terms, going through the result cache. Terms that are not indexed are
+        ignored, as in process_query. Final indices built with a link graph add every doc's static score.
+
+        Phrases make the query conjunctive, and a doc that contains every term is only kept once its positions show
+        every phrase (see phrase_filter). Without positions in the index, phrases are left out and only their words
+        count.
+        :param phrases: (stemmed terms, slop) of each phrase, see parse_phrases
+        :return: Up to k (doc ID, score) pairs, best first
+        """
+        if self.lexicon is None:
+            self.load_lexicon()
+
+        phrases = tuple(phrases)
+        key = self.cache.query_key(stemmed_terms, conjunctive or bool(phrases))
+        if phrases:
+            key += (phrases,)
+        if self.segments is not None:
+            # Results of an incremental index change with every update and merge
+            key += (self.segments.generation,)
+        results = self.cache.get_results(key, k)
+        if results is None:
+            if self.segments is not None:
+                results = self.segments.top_k(key[0], k, key[1])
+            elif phrases and any(term not in self.lexicon for phrase, _ in phrases for term in phrase):
+                # A phrase with a word that is not indexed is nowhere
+                results = []
+            else:
+                postings = [self.find_postings(_) for _ in key[0]]
+                terms = [term for term, term_postings in zip(key[0], postings) if term_postings is not None]
+                accept = self.phrase_filter(terms, phrases) if phrases else None
+                results = top_k([_ for _ in postings if _ is not None], k, key[1], accept=accept,
+                                static_scores=self.static_scores)
+            self.cache.put_results(key, k, results)
+        return results
+
+    def phrase_filter(self, stemmed_terms: [str], phrases: [((str, ...), int)]):
+        """
+        Build the positional check top_k runs on docs that contain every term. Positions are only read for those docs,
+        from the block and place the term's cursor is already on, so a phrase costs little over a plain AND query.
+        :param stemmed_terms: Terms in the order their cursors are passed to top_k
+        :param phrases: (stemmed terms, slop) of each phrase
+        :return: accept(doc, cursors), or None if the index has no positions for some phrase term
+        """
+        positions = {}
+        for term in {term for phrase, _ in phrases for term in phrase}:
+            positions[term] = self.positions.positions(self.lexicon.get(term))
+            if positions[term] is None:
+                return None
+        term_number = {term: number for number, term in enumerate(stemmed_terms)}
+
+        def accept(doc: int, cursors) -> bool:
+            for phrase, slop in phrases:
+                term_positions = []
+                for term in phrase:
+                    cursor = cursors[term_number[term]]
+                    term_positions.append(positions[term].doc_positions(cursor.block, cursor.position))
+                if not phrase_match(term_positions, slop):
+                    return False
+            return True
+
+        return accept
+
+    def process_query(self, query: str, num_to_retrieve: int, conjunctive=True):
         query_start_time = time()
 
         # Handle blank queries
@@ -240,85 +711,47 @@ class CrungySearchEngine:
             print(f"Your query was empty! (found in {time() - query_start_time:.3f}s)")
             return
 
-        # Split query into terms
-        query_terms = [term.replace('\'', '') for term in re.split(r"[^0-9A-Za-z']+", query)]
-        search_results = []
-
-        # Search final indices for the query
-        for term in query_terms:
-            stemmed_term = self.stemmer.stem(term.strip().lower().replace('\'', ''))
-            index_char = stemmed_term[0]
-            index_path = pathlib.Path(f"final_indices/final_index_{index_char}.txt")
-
-            # Open the relevant index and read each line for the entry in question
-            with open(index_path, "r") as index_file:
-                term_in_index = False
-                for line in index_file:
-                    entry = self.TokenEntry(line)
-                    if entry.token == stemmed_term:
-                        entry.get_postings()
-                        search_results.append(entry)
-                        term_in_index = True
-                        break
-
-            if not term_in_index:
-                print(f"No documents contain the term \"{term}\"")
-
-        # Print the results of the search
-        if search_results:
-
-            document_results, num_results = self.and_results(search_results)
-
-            if num_results == 0:
-                print(f"Your query has no results (found in {time() - query_start_time:.3f}s)")
+        # Check that each term of the query is in the final indices
+        if self.lexicon is None:
+            self.load_lexicon()
+        stemmed_terms = []
+        for term, stemmed_term in self.parse_query(query):
+            if stemmed_term in self.lexicon:
+                stemmed_terms.append(stemmed_term)
             else:
+                print(f"No documents contain the term \"{term}\"")
+        phrases = self.parse_phrases(query)
+        if phrases and not all(self.has_positions(term) for phrase, _ in phrases for term in phrase
+                               if term in self.lexicon):
+            print("\tThe index has no word positions, so phrases only match their words. Turn on --positions and "
+                  "rebuild the indices for phrase search.")
+            phrases = []
+
+        if self.documents is None:
+            self.load_documents()
+
+        # Only the results up to the current page are retrieved, so each new page re-runs the query with a larger k.
+        # One extra result is asked for to know whether there is another page.
+        page = 0
+        while True:
+            results = self.retrieve(stemmed_terms, num_to_retrieve * (page + 1) + 1, conjunctive, phrases)
+            if page == 0:
+                if not results:
+                    print(f"Your query has no results (found in {time() - query_start_time:.3f}s)")
+                    return
                 print(f"\tFound in {time() - query_start_time:.3f}s")
-                page_count = 0
-                # Iterate through results in pages (while whole document_results can be generated)
-                for i in range(num_results // num_to_retrieve):
-                    # Iterate through docs on page and print them to console
-                    page = [next(document_results) for _ in range(num_to_retrieve)]
-                    for doc in page:
-                        doc_name = getline(self.doc_id_path.name, doc[0] + 1)
-                        print(f"{page_count + 1}. {doc_name} \t(Score: {doc[1]:.3f})")
-                        page_count += 1
-                    print(f"Showing results {result_display_num * i + 1} - {result_display_num * (i + 1)} "
-                          f"of {num_results} results")
-
-                    # Query the user for more pages
-                    stop_query = False
-                    for _ in count(0):
-                        print_more_pages = input(f"Show the next {result_display_num} pages? y/n: ").strip().lower()
-                        if print_more_pages == 'y':
-                            # Proceed for non-final pages
-                            if num_results - result_display_num * (i + 1) >= result_display_num:
-                                break
-
-                            # Special case for the final page
-                            page = tuple(document_results)
-                            for doc in page:
-                                doc_name = getline(self.doc_id_path.name, doc[0] + 1)
-                                print(f"{page_count + 1}. {doc_name} \t(Score: {doc[1]:.3f})")
-                                page_count += 1
-                            print(
-                                f"Showing {result_display_num * (i + 1) + 1} - {num_results} of {num_results} results")
-                        else:
-                            stop_query = True
-                        break
-                    if stop_query:
-                        break
-
-                # Special case for only one page of results
-                if num_results // num_to_retrieve == 0:
-                    page = tuple(document_results)
-                    for doc in page:
-                        doc_name = getline(self.doc_id_path.name, doc[0] + 1)
-                        print(f"{page_count + 1}. {doc_name} \t(Score: {doc[1]:.3f})")
-                        page_count += 1
-                    print(f"Showing {1 if num_results else 0} - {num_results} of {num_results} results")
 
-        else:
-            print(f"Your query has no results (found in {time() - query_start_time:.3f}s)")
+            page_results = results[num_to_retrieve * page:num_to_retrieve * (page + 1)]
+            for rank, (doc_id, score) in enumerate(page_results, start=num_to_retrieve * page + 1):
+                print(f"{rank}. {self.documents.url(doc_id)} \t(Score: {score:.3f})")
+            print(f"Showing results {num_to_retrieve * page + 1} - {num_to_retrieve * page + len(page_results)}")
+
+            # Query the user for more pages
+            if len(results) <= num_to_retrieve * (page + 1):
+                break
+            if input(f"Show the next {num_to_retrieve} results? y/n: ").strip().lower() != 'y':
+                break
+            page += 1
 
     @staticmethod
     def result_generator(matches: [dict]) -> [dict]:
@@ -356,6 +789,25 @@ class CrungySearchEngine:
         return self.result_generator(matched_docs), len(matched_docs)
 
 
+# Engine of a process_files or merge_final_indices worker process, created once per process by init_index_worker
+index_worker_engine = None
+
+
+def init_index_worker():
+    global index_worker_engine
+    index_worker_engine = CrungySearchEngine(cache_bytes=0)
+    # Index workers hand the stems they worked out to the main process after every group
+    index_worker_engine.stemmer = Stemmer(track_new=True)
+
+
+def index_group_worker(group):
+    return index_worker_engine.index_group(*group), index_worker_engine.stemmer.drain()
+
+
+def merge_shard_worker(shard):
+    return index_worker_engine.merge_shard(*shard)
+
+
 if __name__ == '__main__':
     engine = CrungySearchEngine()
 
@@ -372,6 +824,10 @@ if __name__ == '__main__':
 
     # Main loop
     result_display_num = 5
+    index_workers = os.cpu_count() or 1
+    index_memory_mb = 256
+    index_positions = False
+    link_graph_path = None
     print(f"\n\n"
           f"Welcome to CrungySearch, the crungiest of search engines!\n"
           f"Enter your search query to find the {result_display_num} most relevant results.\n"
@@ -380,10 +836,19 @@ if __name__ == '__main__':
         user_query = input("Search for: ").strip().lower()
         if user_query == "--h":
             print("CrungySearch commands:\n\n"
-                  "\t--setdir\tSet a new directory to build indices from (default ~/DEV)\n\n"
+                  "\t--setdir\tSet a new directory or crawl store to build indices from (default ~/DEV)\n"
+                  "\t--workers\tSet the number of processes building and merging indices (default: one per CPU)\n"
+                  "\t--membudget\tSet the memory (MB) partial indexing may use before flushing (default 256)\n"
+                  "\t--positions\tToggles recording word positions for phrase queries on rebuilds (default off)\n"
+                  "\t--linkgraph\tSet a packed link graph to order documents by PageRank on rebuilds (default none)\n\n"
                   "\t--rpi   \tRebuilds only partial indices.\n"
                   "\t--rfi   \tRebuilds only final indices. Assumes partial indices exist.\n"
-                  "\t--ri    \tRebuilds first partial and then final indices.\n\n"
+                  "\t--ri    \tRebuilds first partial and then final indices.\n"
+                  "\t--update\tIndexes only new, changed or removed files into the incremental index.\n"
+                  "\t--dump  \tExports the final indices as text to \"final_indices_text\" for debugging.\n\n"
+                  "\t--or <query>\tFinds results containing any of the terms instead of all of them.\n"
+                  "\t\"<words>\"\tFinds the words as a phrase, \"<words>\"~n allows n other words between them.\n\n"
+                  "\t--cache \tShows query cache statistics.\n"
                   "\t--h     \tShows CrungySearch commands.\n"
                   "\t--q     \tQuits CrungySearch.\n\n")
 
@@ -401,9 +866,35 @@ if __name__ == '__main__':
                 user_input = input("Please specify a new path to create indices from: ").strip()
                 dir_path = pathlib.Path(user_input)
 
+        elif user_query == "--workers":
+            user_input = input("Please specify the number of indexing workers: ").strip()
+            while not user_input.isdigit() or int(user_input) < 1:
+                print("Invalid number of workers")
+                user_input = input("Please specify the number of indexing workers: ").strip()
+            index_workers = int(user_input)
+
+        elif user_query == "--membudget":
+            user_input = input("Please specify the indexing memory budget in MB: ").strip()
+            while not user_input.isdigit() or int(user_input) < 1:
+                print("Invalid memory budget")
+                user_input = input("Please specify the indexing memory budget in MB: ").strip()
+            index_memory_mb = int(user_input)
+
+        elif user_query == "--positions":
+            index_positions = not index_positions
+            print(f"\tWord positions will {'' if index_positions else 'not '}be recorded on the next rebuild")
+
+        elif user_query == "--linkgraph":
+            user_input = input("Please specify a packed link graph, or nothing for none: ").strip()
+            while user_input and not pathlib.Path(user_input).is_file():
+                print("Invalid path")
+                user_input = input("Please specify a packed link graph, or nothing for none: ").strip()
+            link_graph_path = pathlib.Path(user_input) if user_input else None
+
         elif user_query == "--rpi":
             partial_indexing_start_time = time()
-            engine.process_files(dir_path, doc_id_file)
+            engine.process_files(dir_path, doc_id_file, memory_budget=index_memory_mb * 2 ** 20, workers=index_workers,
+                                 positions=index_positions, link_graph=link_graph_path)
             print(f"\tPartial indexing executed in "
                   f"{int((time() - partial_indexing_start_time) // 60)}m "
                   f"{(time() - partial_indexing_start_time) % 60:.3f}s\n"
@@ -411,25 +902,47 @@ if __name__ == '__main__':
 
         elif user_query == "--rfi":
             final_indexing_start_time = time()
-            engine.merge_final_indices()
+            engine.merge_final_indices(workers=index_workers)
             print(f"\tIndex merging executed in "
                   f"{int((time() - final_indexing_start_time) // 60)}m "
                   f"{(time() - final_indexing_start_time) % 60:.3f}s")
 
         elif user_query == "--ri":
             partial_indexing_start_time = time()
-            engine.process_files(dir_path, doc_id_file)
+            engine.process_files(dir_path, doc_id_file, memory_budget=index_memory_mb * 2 ** 20, workers=index_workers,
+                                 positions=index_positions, link_graph=link_graph_path)
             print(f"\tPartial indexing executed in "
                   f"{int((time() - partial_indexing_start_time) // 60)}m "
                   f"{(time() - partial_indexing_start_time) % 60:.3f}s\n"
                   f"\tDocument IDs were written to \"{doc_id_file.name}\"")
 
             final_indexing_start_time = time()
-            engine.merge_final_indices()
+            engine.merge_final_indices(workers=index_workers)
             print(f"\tIndex merging executed in "
                   f"{int((time() - final_indexing_start_time) // 60)}m "
                   f"{(time() - final_indexing_start_time) % 60:.3f}s")
 
+        elif user_query == "--update":
+            update_start_time = time()
+            engine.update_index(dir_path, memory_budget=index_memory_mb * 2 ** 20)
+            print(f"\tIncremental update executed in "
+                  f"{int((time() - update_start_time) // 60)}m "
+                  f"{(time() - update_start_time) % 60:.3f}s")
+
+        elif user_query == "--cache":
+            for level, level_stats in engine.cache.stats().items():
+                print(f"\t{level}: " + ', '.join(f"{k} {v}" for k, v in level_stats.items()))
+
+        elif user_query == "--dump":
+            dump_start_time = time()
+            engine.export_text_indices(pathlib.Path("final_indices_text"))
+            print(f"\tText indices exported in {time() - dump_start_time:.3f}s")
+
+        elif user_query.startswith("--or "):
+            user_query = user_query[len("--or "):].strip()
+            engine.process_query(user_query, result_display_num, conjunctive=False)
+            print(f"Search for any of \"{user_query}\" complete!\n")
+
         else:
             engine.process_query(user_query, result_display_num)
             if user_query:
@@ -1,10 +1,11 @@
 # Script by Sage Mahmud (#11686625) for Prof. Lopes' Information Retrieval class
 
-import re
 import sys
 from collections import defaultdict
 from pathlib import Path
 
+from search.tokenizer import tokenize
+
 
 class Tokenizer:
 
@@ -15,8 +16,8 @@ class Tokenizer:
 
     def tokenize(self) -> [str]:
         """
-        Reads a text file and returns a list of the tokens in that file. A token is a sequence of alphanumeric
-        characters, independent of capitalization.
+        Reads a text file and returns a list of the tokens in that file. A token is a sequence of at least three
+        alphanumeric characters, independent of capitalization, split the same way as the search engine does.
 
         This function is polynomial in worst-case runtime (nested loops).
 
@@ -24,8 +25,7 @@ class Tokenizer:
         """
         with self.corpus.open('r', encoding="utf8") as text:
             for line in text:
-                for token in re.compile(r"[a-zA-Z0-9']{3,}").findall(line):
-                    self.tokens.append(token.lower())
+                self.tokens.extend(tokenize(line, min_length=3))
 
         return self.tokens
 
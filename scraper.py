@@ -1,14 +1,24 @@
 import re
-from urllib.parse import urlparse
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+
+from search.simhash import DuplicateIndex, fingerprint
+from search.tokenizer import tokenize
+from utils.bloom import ScalableBloomFilter
 
-LINKS_EXPLORED = set()
-BAD_LINKS = set()
+# Pages crawled so far, as Bloom filters so they stay a few bytes per URL however long the crawl runs
+LINKS_EXPLORED = ScalableBloomFilter()
+BAD_LINKS = ScalableBloomFilter()
 
+# Fingerprints of the pages crawled so far, pages that (nearly) match one of them are not followed
+DUPLICATES = DuplicateIndex()
 
-def scraper(url, resp):
+
+def scraper(url, resp, link_graph=None):
     links = extract_next_links(url, resp)
+    # Every outlink goes in the link graph, also the ones not worth crawling again
+    if link_graph is not None and links:
+        link_graph.add(resp.url, links)
     valid_links = [link for link in links if is_valid(link)]
     print("Finished processing,", len(LINKS_EXPLORED), "valid links,", len(BAD_LINKS), "bad links")
     print()
@@ -42,6 +52,13 @@ def extract_next_links(url, resp):
     if valid_page:
         LINKS_EXPLORED.add(resp.url)
         soup = BeautifulSoup(resp.raw_response.content, 'html.parser')
+
+        # Calendar views, mirrors and the like only lead to more of themselves
+        original = DUPLICATES.check(*fingerprint(tokenize(soup.get_text(" "))), resp.url)
+        if original is not None:
+            print(resp.url + " - duplicate of " + original)
+            return links
+
         for l in soup.find_all('a', href=True):
             link = str(urljoin(resp.url, l['href'])).split("#")[0].split("?")[0]
             if link not in links_in:
@@ -53,70 +70,75 @@ def extract_next_links(url, resp):
     return links
 
 
+# Rules of is_valid, compiled once. URLs are split with the RFC 3986 regex instead of urlparse, and paths are
+# lowercased before any of these run.
+URL_PATTERN = re.compile(r"(?:([^:/?#]+):)?(?://([^/?#]*))?([^?#]*)")
+TRAP_PATTERN = re.compile(r"share=facebook|share=twitter|replytocom|/ml/machine-learning-databases|anyconnect|"
+                          r"stayconnected")
+DOMAIN_PATTERN = re.compile(
+    r".*\.ics\.uci\.edu|"
+    r".*\.cs\.uci\.edu|"
+    r".*\.informatics\.uci\.edu|"
+    r".*\.stat\.uci\.edu|"
+    r"today\.uci\.edu/department/information_computer_sciences")
+EXTENSION_PATTERN = re.compile(
+    r"\.(css|js|bmp|gif|jpe?g|ico|png|tiff?|mid|mp[2-4]|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf|ps|eps|"
+    r"tex|pptx?|docx?|xlsx?|names|data?|exe|bz2|tar|msi|bin|7z|psd|dmg|iso|epub|dll|cnf|tgz|sha1|thmx|mso|"
+    r"arff|rtf|jar|csv|rm|smil|wmv|swf|wma|zip|rar|gz)$")
+SCHEMES = {"http", "https"}
+
+# Most path segments (counting the empty one before the first /) a URL may have
+MAX_PATH_SEGMENTS = 7
+
+
 def is_valid(url: str) -> bool:
     """
-    Decide whether to crawl this url or not.
+    Decide whether to crawl this url or not. The url is split and its path lowercased once, then it goes through the
+    rules from cheapest to most expensive and is turned down by the first one it breaks.
     
     :param url: The url to analyse, as a string
     :return: True to crawl this url, False otherwise
     """
     try:
-        parsed = urlparse(url)
-
-        # Check if we've seen this site
-        if url in LINKS_EXPLORED or url in BAD_LINKS:
-            return False
-
-        # Troublesome sites are bad >:(
-        if "share=facebook" in parsed.path.lower() or \
-                "share=twitter" in parsed.path.lower() or \
-                "replytocom" in parsed.path.lower() or \
-                "/ml/machine-learning-databases" in parsed.path.lower() or \
-                "anyconnect" in parsed.path.lower() or \
-                "stayconnected" in parsed.path.lower():
-            return False
+        scheme, netloc, path = URL_PATTERN.match(url).groups()
+        # Like urlparse, parameters of the last segment are not part of the path
+        params = path.find(';', max(path.rfind('/'), 0))
+        path = (path[:params] if params >= 0 else path).lower()
 
         # Ensure the url has the correct scheme
-        if parsed.scheme not in {"http", "https"}:
+        if scheme is None or scheme.lower() not in SCHEMES:
             return False
 
         # Check if this url is within our domains
-        if not re.match(
-                r".*\.ics\.uci\.edu|"
-                r".*\.cs\.uci\.edu|"
-                r".*\.informatics\.uci\.edu|"
-                r".*\.stat\.uci\.edu|"
-                r"today\.uci\.edu/department/information_computer_sciences",
-                parsed.netloc):
+        if not DOMAIN_PATTERN.match(netloc or ''):
+            return False
+
+        # Troublesome sites are bad >:(
+        if TRAP_PATTERN.search(path):
             return False
 
         # Check if the path of this url is something we can read
-        if re.match(
-                r".*\.(css|js|bmp|gif|jpe?g|ico|png|tiff?|mid|mp[2-4]|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf|ps|eps|"
-                r"tex|pptx?|docx?|xlsx?|names|data?|exe|bz2|tar|msi|bin|7z|psd|dmg|iso|epub|dll|cnf|tgz|sha1|thmx|mso|"
-                r"arff|rtf|jar|csv|rm|smil|wmv|swf|wma|zip|rar|gz)$",
-                parsed.path.lower()):
+        if EXTENSION_PATTERN.search(path):
             return False
 
-        clean_path = parsed.path.lower().split("/")
-        if len(clean_path) >= 8:  #if more than 8 nested folders in path
+        # Too deeply nested, or the same folder twice, which is usually a trap repeating itself
+        clean_path = path.split("/")
+        if len(clean_path) > MAX_PATH_SEGMENTS or len(set(clean_path)) != len(clean_path):
             return False
 
-        path_seen = set()
-        for p in clean_path:  #check for duplicate folders in path
-            if p in path_seen:
-                return False
-            path_seen.add(p)
+        # Check if we've seen this site
+        if url in LINKS_EXPLORED or url in BAD_LINKS:
+            return False
 
         '''#check for duplicate file, limited to main domains
         if parsed.netloc in ["www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu", "www.stat.uci.edu"]:
             if len(clean_path) > 0 and parsed.netloc + "/" + clean_path[-1] in TRASH:
                 return False'''
 
-        # Check if this site is similar to the current one
+        # Pages too similar to one already crawled are caught by their content in extract_next_links
 
         return True
 
     except TypeError:
-        print("TypeError for ", parsed)
+        print("TypeError for ", url)
         raise
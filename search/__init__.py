@@ -0,0 +1,16 @@
+from search.lexicon import Lexicon, LexiconEntry
+from search.docstore import DocRecord, DocStore, DocStoreWriter, convert_doc_id_file
+from search.postings import PostingsCursor, PostingsList, PostingsReader, PostingsWriter, convert_text_index, \
+    export_text
+from search.topk import TopK, conjunctive_top_k, disjunctive_top_k, top_k
+from search.intersect import intersect
+from search.cache import LRUCache, QueryCache
+from search.tokenizer import TOKEN_SPLIT, Stemmer, tokenize
+from search.html_extract import HTMLExtractor
+from search.memindex import MemoryIndex
+from search.merge import MAX_OPEN_PARTIALS, merge_entries, merge_partials, read_partial, reduce_partials
+from search.shards import Manifest, ShardedLexicon, plan_shards
+from search.segments import MERGE_FACTOR, Segment, SegmentIndex
+from search.simhash import DuplicateIndex, fingerprint, simhash
+from search.positions import PositionIndex, PositionsList, PositionsReader, PositionsWriter, merge_positions, \
+    phrase_match, read_positions_partial, reduce_position_partials
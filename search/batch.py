@@ -0,0 +1,125 @@
+# Replays a query log against the index and reports throughput and latency
+# Run from the repository root: python -m search.batch [--input queries.txt] [--output results.jsonl] [--workers 4]
+# Queries are read one per line (stdin by default), ranked doc IDs are written as JSONL and the summary goes to stderr.
+
+import json
+import math
+import pathlib
+import sys
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from crungus_search import CrungySearchEngine
+
+# Engine of the current worker process, loaded once by init_worker
+worker_engine = None
+
+
+def init_worker(index_dir: str, cache_bytes: int):
+    global worker_engine
+    worker_engine = CrungySearchEngine(cache_bytes)
+    worker_engine.index_dir = pathlib.Path(index_dir)
+    worker_engine.load_lexicon()
+
+
+def run_query(args: (str, int, bool)) -> ([(int, float)], float):
+    """
+    Run one query through the same retrieval path as process_query.
+    :return: The ranked (doc ID, score) pairs and how long retrieval took in seconds
+    """
+    query, k, conjunctive = args
+    start = perf_counter()
+    results = worker_engine.search(query, k, conjunctive)
+    return results, perf_counter() - start
+
+
+def percentile(sorted_values: [float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of already sorted values.
+    """
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def run_batch(queries: [str], output, k: int = 10, conjunctive=True, workers: int = 4,
+              index_dir: pathlib.Path = pathlib.Path("final_indices"), cache_bytes: int = 64 * 2 ** 20) -> dict:
+    """
+    Run queries in parallel and write their ranked doc IDs as JSONL, in input order.
+    :param queries: Raw query strings
+    :param output: Text stream to write one JSON object per query to
+    :param k: Number of results per query
+    :param conjunctive: Whether results must contain every term, or any of them
+    :param workers: Size of the process pool, 0 runs everything in this process
+    :param index_dir: Directory of the final indices
+    :param cache_bytes: Query cache budget of each worker
+    :return: Summary of the run
+    """
+    jobs = [(query, k, conjunctive) for query in queries]
+    # Loading the index is timed separately so the throughput reflects a warm pool
+    start = perf_counter()
+    if workers > 0:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(str(index_dir), cache_bytes)) as pool:
+            list(pool.map(int, range(workers)))
+            startup_time = perf_counter() - start
+            answers = list(pool.map(run_query, jobs, chunksize=max(1, len(jobs) // (workers * 16))))
+    else:
+        init_worker(str(index_dir), cache_bytes)
+        startup_time = perf_counter() - start
+        answers = [run_query(_) for _ in jobs]
+    wall_time = perf_counter() - start - startup_time
+
+    latencies = []
+    zero_results = 0
+    for query, (results, latency) in zip(queries, answers):
+        output.write(json.dumps({"query": query, "doc_ids": [_[0] for _ in results],
+                                 "scores": [round(_[1], 4) for _ in results], "latency_ms": latency * 1000}) + "\n")
+        latencies.append(latency)
+        zero_results += not results
+
+    latencies.sort()
+    return {"queries": len(queries),
+            "workers": workers,
+            "startup_s": startup_time,
+            "wall_time_s": wall_time,
+            "throughput_qps": len(queries) / wall_time if wall_time > 0 else 0.0,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p90_ms": percentile(latencies, 0.90) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "zero_result_rate": zero_results / len(queries) if queries else 0.0}
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--input", type=str, default="-", help="File of queries, one per line ('-' for stdin)")
+    parser.add_argument("--output", type=str, default="-", help="JSONL file to write results to ('-' for stdout)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--mode", choices=["and", "or"], default="and")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--index-dir", type=str, default="final_indices")
+    parser.add_argument("--cache-mb", type=int, default=64)
+    args = parser.parse_args()
+
+    query_file = sys.stdin if args.input == "-" else open(args.input, encoding='utf8')
+    with query_file:
+        queries = [_.strip().lower() for _ in query_file if _.strip()]
+
+    output = sys.stdout if args.output == "-" else open(args.output, 'w', encoding='utf8')
+    try:
+        summary = run_batch(queries, output, args.k, args.mode == "and", args.workers,
+                            pathlib.Path(args.index_dir), args.cache_mb * 2 ** 20)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(f"{summary['queries']} queries in {summary['wall_time_s']:.3f}s on {summary['workers']} workers "
+          f"({summary['throughput_qps']:.1f} queries/s, {summary['startup_s']:.3f}s to load the index)\n"
+          f"latency p50 {summary['p50_ms']:.3f}ms, p90 {summary['p90_ms']:.3f}ms, p99 {summary['p99_ms']:.3f}ms\n"
+          f"zero-result rate {summary['zero_result_rate']:.1%}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Least recently used cache bounded by the approximate size of its values rather than their count. The caller says
+    how big each value is when putting it in, and the least recently used values are evicted until everything fits.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None, usable=None):
+        """
+        :param key: Key of the value
+        :param default: What to return on a miss
+        :param usable: Optional check on the cached value, a value failing it counts as a miss
+        :return: The cached value, or default
+        """
+        if key not in self.entries or (usable is not None and not usable(self.entries[key][0])):
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+
+    def put(self, key, value, size: int):
+        """
+        Add or replace a value. Values bigger than the whole budget are not cached at all.
+        :param key: Key of the value
+        :param value: Value to cache
+        :param size: Approximate size of the value in bytes
+        """
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[1]
+        if size > self.max_bytes:
+            return
+
+        self.entries[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class QueryCache:
+    """
+    Two-level query cache sharing one memory budget: fully decoded postings of hot terms, and final ranked results
+    keyed by the normalized query (its sorted, stemmed, de-duplicated terms and whether it is conjunctive).
+    """
+
+    # Rough per-result cost of a (doc ID, score) tuple in a list
+    RESULT_BYTES = 100
+
+    def __init__(self, max_bytes: int = 64 * 2 ** 20, results_share: float = 0.25):
+        """
+        :param max_bytes: Memory budget of both levels together
+        :param results_share: Fraction of the budget given to ranked results, the rest goes to postings
+        """
+        self.results = LRUCache(int(max_bytes * results_share))
+        self.postings = LRUCache(max_bytes - self.results.max_bytes)
+
+    @staticmethod
+    def query_key(stemmed_terms: [str], conjunctive: bool) -> tuple:
+        return tuple(sorted(set(stemmed_terms))), conjunctive
+
+    def get_postings(self, stemmed_term: str):
+        return self.postings.get(stemmed_term)
+
+    def fits_postings(self, size: int) -> bool:
+        """
+        :return: Whether postings of this size would be kept at all
+        """
+        return 0 < size <= self.postings.max_bytes
+
+    def put_postings(self, stemmed_term: str, postings):
+        """
+        :param stemmed_term: Term the postings belong to
+        :param postings: PostingsList that has already been fully decoded with load()
+        """
+        self.postings.put(stemmed_term, postings, postings.nbytes())
+
+    def get_results(self, key: tuple, k: int):
+        """
+        :param key: Normalized query from query_key
+        :param k: Number of results wanted
+        :return: The top k results, or None if the cached results cannot answer for k
+        """
+        # A shorter list than was asked for means there were no more results to find
+        cached = self.results.get(key, usable=lambda _: k <= _[0] or len(_[1]) < _[0])
+        return cached[1][:k] if cached is not None else None
+
+    def put_results(self, key: tuple, k: int, results: [(int, float)]):
+        self.results.put(key, (k, results), self.RESULT_BYTES * (len(results) + 1))
+
+    def clear(self):
+        self.results.clear()
+        self.postings.clear()
+
+    def stats(self) -> dict:
+        return {"postings": self.postings.stats(), "results": self.results.stats()}
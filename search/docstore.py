@@ -0,0 +1,127 @@
+import mmap
+import pathlib
+import struct
+
+from typing import NamedTuple
+
+MAGIC = b"CRNGDOC1"
+
+# Fixed-width record per doc ID: offset into the blob, URL length, title length, length in tokens, crawl time
+RECORD = struct.Struct("<QIHId")
+
+
+class DocRecord(NamedTuple):
+    url: str
+    title: str
+    length: int
+    crawl_time: float
+
+
+def store_paths(doc_id_path: pathlib.Path) -> (pathlib.Path, pathlib.Path):
+    """
+    :param doc_id_path: Path of the document ID file the store sits next to
+    :return: Paths of the offset table and the URL/title blob
+    """
+    return doc_id_path.with_suffix('.idx'), doc_id_path.with_suffix('.dat')
+
+
+class DocStoreWriter:
+    """
+    Writes the document store: a table of fixed-width records indexed by doc ID, pointing into a packed blob of URLs
+    and titles.
+    """
+
+    def __init__(self, doc_id_path: pathlib.Path):
+        table_path, blob_path = store_paths(doc_id_path)
+        self.table = table_path.open('wb')
+        self.blob = blob_path.open('wb')
+        self.table.write(MAGIC)
+        self.blob_offset = 0
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, url: str, title: str = '', length: int = 0, crawl_time: float = 0.0) -> int:
+        """
+        Append a document.
+        :return: The doc ID of the document
+        """
+        url_bytes = url.encode('utf8')
+        # Titles only get a u16 length, which is plenty for anything that shows up in a result list
+        title_bytes = title.encode('utf8')[:0xFFFF]
+        self.table.write(RECORD.pack(self.blob_offset, len(url_bytes), len(title_bytes), length, crawl_time))
+        self.blob.write(url_bytes)
+        self.blob.write(title_bytes)
+        self.blob_offset += len(url_bytes) + len(title_bytes)
+        self.count += 1
+        return self.count - 1
+
+    def close(self):
+        self.table.close()
+        self.blob.close()
+
+
+class DocStore:
+    """
+    Memory-mapped, read-only view of a document store. Looking up a doc ID is one record read and one slice of the
+    blob, no matter how many documents there are.
+    """
+
+    def __init__(self, doc_id_path: pathlib.Path):
+        table_path, blob_path = store_paths(doc_id_path)
+        self.table_file = table_path.open('rb')
+        self.blob_file = blob_path.open('rb')
+        self.table = mmap.mmap(self.table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.table[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{table_path.name} is not a document store")
+
+        # mmap refuses empty files, and a store with only empty URLs has nothing to map anyway
+        self.blob = (mmap.mmap(self.blob_file.fileno(), 0, access=mmap.ACCESS_READ)
+                     if blob_path.stat().st_size else b'')
+        self.count = (len(self.table) - len(MAGIC)) // RECORD.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, doc_id: int):
+        if not 0 <= doc_id < self.count:
+            raise IndexError(f"Doc ID {doc_id} is not in the document store")
+        return RECORD.unpack_from(self.table, len(MAGIC) + doc_id * RECORD.size)
+
+    def url(self, doc_id: int) -> str:
+        offset, url_length, _, _, _ = self._record(doc_id)
+        return self.blob[offset:offset + url_length].decode('utf8')
+
+    def get(self, doc_id: int) -> DocRecord:
+        offset, url_length, title_length, length, crawl_time = self._record(doc_id)
+        url = self.blob[offset:offset + url_length].decode('utf8')
+        title = self.blob[offset + url_length:offset + url_length + title_length].decode('utf8')
+        return DocRecord(url, title, length, crawl_time)
+
+    def close(self):
+        for view in (getattr(self, 'table', None), getattr(self, 'blob', None)):
+            if isinstance(view, mmap.mmap):
+                view.close()
+        self.table_file.close()
+        self.blob_file.close()
+
+
+def convert_doc_id_file(doc_id_path: pathlib.Path):
+    """
+    Build a document store holding only URLs from a document ID file written before the store existed.
+    :param doc_id_path: Path to the document ID file, one URL per line
+    """
+    with doc_id_path.open('r', encoding='utf8') as doc_ids, DocStoreWriter(doc_id_path) as writer:
+        for line in doc_ids:
+            writer.add(line.rstrip('\n'))
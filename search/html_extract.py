@@ -0,0 +1,101 @@
+from html.parser import HTMLParser
+
+# Extra count each token gets for every enclosing tag of these kinds, on top of the 1 every token gets
+TAG_WEIGHTS = {"b": 1, "h4": 3, "h5": 3, "h6": 3, "h1": 7, "h2": 7, "h3": 7, "title": 15}
+
+# Text inside these never shows up on the page
+SKIPPED_TAGS = {"script", "style", "template"}
+
+# Elements that never have an end tag, so they never go on the open element stack
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source",
+                 "track", "wbr"}
+
+# How much HTML is fed to the parser at a time
+CHUNK_SIZE = 2 ** 16
+
+
+class HTMLExtractor(HTMLParser):
+    """
+    Single-pass, event-based extractor for the indexer. Instead of building a tree and walking it once per weighted
+    tag, it keeps a stack of open elements while the page streams through, and hands out every run of text together
+    with the summed weight of the weighted tags around it.
+
+    Broken markup is handled the way browsers mostly do: an end tag closes everything opened after its start tag, and
+    end tags that were never opened are ignored.
+
+    The parser hands out text as far as the HTML fed to it so far goes, so a word can arrive in two pieces when it
+    crosses a chunk boundary. Text is only made into a span at the next tag or the end of the page.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.weight = 0
+        self.skipping = 0
+        self.spans = []
+        self.text = []
+        self.title = ''
+        self.title_parts = None
+
+    def flush_text(self):
+        if self.text:
+            self.spans.append((''.join(self.text), self.weight))
+            self.text = []
+
+    def handle_starttag(self, tag, attrs):
+        self.flush_text()
+        if tag in VOID_ELEMENTS:
+            return
+        self.stack.append(tag)
+        self.weight += TAG_WEIGHTS.get(tag, 0)
+        self.skipping += tag in SKIPPED_TAGS
+        if tag == "title" and self.title_parts is None and not self.title:
+            self.title_parts = []
+
+    def handle_startendtag(self, tag, attrs):
+        # Self-closing tags like <b/> hold no text, but still end the text before them
+        self.flush_text()
+
+    def handle_endtag(self, tag):
+        self.flush_text()
+        if tag not in self.stack:
+            return
+        while self.stack:
+            closed = self.stack.pop()
+            self.weight -= TAG_WEIGHTS.get(closed, 0)
+            self.skipping -= closed in SKIPPED_TAGS
+            if closed == "title" and self.title_parts is not None:
+                self.title = ''.join(self.title_parts).strip()
+                self.title_parts = None
+            if closed == tag:
+                break
+
+    def handle_data(self, data):
+        if self.skipping:
+            return
+        self.text.append(data)
+        if self.title_parts is not None:
+            self.title_parts.append(data)
+
+    def extract(self, html: str):
+        """
+        Stream a page through the parser.
+        :param html: The page
+        :return: Generator of (text, weight) spans in page order. Once it is exhausted, title holds the page title.
+        """
+        try:
+            for start in range(0, len(html), CHUNK_SIZE):
+                self.feed(html[start:start + CHUNK_SIZE])
+                yield from self.spans
+                self.spans = []
+            self.close()
+        except (AssertionError, ValueError):
+            # The parser gives up on some truly broken declarations, keep whatever text came before
+            pass
+        self.flush_text()
+        yield from self.spans
+        self.spans = []
+
+        if self.title_parts is not None:
+            self.title = ''.join(self.title_parts).strip()
+            self.title_parts = None
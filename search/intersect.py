@@ -0,0 +1,36 @@
+from array import array
+
+from search.postings import PostingsCursor, PostingsList
+
+END = PostingsCursor.END
+
+
+def intersect(postings_lists: [PostingsList]) -> (array, [float]):
+    """
+    Find every doc containing all of the given terms. The shortest list leads and every other cursor gallops forward
+    to the lead's doc, so long lists are only decoded in the blocks the lead actually lands in, and only the
+    candidate docs are ever looked at instead of every posting of every term.
+    :param postings_lists: Postings of each term
+    :return: Matching doc IDs in ascending order, and the summed score of the terms for each of them
+    """
+    doc_ids = array('I')
+    scores = []
+    if not postings_lists:
+        return doc_ids, scores
+
+    cursors = sorted((_.cursor() for _ in postings_lists), key=len)
+    lead, others = cursors[0], cursors[1:]
+
+    doc = lead.doc
+    while doc != END:
+        for cursor in others:
+            if cursor.advance(doc) != doc:
+                # This cursor overshot, so nothing before its doc can match
+                doc = lead.advance(cursor.doc)
+                break
+        else:
+            doc_ids.append(doc)
+            scores.append(lead.score() + sum(_.score() for _ in others))
+            doc = lead.next()
+
+    return doc_ids, scores
@@ -0,0 +1,69 @@
+import pathlib
+
+from typing import NamedTuple
+
+
+class LexiconEntry(NamedTuple):
+    shard: str
+    offset: int
+    length: int
+    doc_freq: int
+    positions: int = -1
+
+
+class Lexicon:
+    """
+    Maps every term in the final indices to the shard it lives in and the byte range of its postings, so a query can
+    seek() straight to the right place instead of scanning the whole shard.
+
+    On disk this is one 'term<TAB>shard<TAB>offset<TAB>length<TAB>doc_freq' line per term, sorted by term. Indices
+    built with positions have a sixth column, the offset of the term's positions in the shard's positions file.
+    """
+
+    FILE_NAME = "lexicon.txt"
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, term):
+        return term in self.entries
+
+    def __iter__(self):
+        yield from sorted(self.entries)
+
+    def get(self, term: str):
+        """
+        :param term: Stemmed term to look up
+        :return: The LexiconEntry for the term, or None if the term is not indexed
+        """
+        return self.entries.get(term)
+
+    def add(self, term: str, shard: str, offset: int, length: int, doc_freq: int, positions: int = -1):
+        self.entries[term] = LexiconEntry(shard, offset, length, doc_freq, positions)
+
+    def write(self):
+        with self.path.open('w', encoding='utf8') as lexicon_file:
+            for term in sorted(self.entries):
+                entry = self.entries[term]
+                line = f"{term}\t{entry.shard}\t{entry.offset}\t{entry.length}\t{entry.doc_freq}"
+                if entry.positions >= 0:
+                    line += f"\t{entry.positions}"
+                lexicon_file.write(line + "\n")
+
+    @classmethod
+    def load(cls, path: pathlib.Path):
+        """
+        Read a lexicon written by Lexicon.write.
+        :param path: Path to the lexicon file
+        :return: The loaded Lexicon
+        """
+        lexicon = cls(path)
+        with path.open('r', encoding='utf8') as lexicon_file:
+            for line in lexicon_file:
+                term, shard, *numbers = line.rstrip('\n').split('\t')
+                lexicon.entries[term] = LexiconEntry(shard, *map(int, numbers))
+        return lexicon
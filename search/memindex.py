@@ -0,0 +1,67 @@
+import pathlib
+
+from array import array
+
+# Rough fixed cost of a term: its dict entry, the string, the array object and a slot in two lists
+TERM_OVERHEAD = 200
+
+# Every posting is a (doc, count) pair of u32s
+POSTING_BYTES = 2 * array('I').itemsize
+
+
+class MemoryIndex:
+    """
+    In-memory inverted index used while building partial indices. Terms get small integer IDs, and each term's
+    postings live in one growable typed array of interleaved (doc, count) pairs instead of a dict of dicts, so a
+    posting costs 8 bytes rather than a couple of hundred. The index keeps a running estimate of its own size so the
+    indexer can flush it when a memory budget is reached instead of after a fixed number of documents.
+    """
+
+    def __init__(self):
+        self.term_ids = {}
+        self.terms = []
+        self.postings = []
+        self.bytes = 0
+        self.docs = 0
+
+    def __len__(self):
+        return len(self.terms)
+
+    def add_document(self, doc_id: int, counts: {str: int}):
+        """
+        Add the token counts of one document. Documents have to be added in increasing doc ID order, so that every
+        term's postings stay sorted.
+        :param doc_id: Doc ID of the document
+        :param counts: Token -> (weighted) count in the document
+        """
+        for term, count in counts.items():
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                term_id = len(self.terms)
+                self.term_ids[term] = term_id
+                self.terms.append(term)
+                self.postings.append(array('I'))
+                self.bytes += TERM_OVERHEAD + len(term)
+            postings = self.postings[term_id]
+            postings.append(doc_id)
+            postings.append(count)
+        self.bytes += POSTING_BYTES * len(counts)
+        self.docs += 1
+
+    def write(self, path: pathlib.Path):
+        """
+        Write the index as a partial index, one 'term - doc: count, ...' line per term in term order.
+        """
+        with path.open('w') as partial_index_file:
+            for term in sorted(self.term_ids):
+                postings = self.postings[self.term_ids[term]]
+                partial_index_file.write(
+                    f"{term} - " + ', '.join([f"{postings[i]}: {postings[i + 1]}"
+                                              for i in range(0, len(postings), 2)]) + "\n")
+
+    def clear(self):
+        self.term_ids = {}
+        self.terms = []
+        self.postings = []
+        self.bytes = 0
+        self.docs = 0
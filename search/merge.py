@@ -0,0 +1,113 @@
+import heapq
+import pathlib
+
+from itertools import count, groupby
+from operator import itemgetter
+
+# Most partial indices kept open at once. With more than this, they are merged down in several passes.
+MAX_OPEN_PARTIALS = 64
+
+
+def parse_partial_line(line: str) -> (str, [(int, int)]):
+    """
+    :param line: Partial index line, 'term - doc: count, ...'
+    :return: The term and its (doc, count) pairs
+    """
+    term, _, postings = line.rstrip('\n').partition(' - ')
+    return term, [(int(doc), int(doc_count)) for doc, doc_count in
+                  (posting.split(': ') for posting in postings.split(', '))]
+
+
+def read_partial(path: pathlib.Path, start: int = 0, low: str = None, high: str = None):
+    """
+    :param path: Partial index to read
+    :param start: Byte offset to start reading at, which has to be the start of a line
+    :param low: Skip terms before this one
+    :param high: Stop at this term
+    :return: Generator of (term, [(doc, count), ...]) for the lines of a partial index, in file (term) order
+    """
+    with path.open('rb') as partial_index_file:
+        partial_index_file.seek(start)
+        for line in partial_index_file:
+            line = line.decode()
+            if not line.strip():
+                continue
+            if low is not None or high is not None:
+                term = line.partition(' - ')[0]
+                if low is not None and term < low:
+                    continue
+                if high is not None and term >= high:
+                    break
+            yield parse_partial_line(line)
+
+
+def merge_entries(sources) -> (str, [(int, int)]):
+    """
+    k-way merge of term ordered (term, postings) streams. A heap holds the next term of every stream, so producing a
+    term costs O(log k) for k streams, and every line is only parsed once.
+    :param sources: Iterables of (term, [(doc, count), ...]) sorted by term
+    :return: Generator of (term, [(doc, count), ...]) with the postings of all sources combined and sorted by doc
+    """
+    for term, entries in groupby(heapq.merge(*sources, key=itemgetter(0)), key=itemgetter(0)):
+        entries = [postings for _, postings in entries]
+        if len(entries) == 1:
+            # Partials are written in doc order, so this is a single linear pass unless the partial is an old one
+            postings = entries[0]
+            postings.sort()
+        else:
+            combined = {}
+            for postings in entries:
+                for doc, doc_count in postings:
+                    combined[doc] = combined.get(doc, 0) + doc_count
+            postings = sorted(combined.items())
+        yield term, postings
+
+
+def write_partial(path: pathlib.Path, entries) -> int:
+    """
+    Write (term, postings) pairs in the partial index format.
+    :return: Number of terms written
+    """
+    terms = 0
+    with path.open('w') as partial_index_file:
+        for term, postings in entries:
+            partial_index_file.write(f"{term} - " + ', '.join([f"{doc}: {doc_count}" for doc, doc_count in postings])
+                                     + "\n")
+            terms += 1
+    return terms
+
+
+def reduce_partials(partials: [pathlib.Path], max_open: int = MAX_OPEN_PARTIALS) -> [pathlib.Path]:
+    """
+    Merge partial indices in passes of at most max_open files, until at most max_open are left. The intermediate
+    partials are written next to the originals, and every input is deleted once it has been merged.
+    :param partials: Partial indices to reduce
+    :param max_open: Most files open at once
+    :return: At most max_open partial indices holding everything the given ones did
+    """
+    partials = sorted(partials)
+    for merge_pass in count(0):
+        if len(partials) <= max_open:
+            return partials
+
+        print(f"\t{len(partials)} partial indices are too many to open at once, merge pass {merge_pass}...")
+        merged = []
+        for group_number, start in enumerate(range(0, len(partials), max_open)):
+            group = partials[start:start + max_open]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            merged_path = group[0].parent / f"merged_{merge_pass}_{group_number}.txt"
+            write_partial(merged_path, merge_entries([read_partial(_) for _ in group]))
+            for partial in group:
+                partial.unlink()
+            merged.append(merged_path)
+        partials = merged
+
+
+def merge_partials(partials: [pathlib.Path], max_open: int = MAX_OPEN_PARTIALS):
+    """
+    Stream every term of a set of partial indices, merging hierarchically first if there are more than max_open.
+    :return: Generator of (term, [(doc, count), ...]) in term order, with postings sorted by doc
+    """
+    yield from merge_entries([read_partial(_) for _ in reduce_partials(partials, max_open)])
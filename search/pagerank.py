@@ -0,0 +1,105 @@
+import pathlib
+import time
+
+from argparse import ArgumentParser
+from array import array
+
+from utils.link_graph import LinkGraph, url_key
+
+# Chance of following a link instead of jumping to any page at random
+DAMPING = 0.85
+
+# Static score of every doc as a float32, in doc ID order, written next to the final indices by process_files
+STATIC_SCORES_NAME = "static_scores.bin"
+
+
+def pagerank(offsets, targets, damping: float = DAMPING, tolerance: float = 1e-9, max_iterations: int = 100):
+    """
+    PageRank by power iteration over a CSR link graph. Every iteration is a handful of whole-array NumPy operations:
+    each node's rank is split over its links, summed per target with bincount, and the rank of pages without links is
+    spread over every page.
+    :param offsets: The links of node i are targets[offsets[i]:offsets[i + 1]]
+    :param targets: Node of every link
+    :param damping: Chance of following a link
+    :param tolerance: Stop once the ranks change less than this in total
+    :param max_iterations: Stop after this many iterations either way
+    :return: NumPy array of the rank of every node, summing to 1
+    """
+    # NumPy is only needed for static ranks, nothing else has to have it installed
+    import numpy as np
+
+    offsets = np.asarray(offsets, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    nodes = len(offsets) - 1
+    if nodes <= 0:
+        return np.zeros(0)
+    out_degree = np.diff(offsets)
+    sources = np.repeat(np.arange(nodes), out_degree)
+    dangling = out_degree == 0
+    inverse_degree = np.divide(1.0, out_degree, out=np.zeros(nodes), where=~dangling)
+
+    rank = np.full(nodes, 1.0 / nodes)
+    for _ in range(max_iterations):
+        following = np.bincount(targets, weights=(rank * inverse_degree)[sources], minlength=nodes)
+        new_rank = damping * (following + rank[dangling].sum() / nodes) + (1 - damping) / nodes
+        change = np.abs(new_rank - rank).sum()
+        rank = new_rank
+        if change < tolerance:
+            break
+    return rank
+
+
+def page_scores(graph_path: pathlib.Path, urls: [str], damping: float = DAMPING) -> [float]:
+    """
+    Static score of every page, its PageRank scaled so the best ranked page of the graph scores 1.
+    :param graph_path: Link graph packed by utils.link_graph
+    :param urls: URLs of the pages to score
+    :return: Score of every URL, 0 for pages the link graph does not have
+    """
+    with LinkGraph(graph_path) as graph:
+        ranks = pagerank(graph.offsets, graph.targets, damping)
+        nodes = {key: node for node, key in enumerate(graph.urls())}
+    best = ranks.max() if len(ranks) else 0.0
+    if best <= 0:
+        return [0.0] * len(urls)
+    ranks = (ranks / best).tolist()
+    return [ranks[nodes[key]] if key in nodes else 0.0 for key in map(url_key, urls)]
+
+
+def write_static_scores(path: pathlib.Path, scores: [float]):
+    with path.open('wb') as scores_file:
+        array('f', scores).tofile(scores_file)
+
+
+def load_static_scores(path: pathlib.Path, weight: float = 1.0) -> array:
+    """
+    :param path: Static scores written by write_static_scores
+    :param weight: Factor to apply to every score
+    :return: Flat array of the (weighted) static score of every doc ID
+    """
+    scores = array('f')
+    with path.open('rb') as scores_file:
+        scores.frombytes(scores_file.read())
+    if weight != 1.0:
+        scores = array('f', [score * weight for score in scores])
+    return scores
+
+
+def main():
+    parser = ArgumentParser(description="Show the best ranked pages of a link graph")
+    parser.add_argument("graph", type=str)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--damping", type=float, default=DAMPING)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with LinkGraph(pathlib.Path(args.graph)) as graph:
+        ranks = pagerank(graph.offsets, graph.targets, args.damping)
+        urls = graph.urls()
+        print(f"Ranked {graph.nodes} pages with {graph.edges} links in {time.perf_counter() - start:.3f}s")
+    for node in ranks.argsort()[::-1][:args.top]:
+        print(f"{ranks[node]:.6f}\t{urls[node]}")
+
+
+if __name__ == '__main__':
+    main()
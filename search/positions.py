@@ -0,0 +1,325 @@
+import heapq
+import mmap
+import pathlib
+import struct
+
+from bisect import bisect_left
+from itertools import count, groupby
+from operator import itemgetter
+
+from search.memindex import TERM_OVERHEAD
+from search.merge import MAX_OPEN_PARTIALS
+from search.postings import BLOCK_SIZE, decode_varints, encode_varint
+
+# Every positions file starts with this
+MAGIC = b"CRNGPOS1"
+
+# Positions files sit next to the postings shard they belong to, with this suffix instead of .bin
+SUFFIX = ".pos"
+
+# Partial positions entry: term length (u32), payload length (u32), term, then for every doc of the term in doc order
+# the doc ID, the number of positions and the position deltas, all varints
+PARTIAL_ENTRY = struct.Struct("<II")
+
+# Term record of a final positions file: number of blocks, then the offset of every block from the end of the table
+BLOCK_COUNT = struct.Struct("<I")
+BLOCK_OFFSET = struct.Struct("<I")
+
+
+def encode_positions(positions: [int], out: bytearray):
+    """
+    Append the number of positions and the gaps between them as varints
+    """
+    encode_varint(len(positions), out)
+    previous = 0
+    for position in positions:
+        encode_varint(position - previous, out)
+        previous = position
+
+
+def decode_positions(buffer, position: int) -> ([int], int):
+    """
+    :return: Positions written by encode_positions at the given offset, and the offset just past them
+    """
+    (amount,), position = decode_varints(buffer, position, 1)
+    gaps, position = decode_varints(buffer, position, amount)
+    positions = []
+    current = 0
+    for gap in gaps:
+        current += gap
+        positions.append(current)
+    return positions, position
+
+
+class PositionIndex:
+    """
+    In-memory side index of where every term occurs in every document, built next to a MemoryIndex while indexing.
+    Each term's entries are kept varint encoded in one growable bytearray, and written out as a partial positions file
+    in term order.
+    """
+
+    def __init__(self):
+        self.terms = {}
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self.terms)
+
+    def add_document(self, doc_id: int, term_positions: {str: [int]}):
+        """
+        Add where each term occurs in one document. Documents have to be added in increasing doc ID order.
+        :param doc_id: Doc ID of the document
+        :param term_positions: Term -> ascending token positions in the document
+        """
+        for term, positions in term_positions.items():
+            entries = self.terms.get(term)
+            if entries is None:
+                entries = self.terms[term] = bytearray()
+                self.bytes += TERM_OVERHEAD + len(term)
+            length = len(entries)
+            encode_varint(doc_id, entries)
+            encode_positions(positions, entries)
+            self.bytes += len(entries) - length
+
+    def write(self, path: pathlib.Path):
+        """
+        Write the index as a partial positions file, in term order.
+        """
+        with path.open('wb') as positions_file:
+            for term in sorted(self.terms):
+                write_positions_entry(positions_file, term, self.terms[term])
+
+    def clear(self):
+        self.terms = {}
+        self.bytes = 0
+
+
+def write_positions_entry(positions_file, term: str, payload: bytes):
+    term_bytes = term.encode('utf-8')
+    positions_file.write(PARTIAL_ENTRY.pack(len(term_bytes), len(payload)))
+    positions_file.write(term_bytes)
+    positions_file.write(payload)
+
+
+def read_positions_partial(path: pathlib.Path, low: str = None, high: str = None):
+    """
+    :param path: Partial positions file to read
+    :param low: Skip terms before this one
+    :param high: Stop at this term
+    :return: Generator of (term, [(doc, [positions]), ...]) in term order. Entries of skipped terms are never decoded.
+    """
+    with path.open('rb') as positions_file:
+        while True:
+            header = positions_file.read(PARTIAL_ENTRY.size)
+            if len(header) < PARTIAL_ENTRY.size:
+                return
+            term_length, payload_length = PARTIAL_ENTRY.unpack(header)
+            term = positions_file.read(term_length).decode('utf-8')
+            if low is not None and term < low:
+                positions_file.seek(payload_length, 1)
+                continue
+            if high is not None and term >= high:
+                return
+            payload = positions_file.read(payload_length)
+            docs = []
+            position = 0
+            while position < payload_length:
+                (doc,), position = decode_varints(payload, position, 1)
+                positions, position = decode_positions(payload, position)
+                docs.append((doc, positions))
+            yield term, docs
+
+
+def merge_positions(sources):
+    """
+    k-way merge of term ordered positions streams, like search.merge.merge_entries.
+    :param sources: Iterables of (term, [(doc, [positions]), ...]) sorted by term
+    :return: Generator of (term, [(doc, [positions]), ...]) with the docs of all sources sorted by doc
+    """
+    for term, entries in groupby(heapq.merge(*sources, key=itemgetter(0)), key=itemgetter(0)):
+        docs = [doc for _, term_docs in entries for doc in term_docs]
+        docs.sort(key=itemgetter(0))
+        yield term, docs
+
+
+def write_positions_partial(path: pathlib.Path, entries):
+    """
+    Write (term, [(doc, [positions]), ...]) pairs in the partial positions format.
+    """
+    payload = bytearray()
+    with path.open('wb') as positions_file:
+        for term, docs in entries:
+            payload.clear()
+            for doc, positions in docs:
+                encode_varint(doc, payload)
+                encode_positions(positions, payload)
+            write_positions_entry(positions_file, term, payload)
+
+
+def reduce_position_partials(partials: [pathlib.Path], max_open: int = MAX_OPEN_PARTIALS) -> [pathlib.Path]:
+    """
+    Merge partial positions files in passes of at most max_open files, like search.merge.reduce_partials.
+    :return: At most max_open partial positions files holding everything the given ones did
+    """
+    partials = sorted(partials)
+    for merge_pass in count(0):
+        if len(partials) <= max_open:
+            return partials
+
+        merged = []
+        for group_number, start in enumerate(range(0, len(partials), max_open)):
+            group = partials[start:start + max_open]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            merged_path = group[0].parent / f"merged_positions_{merge_pass}_{group_number}{SUFFIX}"
+            write_positions_partial(merged_path, merge_positions([read_positions_partial(_) for _ in group]))
+            for partial in group:
+                partial.unlink()
+            merged.append(merged_path)
+        partials = merged
+
+
+class PositionsWriter:
+    """
+    Writes the positions file of one postings shard. Each term's record has the same blocks as its postings:
+
+        header      num_blocks (u32), then num_blocks * block_offset (u32)
+        blocks      for every doc of the block: length in bytes, number of positions, position gaps, all varints
+
+    The length in front of every doc lets a lookup hop over the docs before the one it wants without decoding them.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.file = path.open('wb')
+        self.file.write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, doc_positions: [[int]]) -> int:
+        """
+        Write the positions of one term.
+        :param doc_positions: Positions of the term in every doc of its postings, in the same order
+        :return: Byte offset of the record, for the lexicon
+        """
+        offsets = bytearray()
+        blocks = bytearray()
+        encoded = bytearray()
+        for start in range(0, len(doc_positions), BLOCK_SIZE):
+            offsets += BLOCK_OFFSET.pack(len(blocks))
+            for positions in doc_positions[start:start + BLOCK_SIZE]:
+                encoded.clear()
+                encode_positions(positions, encoded)
+                encode_varint(len(encoded), blocks)
+                blocks += encoded
+
+        offset = self.file.tell()
+        self.file.write(BLOCK_COUNT.pack(len(offsets) // BLOCK_OFFSET.size) + offsets + blocks)
+        return offset
+
+    def close(self):
+        self.file.close()
+
+
+class PositionsList:
+    """
+    Positions of one term, read straight from a memory-mapped positions file. Lookups are expected to move forward
+    through the postings like a cursor does, so the place of the last lookup is kept and the next one in the same
+    block continues from there.
+    """
+
+    def __init__(self, buffer, offset: int):
+        self.buffer = buffer
+        self.num_blocks = BLOCK_COUNT.unpack_from(buffer, offset)[0]
+        table_start = offset + BLOCK_COUNT.size
+        self.data_start = table_start + self.num_blocks * BLOCK_OFFSET.size
+        self.block_offsets = [BLOCK_OFFSET.unpack_from(buffer, table_start + i * BLOCK_OFFSET.size)[0]
+                              for i in range(self.num_blocks)]
+        self.last = (-1, 0, 0)
+
+    def doc_positions(self, block: int, index: int) -> [int]:
+        """
+        :param block: Block of the doc in the term's postings
+        :param index: Place of the doc within its block
+        :return: Ascending positions of the term in that doc
+        """
+        last_block, last_index, position = self.last
+        if last_block != block or last_index > index:
+            last_index, position = 0, self.data_start + self.block_offsets[block]
+        while last_index < index:
+            (length,), position = decode_varints(self.buffer, position, 1)
+            position += length
+            last_index += 1
+        self.last = (block, index, position)
+        return decode_positions(self.buffer, decode_varints(self.buffer, position, 1)[1])[0]
+
+
+class PositionsReader:
+    """
+    Memory-maps the positions files of an index directory, each the first time a term in it is read.
+    """
+
+    def __init__(self, index_dir: pathlib.Path):
+        self.index_dir = index_dir
+        self.files = {}
+        self.maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def positions(self, lexicon_entry):
+        """
+        :param lexicon_entry: LexiconEntry of the term to read
+        :return: The term's PositionsList, or None if the index was built without positions
+        """
+        if lexicon_entry.positions < 0:
+            return None
+        name = pathlib.Path(lexicon_entry.shard).with_suffix(SUFFIX).name
+        if name not in self.maps:
+            positions_file = (self.index_dir / name).open('rb')
+            positions_map = mmap.mmap(positions_file.fileno(), 0, access=mmap.ACCESS_READ)
+            if positions_map[:len(MAGIC)] != MAGIC:
+                positions_map.close()
+                positions_file.close()
+                raise ValueError(f"{name} is not a positions file")
+            self.files[name] = positions_file
+            self.maps[name] = positions_map
+        return PositionsList(self.maps[name], lexicon_entry.positions)
+
+    def close(self):
+        for positions_map in self.maps.values():
+            positions_map.close()
+        for positions_file in self.files.values():
+            positions_file.close()
+        self.maps = {}
+        self.files = {}
+
+
+def phrase_match(term_positions: [[int]], slop: int = 0) -> bool:
+    """
+    Whether the terms occur in order with at most slop other tokens between each one and the next. With a slop of 0
+    this is an exact phrase. Going term by term, a position is kept if some kept position of the term before it lies
+    within slop + 1 tokens in front of it, so every way of chaining the terms is covered, not just the earliest one.
+    :param term_positions: Ascending positions of every term of the phrase, in phrase order
+    :param slop: Most tokens allowed between neighbouring terms
+    """
+    reachable = term_positions[0]
+    for positions in term_positions[1:]:
+        following = []
+        for position in positions:
+            # The closest kept position in front of this one is the one most likely to be near enough
+            before = bisect_left(reachable, position)
+            if before and reachable[before - 1] >= position - slop - 1:
+                following.append(position)
+        if not following:
+            return False
+        reachable = following
+    return bool(reachable)
@@ -0,0 +1,405 @@
+import mmap
+import pathlib
+import struct
+import sys
+
+from array import array
+from bisect import bisect_left
+
+from search.lexicon import Lexicon
+
+# Every binary shard starts with this so stray text shards are never mistaken for postings
+MAGIC = b"CRNGPST1"
+
+# Postings are stored in blocks of this many (doc, score) pairs
+BLOCK_SIZE = 128
+
+# Scores are quantized to 16 bits relative to the term's maximum score
+SCORE_LEVELS = 0xFFFF
+
+# Term header: doc frequency, number of blocks, maximum score
+TERM_HEADER = struct.Struct("<IIf")
+
+# Skip table entry per block: last doc ID in the block, offset of the block from the end of the skip table, and the
+# block's maximum quantized score
+SKIP_ENTRY = struct.Struct("<IIH")
+
+
+def gallop(values, target, low: int = 0) -> int:
+    """
+    Find the first index at or after low whose value is >= target, like bisect_left, but by doubling the step from
+    low first. Finding something k places ahead costs O(log k) instead of O(log n), which pays off when cursors move
+    forward in small steps.
+    :param values: Sorted sequence to search
+    :param target: Value to find
+    :param low: Index to start from
+    :return: Insertion point of target at or after low
+    """
+    size = len(values)
+    if low >= size or values[low] >= target:
+        return low
+    step = 1
+    high = low + step
+    while high < size and values[high] < target:
+        low = high
+        step <<= 1
+        high = low + step
+    return bisect_left(values, target, low + 1, min(high, size))
+
+
+def encode_varint(value: int, out: bytearray):
+    """
+    Append an unsigned LEB128 varint to out.
+    """
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varints(buffer, position: int, amount: int) -> ([int], int):
+    """
+    Decode a run of unsigned LEB128 varints.
+    :param buffer: Bytes-like object to read from
+    :param position: Offset of the first varint
+    :param amount: How many varints to read
+    :return: The decoded values and the offset just past the last one
+    """
+    values = []
+    for _ in range(amount):
+        value = 0
+        shift = 0
+        byte = buffer[position]
+        while byte & 0x80:
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            position += 1
+            byte = buffer[position]
+        values.append(value | (byte << shift))
+        position += 1
+    return values, position
+
+
+class PostingsWriter:
+    """
+    Writes one binary postings shard. Each term is stored as:
+
+        header      doc_freq (u32), num_blocks (u32), max_score (f32)
+        skip table  num_blocks * (last_doc (u32), block_offset (u32), block_max (u16))
+        blocks      delta + varint encoded doc IDs, then one u16 quantized score per doc
+
+    Doc IDs are deltas against the previous doc ID in the term, so a block can only be decoded after its predecessor's
+    last doc ID is known, which the skip table provides.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.file = path.open('wb')
+        self.file.write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, doc_ids: [int], scores: [float]) -> (int, int):
+        """
+        Write the postings of one term.
+        :param doc_ids: Doc IDs of the term, sorted ascending
+        :param scores: Score of the term in each doc, in the same order
+        :return: Byte offset and length of the record, for the lexicon
+        """
+        max_score = max(scores) if scores else 0.0
+        scale = SCORE_LEVELS / max_score if max_score > 0 else 0.0
+
+        skip_table = bytearray()
+        blocks = bytearray()
+        previous_doc = 0
+        for start in range(0, len(doc_ids), BLOCK_SIZE):
+            block_docs = doc_ids[start:start + BLOCK_SIZE]
+            quantized = array('H', [min(SCORE_LEVELS, round(score * scale))
+                                    for score in scores[start:start + BLOCK_SIZE]])
+            skip_table += SKIP_ENTRY.pack(block_docs[-1], len(blocks), max(quantized))
+
+            for doc_id in block_docs:
+                encode_varint(doc_id - previous_doc, blocks)
+                previous_doc = doc_id
+            if sys.byteorder == 'big':
+                quantized.byteswap()
+            blocks += quantized.tobytes()
+
+        record = TERM_HEADER.pack(len(doc_ids), len(skip_table) // SKIP_ENTRY.size, max_score) + skip_table + blocks
+        offset = self.file.tell()
+        self.file.write(record)
+        return offset, len(record)
+
+    def close(self):
+        self.file.close()
+
+
+class PostingsList:
+    """
+    Lazily decoded postings of one term, backed by a memory-mapped shard.
+    """
+
+    def __init__(self, buffer, offset: int):
+        self.buffer = buffer
+        self.doc_freq, self.num_blocks, self.max_score = TERM_HEADER.unpack_from(buffer, offset)
+
+        skip_start = offset + TERM_HEADER.size
+        skips = [SKIP_ENTRY.unpack_from(buffer, skip_start + i * SKIP_ENTRY.size) for i in range(self.num_blocks)]
+        self.block_last_docs = [_[0] for _ in skips]
+        self.block_offsets = [_[1] for _ in skips]
+        self.block_max = [_[2] * self.max_score / SCORE_LEVELS for _ in skips]
+        self.data_start = skip_start + self.num_blocks * SKIP_ENTRY.size
+        self.blocks = None
+
+    def __len__(self):
+        return self.doc_freq
+
+    def __iter__(self):
+        for block in range(self.num_blocks):
+            yield from zip(*self.decode_block(block))
+
+    def block_length(self, block: int) -> int:
+        return BLOCK_SIZE if block < self.num_blocks - 1 else self.doc_freq - BLOCK_SIZE * (self.num_blocks - 1)
+
+    def decode_block(self, block: int) -> ([int], [float]):
+        """
+        Decode a single block.
+        :param block: Index of the block
+        :return: The doc IDs of the block and their scores
+        """
+        if self.blocks is not None:
+            return self.blocks[block]
+
+        length = self.block_length(block)
+        deltas, position = decode_varints(self.buffer, self.data_start + self.block_offsets[block], length)
+
+        doc_ids = []
+        doc_id = self.block_last_docs[block - 1] if block else 0
+        for delta in deltas:
+            doc_id += delta
+            doc_ids.append(doc_id)
+
+        quantized = array('H')
+        quantized.frombytes(self.buffer[position:position + 2 * length])
+        if sys.byteorder == 'big':
+            quantized.byteswap()
+        scale = self.max_score / SCORE_LEVELS
+        return doc_ids, [q * scale for q in quantized]
+
+    def decode(self) -> (array, array):
+        """
+        Decode every block.
+        :return: Arrays of the doc IDs and their scores
+        """
+        doc_ids = array('I')
+        scores = array('d')
+        for block in range(self.num_blocks):
+            block_docs, block_scores = self.decode_block(block)
+            doc_ids.extend(block_docs)
+            scores.extend(block_scores)
+        return doc_ids, scores
+
+    def load(self):
+        """
+        Decode every block into memory and stop reading from the shard, so the list can be cached and reused.
+        :return: This PostingsList
+        """
+        if self.blocks is None:
+            blocks = []
+            for block in range(self.num_blocks):
+                block_docs, block_scores = self.decode_block(block)
+                blocks.append((array('I', block_docs), array('d', block_scores)))
+            self.blocks = blocks
+            self.buffer = None
+        return self
+
+    def nbytes(self) -> int:
+        """
+        :return: Approximate memory used by the decoded blocks and skip table
+        """
+        per_block = 3 * 8 + 2 * 64
+        if self.blocks is None:
+            return self.num_blocks * per_block
+        return self.num_blocks * per_block + sum(_.itemsize * len(_) for block in self.blocks for _ in block)
+
+    def loaded_nbytes(self) -> int:
+        """
+        :return: What nbytes() would be after load(), without decoding anything
+        """
+        return self.num_blocks * (3 * 8 + 2 * 64) + self.doc_freq * (array('I').itemsize + array('d').itemsize)
+
+    def cursor(self, weight: float = 1.0):
+        return PostingsCursor(self, weight)
+
+
+class PostingsCursor:
+    """
+    Forward-only iterator over a PostingsList that only decodes the blocks it lands in. Once exhausted, doc is END.
+    Every score is multiplied by weight, which lets an index that stores only term frequency weights apply the idf
+    at query time.
+    """
+
+    END = 2 ** 32
+
+    def __init__(self, postings: PostingsList, weight: float = 1.0):
+        self.postings = postings
+        self.weight = weight
+        self.max_score = postings.max_score * weight
+        self.block = -1
+        self.block_docs = []
+        self.block_scores = []
+        self.position = 0
+        self.doc = self.END
+        self._load_block(0)
+
+    def __len__(self):
+        return len(self.postings)
+
+    def _load_block(self, block: int):
+        if block >= self.postings.num_blocks:
+            self.block = self.postings.num_blocks
+            self.doc = self.END
+            return
+        self.block = block
+        self.block_docs, self.block_scores = self.postings.decode_block(block)
+        self.position = 0
+        self.doc = self.block_docs[0]
+
+    def score(self) -> float:
+        return self.block_scores[self.position] * self.weight
+
+    def block_max(self) -> float:
+        """
+        :return: Upper bound on the score of any doc left in the current block
+        """
+        return self.postings.block_max[self.block] * self.weight if self.doc != self.END else 0.0
+
+    def next(self) -> int:
+        """
+        Move to the next doc.
+        :return: The new current doc
+        """
+        if self.doc == self.END:
+            return self.END
+        self.position += 1
+        if self.position < len(self.block_docs):
+            self.doc = self.block_docs[self.position]
+        else:
+            self._load_block(self.block + 1)
+        return self.doc
+
+    def next_block(self) -> int:
+        """
+        Skip the rest of the current block without looking at it.
+        :return: The new current doc
+        """
+        if self.doc != self.END:
+            self._load_block(self.block + 1)
+        return self.doc
+
+    def advance(self, target: int) -> int:
+        """
+        Move to the first doc >= target. Blocks that end before the target are jumped over by galloping through the
+        skip table, so they are never decoded, then the landing block is galloped through from the current position.
+        :return: The new current doc
+        """
+        if self.doc >= target:
+            return self.doc
+        if target > self.postings.block_last_docs[self.block]:
+            self._load_block(gallop(self.postings.block_last_docs, target, self.block + 1))
+            if self.doc == self.END:
+                return self.END
+        self.position = gallop(self.block_docs, target, self.position)
+        self.doc = self.block_docs[self.position]
+        return self.doc
+
+
+class PostingsReader:
+    """
+    Memory-maps the binary postings shards of an index directory. Shards are mapped the first time a term in them is
+    read and stay mapped until close().
+    """
+
+    def __init__(self, index_dir: pathlib.Path):
+        self.index_dir = index_dir
+        self.files = {}
+        self.maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def shard(self, name: str):
+        if name not in self.maps:
+            shard_file = (self.index_dir / name).open('rb')
+            shard_map = mmap.mmap(shard_file.fileno(), 0, access=mmap.ACCESS_READ)
+            if shard_map[:len(MAGIC)] != MAGIC:
+                shard_map.close()
+                shard_file.close()
+                raise ValueError(f"{name} is not a binary postings shard")
+            self.files[name] = shard_file
+            self.maps[name] = shard_map
+        return self.maps[name]
+
+    def postings(self, lexicon_entry) -> PostingsList:
+        """
+        :param lexicon_entry: LexiconEntry of the term to read
+        :return: The term's PostingsList
+        """
+        return PostingsList(self.shard(lexicon_entry.shard), lexicon_entry.offset)
+
+    def close(self):
+        for shard_map in self.maps.values():
+            shard_map.close()
+        for shard_file in self.files.values():
+            shard_file.close()
+        self.maps = {}
+        self.files = {}
+
+
+def export_text(index_dir: pathlib.Path, lexicon: Lexicon, out_dir: pathlib.Path):
+    """
+    Dump binary shards as the old 'token - doc: score, ...' text lines, for debugging.
+    :param index_dir: Directory holding the binary shards
+    :param lexicon: Lexicon of the shards
+    :param out_dir: Directory to write final_index_*.txt files into
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    text_files = {}
+    try:
+        with PostingsReader(index_dir) as reader:
+            for term in lexicon:
+                entry = lexicon.get(term)
+                if entry.shard not in text_files:
+                    text_files[entry.shard] = (out_dir / entry.shard).with_suffix('.txt').open('w', encoding='utf8')
+                postings = sorted(reader.postings(entry), key=lambda _: _[1], reverse=True)
+                text_files[entry.shard].write(f"{term} - " + ', '.join([f"{k}: {v:.3f}" for k, v in postings]) + "\n")
+    finally:
+        for text_file in text_files.values():
+            text_file.close()
+
+
+def convert_text_index(index_dir: pathlib.Path) -> Lexicon:
+    """
+    Convert final_index_*.txt shards from before the binary format into binary shards and a lexicon.
+    :param index_dir: Directory holding the text shards
+    :return: Lexicon of the new binary shards (already written to disk)
+    """
+    lexicon = Lexicon(index_dir / Lexicon.FILE_NAME)
+    for text_shard in sorted(index_dir.glob("final_index_*.txt")):
+        binary_shard = text_shard.with_suffix('.bin')
+        with text_shard.open('r', encoding='utf8') as text_file, PostingsWriter(binary_shard) as writer:
+            for line in text_file:
+                token, postings = line.rstrip('\n').split(' - ', 1)
+                doc_score = sorted((int(doc), float(score))
+                                   for doc, score in (_.split(': ') for _ in postings.split(', ')))
+                offset, length = writer.add([_[0] for _ in doc_score], [_[1] for _ in doc_score])
+                lexicon.add(token, binary_shard.name, offset, length, len(doc_score))
+    lexicon.write()
+    return lexicon
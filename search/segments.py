@@ -0,0 +1,408 @@
+import json
+import math
+import os
+import pathlib
+import shelve
+import shutil
+import threading
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+from search.docstore import DocStore, DocStoreWriter
+from search.lexicon import Lexicon
+from search.memindex import MemoryIndex
+from search.merge import merge_entries, read_partial
+from search.postings import PostingsReader, PostingsWriter
+from search.topk import TopK, top_k
+
+# Segments of about the same size that get merged into one, and the size ratio between tiers
+MERGE_FACTOR = 10
+
+POSTINGS_NAME = "postings.bin"
+DOCS_NAME = "docs.txt"
+DOC_IDS_NAME = "doc_ids.bin"
+
+
+def tf_weight(term_freq: int) -> float:
+    """
+    Term frequency part of the tf-idf weight. Segments store only this, the idf is applied when querying since it
+    depends on every segment.
+    """
+    return 1 + math.log(term_freq, 10) if term_freq > 0 else 0.0
+
+
+class Segment:
+    """
+    One immutable segment of an incremental index: a postings shard and lexicon, a document store, and the sorted
+    global doc IDs of its documents (doc_ids.bin), position i of which is record i of the store.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.name = path.name
+        self.lexicon = Lexicon.load(path / Lexicon.FILE_NAME)
+        self.postings = PostingsReader(path)
+        self.documents = DocStore(path / DOCS_NAME)
+        self.doc_ids = array('I')
+        self.doc_ids.frombytes((path / DOC_IDS_NAME).read_bytes())
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def postings_list(self, term: str):
+        entry = self.lexicon.get(term)
+        return self.postings.postings(entry) if entry is not None else None
+
+    def local_id(self, doc_id: int) -> int:
+        return bisect_left(self.doc_ids, doc_id)
+
+    def terms(self, deleted: {int}):
+        """
+        :param deleted: Doc IDs to leave out
+        :return: Generator of (term, [(doc, tf weight), ...]) for every term in order, for merging
+        """
+        for term in self.lexicon:
+            postings = [(doc, weight) for doc, weight in self.postings.postings(self.lexicon.get(term))
+                        if doc not in deleted]
+            if postings:
+                yield term, postings
+
+    def close(self):
+        self.postings.close()
+        self.documents.close()
+
+
+def write_segment(path: pathlib.Path, entries, documents):
+    """
+    Write a segment. It is built under a temporary name and renamed once complete, so a half written segment never
+    looks like a real one.
+    :param path: Directory of the new segment
+    :param entries: (term, [(doc, tf weight), ...]) in term order
+    :param documents: (doc ID, DocRecord-like tuple) in doc ID order
+    """
+    build_path = path.with_suffix('.tmp')
+    shutil.rmtree(build_path, ignore_errors=True)
+    build_path.mkdir(parents=True)
+
+    lexicon = Lexicon(build_path / Lexicon.FILE_NAME)
+    with PostingsWriter(build_path / POSTINGS_NAME) as writer:
+        for term, postings in entries:
+            offset, length = writer.add([doc for doc, _ in postings], [weight for _, weight in postings])
+            lexicon.add(term, POSTINGS_NAME, offset, length, len(postings))
+    lexicon.write()
+
+    doc_ids = array('I')
+    with DocStoreWriter(build_path / DOCS_NAME) as doc_store:
+        for doc_id, (url, title, length, crawl_time) in documents:
+            doc_ids.append(doc_id)
+            doc_store.add(url, title, length, crawl_time)
+    (build_path / DOC_IDS_NAME).write_bytes(doc_ids.tobytes())
+
+    build_path.rename(path)
+
+
+class SegmentBuilder:
+    """
+    Collects the documents of a new segment. Callers index each document into memory_index under a doc ID from
+    next_doc_id(), then record it with add(), which flushes a partial index whenever the memory budget is reached.
+    """
+
+    def __init__(self, segment_index, memory_budget: int):
+        self.segment_index = segment_index
+        self.memory_budget = memory_budget
+        self.memory_index = MemoryIndex()
+        self.partial_dir = segment_index.path / "partials.tmp"
+        shutil.rmtree(self.partial_dir, ignore_errors=True)
+        self.partial_dir.mkdir(parents=True)
+        self.partials = []
+        self.documents = []
+        self.files = {}
+        self.doc_id = segment_index.next_doc
+
+    def next_doc_id(self) -> int:
+        return self.doc_id
+
+    def add(self, file_key: str, mtime: float, document: (str, str, int, float)):
+        """
+        :param file_key: Where the document came from, to notice when it changes or disappears
+        :param mtime: Modification time of the file
+        :param document: (url, title, length, crawl time) of the document just indexed
+        """
+        self.documents.append((self.doc_id, document))
+        self.files[file_key] = (self.doc_id, mtime)
+        self.doc_id += 1
+        if self.memory_index.bytes >= self.memory_budget:
+            self.flush()
+
+    def flush(self):
+        if self.memory_index.docs:
+            partial_path = self.partial_dir / f"partial_index_{len(self.partials)}.txt"
+            self.memory_index.write(partial_path)
+            self.partials.append(partial_path)
+            self.memory_index.clear()
+
+    def write(self, path: pathlib.Path):
+        self.flush()
+        entries = merge_entries([read_partial(_) for _ in self.partials])
+        write_segment(path, ((term, [(doc, tf_weight(doc_count)) for doc, doc_count in postings])
+                             for term, postings in entries), self.documents)
+
+    def discard(self):
+        shutil.rmtree(self.partial_dir, ignore_errors=True)
+
+
+class SegmentIndex:
+    """
+    Incremental index made of immutable segments, so picking up new crawl output costs about as much as the new
+    output instead of a full rebuild.
+
+    - New and changed documents go into a fresh segment with doc IDs that are never reused
+    - Documents that changed or disappeared get a tombstone (tombstones.txt) and are filtered out of results
+    - A shelve of file -> (doc ID, mtime) tells which files are new, changed or gone
+    - A tiered merge policy merges MERGE_FACTOR neighbouring segments of the same size tier in a background thread,
+      dropping tombstoned documents along the way. Only neighbours are merged, so every segment holds a contiguous
+      range of doc IDs and a doc ID is routed to its segment by binary search.
+
+    The live segments are listed in segments.json. Queries work on a snapshot of the segment list, so a merge
+    finishing in the middle of one does not disturb it. Segments a merge replaced are closed and deleted on close().
+    """
+
+    FILE_NAME = "segments.json"
+    FILES_NAME = "files"
+    TOMBSTONES_NAME = "tombstones.txt"
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.merge_thread = None
+        self.retired = []
+        self.generation = 0
+
+        manifest_path = path / self.FILE_NAME
+        manifest = json.loads(manifest_path.read_text(encoding='utf8')) if manifest_path.exists() else {}
+        self.next_doc = manifest.get("next_doc", 0)
+        self.next_segment = manifest.get("next_segment", 0)
+        segment_names = manifest.get("segments", [])
+
+        # Anything not in the manifest is left over from an interrupted build or merge, or was replaced by a merge
+        for leftover in path.iterdir():
+            if leftover.is_dir() and leftover.name not in segment_names:
+                shutil.rmtree(leftover, ignore_errors=True)
+        self.segments = [Segment(path / name) for name in segment_names]
+
+        tombstones_path = path / self.TOMBSTONES_NAME
+        self.set_deleted({int(line) for line in tombstones_path.open()} if tombstones_path.exists() else set())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        segments, (deleted, _) = self.segments, self.tombstones
+        return sum(len(_) for _ in segments) - len(deleted)
+
+    @property
+    def deleted(self) -> {int}:
+        return self.tombstones[0]
+
+    def set_deleted(self, deleted: {int}):
+        # The set and its sorted order are swapped in together, so a query never sees one without the other
+        self.tombstones = (frozenset(deleted), sorted(deleted))
+
+    def __contains__(self, term):
+        return any(term in segment.lexicon for segment in self.segments)
+
+    def doc_freq(self, term: str) -> int:
+        """
+        :return: Doc frequency of a term over every segment, counting tombstoned documents until they are merged away
+        """
+        entries = [segment.lexicon.get(term) for segment in self.segments]
+        return sum(_.doc_freq for _ in entries if _ is not None)
+
+    def segment_of(self, doc_id: int) -> Segment:
+        segments = self.segments
+        position = bisect_right([_.doc_ids[0] for _ in segments], doc_id) - 1
+        if position < 0 or doc_id in self.deleted:
+            raise KeyError(doc_id)
+        segment = segments[position]
+        local_id = segment.local_id(doc_id)
+        if local_id >= len(segment) or segment.doc_ids[local_id] != doc_id:
+            raise KeyError(doc_id)
+        return segment
+
+    def get(self, doc_id: int):
+        """
+        :return: DocRecord of a live document
+        """
+        segment = self.segment_of(doc_id)
+        return segment.documents.get(segment.local_id(doc_id))
+
+    def url(self, doc_id: int) -> str:
+        return self.get(doc_id).url
+
+    def top_k(self, stemmed_terms: [str], k: int, conjunctive=True) -> [(int, float)]:
+        """
+        Rank documents over every live segment. Each term is weighted by its idf over the whole index, and every
+        segment is asked for enough extra results to make up for tombstoned ones, so merging the per-segment top k
+        gives the same results as a single index would.
+        :return: Up to k (doc ID, score) pairs, best first
+        """
+        segments, (deleted, deleted_order) = self.segments, self.tombstones
+        # Tombstoned documents still count for the doc frequencies until a merge drops them, so they count for the
+        # number of documents too, otherwise a common term could end up in more documents than there are
+        total_docs = sum(len(_) for _ in segments)
+        idfs = {}
+        for term in stemmed_terms:
+            doc_freq = sum(_.lexicon.get(term).doc_freq for _ in segments if term in _.lexicon)
+            if doc_freq and total_docs > 0:
+                # Never negative, the score bounds of MaxScore and WAND assume weights only add
+                idfs[term] = max(0.0, math.log(total_docs / doc_freq, 10))
+        if not idfs or k <= 0:
+            return []
+
+        top = TopK(k)
+        for segment in segments:
+            postings_lists = [(segment.postings_list(term), idf) for term, idf in idfs.items()]
+            if conjunctive and any(postings is None for postings, _ in postings_lists):
+                continue
+            postings_lists = [_ for _ in postings_lists if _[0] is not None]
+            segment_deleted = bisect_right(deleted_order, segment.doc_ids[-1]) - \
+                bisect_left(deleted_order, segment.doc_ids[0])
+            for doc, score in top_k([_[0] for _ in postings_lists], k + segment_deleted, conjunctive,
+                                    [_[1] for _ in postings_lists]):
+                if doc not in deleted:
+                    top.push(doc, score)
+        return top.results()
+
+    def changes(self, files: {str: float}) -> ([str], [str]):
+        """
+        :param files: Every file of the crawl, with its modification time
+        :return: Files that are new or changed since they were indexed, and indexed files that are gone
+        """
+        with shelve.open(str(self.path / self.FILES_NAME)) as file_map:
+            changed = [file for file, mtime in files.items() if file not in file_map or file_map[file][1] != mtime]
+            removed = [file for file in file_map if file not in files]
+        return changed, removed
+
+    def builder(self, memory_budget: int) -> SegmentBuilder:
+        return SegmentBuilder(self, memory_budget)
+
+    def commit(self, builder: SegmentBuilder, removed: [str]):
+        """
+        Add the segment a builder collected and tombstone the documents it replaces, along with those of removed files.
+        Then start a background merge if the merge policy finds one.
+        """
+        segment = None
+        if builder.documents:
+            segment_path = self.path / f"segment_{self.next_segment:06}"
+            builder.write(segment_path)
+            segment = Segment(segment_path)
+        builder.discard()
+
+        with self.lock, shelve.open(str(self.path / self.FILES_NAME)) as file_map:
+            tombstones = {file_map[file][0] for file in list(builder.files) + removed if file in file_map}
+            if segment is not None:
+                self.segments = self.segments + [segment]
+                self.next_segment += 1
+            self.next_doc = builder.doc_id
+            self.set_deleted(self.deleted | tombstones)
+            self.write_manifest()
+            self.write_tombstones()
+
+            for file in removed:
+                del file_map[file]
+            file_map.update(builder.files)
+            self.generation += 1
+
+        self.maybe_merge()
+
+    def write_manifest(self):
+        manifest_path = self.path / self.FILE_NAME
+        with manifest_path.with_suffix('.tmp').open('w', encoding='utf8') as manifest_file:
+            json.dump({"next_doc": self.next_doc, "next_segment": self.next_segment,
+                       "segments": [_.name for _ in self.segments]}, manifest_file, indent=2)
+        os.replace(manifest_path.with_suffix('.tmp'), manifest_path)
+
+    def write_tombstones(self):
+        with (self.path / self.TOMBSTONES_NAME).open('w') as tombstones_file:
+            tombstones_file.writelines(f"{_}\n" for _ in sorted(self.deleted))
+
+    @staticmethod
+    def tier(segment: Segment) -> int:
+        return int(math.log(max(len(segment), 1), MERGE_FACTOR))
+
+    def find_merge(self) -> (int, int):
+        """
+        Tiered merge policy: the first run of MERGE_FACTOR neighbouring segments in the same size tier.
+        :return: (start, end) of the segments to merge, or None if nothing needs merging
+        """
+        run_start = 0
+        for position in range(1, len(self.segments) + 1):
+            if position == len(self.segments) or self.tier(self.segments[position]) != \
+                    self.tier(self.segments[run_start]):
+                if position - run_start >= MERGE_FACTOR:
+                    return run_start, run_start + MERGE_FACTOR
+                run_start = position
+        return None
+
+    def maybe_merge(self):
+        """
+        Start merging in a background thread if there is something to merge and no merge is running
+        """
+        if self.merge_thread is not None and self.merge_thread.is_alive():
+            return
+        if self.find_merge() is None:
+            return
+        self.merge_thread = threading.Thread(target=self.merge_all, daemon=True)
+        self.merge_thread.start()
+
+    def merge_all(self):
+        """
+        Keep merging until the merge policy is satisfied. Segments are immutable and commits only ever append, so the
+        merge itself runs without the lock, which is only taken to swap the merged segment in.
+        """
+        while True:
+            with self.lock:
+                merge = self.find_merge()
+                if merge is None:
+                    return
+                start, end = merge
+                merging = self.segments[start:end]
+                deleted = self.deleted
+                segment_path = self.path / f"segment_{self.next_segment:06}"
+                self.next_segment += 1
+
+            merged_ids = {doc_id for segment in merging for doc_id in segment.doc_ids}
+            documents = ((doc_id, segment.documents.get(local_id)) for segment in merging
+                         for local_id, doc_id in enumerate(segment.doc_ids) if doc_id not in deleted)
+            write_segment(segment_path, merge_entries([_.terms(deleted) for _ in merging]), documents)
+            merged = Segment(segment_path)
+
+            with self.lock:
+                self.segments = self.segments[:start] + ([merged] if len(merged) else []) + self.segments[end:]
+                self.set_deleted(self.deleted - (deleted & merged_ids))
+                self.retired += merging + ([] if len(merged) else [merged])
+                self.write_manifest()
+                self.write_tombstones()
+                self.generation += 1
+
+    def wait(self):
+        """
+        Wait for a running background merge to finish
+        """
+        if self.merge_thread is not None:
+            self.merge_thread.join()
+            self.merge_thread = None
+
+    def close(self):
+        self.wait()
+        for segment in self.segments + self.retired:
+            segment.close()
+        for segment in self.retired:
+            shutil.rmtree(segment.path, ignore_errors=True)
+        self.segments = []
+        self.retired = []
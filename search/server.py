@@ -0,0 +1,173 @@
+# Long-running CrungySearch query server
+# Run from the repository root: python -m search.server [--port 8121] [--workers 4]
+# Then query it with: GET /search?q=machine+learning&k=10&offset=0&mode=and
+
+import asyncio
+import json
+import pathlib
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from urllib.parse import parse_qs, urlsplit
+
+from crungus_search import CrungySearchEngine
+
+MAX_K = 1000
+MAX_HEADER_LINES = 100
+
+# Engine of the current worker process, loaded once by init_worker
+worker_engine = None
+
+
+def init_worker(index_dir: str, doc_id_path: str, cache_bytes: int):
+    """
+    Load the index into a worker process. Runs once per worker, so every query after that hits a resident index.
+    """
+    global worker_engine
+    worker_engine = CrungySearchEngine(cache_bytes)
+    worker_engine.index_dir = pathlib.Path(index_dir)
+    worker_engine.doc_id_path = pathlib.Path(doc_id_path)
+    worker_engine.load_lexicon()
+    worker_engine.load_documents()
+
+
+def run_search(query: str, k: int, offset: int, conjunctive: bool) -> dict:
+    """
+    Answer one query inside a worker process.
+    :return: The results page and how long the worker spent on it
+    """
+    start = perf_counter()
+    results = worker_engine.search(query, offset + k, conjunctive)[offset:]
+    hits = [{"rank": offset + rank, "doc_id": doc_id, "url": worker_engine.documents.url(doc_id), "score": score}
+            for rank, (doc_id, score) in enumerate(results, start=1)]
+    return {"results": hits, "search_ms": (perf_counter() - start) * 1000}
+
+
+class SearchServer:
+    """
+    asyncio HTTP/JSON front end. The event loop only parses requests and writes responses, scoring happens in a pool
+    of worker processes that each keep their own copy of the index mapped.
+    """
+
+    def __init__(self, index_dir: pathlib.Path, doc_id_path: pathlib.Path, workers: int = 4,
+                 cache_bytes: int = 64 * 2 ** 20):
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                        initargs=(str(index_dir), str(doc_id_path), cache_bytes))
+        self.workers = workers
+        self.requests_served = 0
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # HTTP/1.1 keep-alive: keep answering requests on this connection until the client is done
+            keep_alive = True
+            while keep_alive:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = {}
+                for _ in range(MAX_HEADER_LINES):
+                    header_line = await reader.readline()
+                    if header_line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header_line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "Malformed request line"}, False)
+                    break
+
+                keep_alive = (version == "HTTP/1.1" and headers.get("connection", "").lower() != "close") or \
+                             (version == "HTTP/1.0" and headers.get("connection", "").lower() == "keep-alive")
+                try:
+                    status, body = await self.route(method, target)
+                except Exception as error:
+                    # Like a broken shard, the client still gets an answer instead of waiting for its timeout
+                    print(f"\tFailed to answer {target}: {error!r}")
+                    status, body = 500, {"error": f"Internal error: {error!r}"}
+                await self.respond(writer, status, body, keep_alive)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method: str, target: str) -> (int, dict):
+        start = perf_counter()
+        if method != "GET":
+            return 405, {"error": f"Method {method} is not allowed"}
+
+        url = urlsplit(target)
+        if url.path == "/health":
+            return 200, {"status": "ok", "requests_served": self.requests_served}
+        if url.path != "/search":
+            return 404, {"error": f"No such endpoint {url.path}"}
+
+        params = parse_qs(url.query)
+        query = params.get("q", [""])[0].strip().lower()
+        try:
+            k = int(params.get("k", ["10"])[0])
+            offset = int(params.get("offset", ["0"])[0])
+        except ValueError:
+            return 400, {"error": "k and offset must be integers"}
+        mode = params.get("mode", ["and"])[0].lower()
+        if not 0 < k <= MAX_K or offset < 0 or mode not in ("and", "or"):
+            return 400, {"error": f"k must be in 1-{MAX_K}, offset must be >= 0 and mode must be 'and' or 'or'"}
+
+        if query:
+            answer = await asyncio.get_running_loop().run_in_executor(
+                self.pool, run_search, query, k, offset, mode == "and")
+        else:
+            answer = {"results": [], "search_ms": 0.0}
+
+        self.requests_served += 1
+        return 200, {"query": query, "k": k, "offset": offset, "mode": mode, **answer,
+                     "took_ms": (perf_counter() - start) * 1000}
+
+    @staticmethod
+    async def respond(writer: asyncio.StreamWriter, status: int, body: dict, keep_alive: bool):
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                   500: "Internal Server Error"}
+        payload = json.dumps(body).encode('utf8')
+        writer.write(f"HTTP/1.1 {status} {reasons[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + payload)
+        await writer.drain()
+
+    async def serve(self, host: str, port: int):
+        # Start the workers, which loads the index, before taking traffic
+        await asyncio.gather(*[asyncio.get_running_loop().run_in_executor(self.pool, int)
+                               for _ in range(self.workers)])
+
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"CrungySearch is serving on http://{host}:{port}/search?q=...")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8121)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--index-dir", type=str, default="final_indices")
+    parser.add_argument("--doc-ids", type=str, default="docID.txt")
+    parser.add_argument("--cache-mb", type=int, default=64)
+    args = parser.parse_args()
+
+    server = SearchServer(pathlib.Path(args.index_dir), pathlib.Path(args.doc_ids), args.workers,
+                          args.cache_mb * 2 ** 20)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("CrungySearch server stopped")
+
+
+if __name__ == '__main__':
+    main()
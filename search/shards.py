@@ -0,0 +1,153 @@
+import json
+import math
+import pathlib
+
+from bisect import bisect_left, bisect_right
+
+from search.lexicon import Lexicon
+
+# While sizing partial indices, the first term after every this many bytes is sampled along with its offset
+SAMPLE_BYTES = 2 ** 16
+
+# Fewest samples to take of a partial, however small. With one sample a partial is a single weight at its first term,
+# and the ranges can only be cut at first terms, which every partial may share.
+MIN_SAMPLES = 64
+
+# Partial index bytes that go into one shard when the number of shards is not given
+TARGET_SHARD_BYTES = 2 ** 24
+
+
+def sample_partial(path: pathlib.Path) -> ([(str, int)], int):
+    """
+    Sizing pass over one partial index.
+    :param path: Partial index to sample
+    :return: (term, byte offset of its line) samples in term order, and the size of the partial
+    """
+    sample_bytes = max(1, min(SAMPLE_BYTES, path.stat().st_size // MIN_SAMPLES))
+    samples = []
+    next_sample = 0
+    offset = 0
+    with path.open('rb') as partial_index_file:
+        for line in partial_index_file:
+            if offset >= next_sample and line.strip():
+                samples.append((line.split(b' - ', 1)[0].decode(), offset))
+                next_sample = offset + sample_bytes
+            offset += len(line)
+    return samples, offset
+
+
+def plan_shards(partials: [pathlib.Path], shard_amount: int = None, min_shards: int = 1):
+    """
+    Split the term space of a set of partial indices into contiguous ranges of about the same number of bytes. Every
+    sample stands for the bytes up to the next sample of its partial, so the ranges are only as exact as SAMPLE_BYTES.
+    There may be fewer ranges than asked for when there are too few distinct sampled terms to cut at.
+    :param partials: Partial indices to plan for
+    :param shard_amount: Number of shards, by default enough for TARGET_SHARD_BYTES each
+    :param min_shards: Fewest shards to plan when shard_amount is not given, usually the number of merge workers
+    :return: (low, high) term ranges, where None is unbounded, and for every range the (partial, start offset) pairs
+             to read it from
+    """
+    sampled = {}
+    weights = []
+    for partial in partials:
+        samples, size = sample_partial(partial)
+        sampled[partial] = samples
+        ends = [offset for _, offset in samples[1:]] + [size]
+        weights += [(term, end - offset) for (term, offset), end in zip(samples, ends)]
+    weights.sort()
+
+    total = sum(weight for _, weight in weights)
+    if not total:
+        return []
+    if shard_amount is None:
+        shard_amount = max(min_shards, math.ceil(total / TARGET_SHARD_BYTES))
+
+    # Cut whenever the running total passes the next equal share, never twice on the same term and never on the first
+    # term, every range starts with a term that is in some partial
+    boundaries = []
+    running = 0
+    for term, weight in weights:
+        if running >= total * (len(boundaries) + 1) / shard_amount and term > (boundaries[-1] if boundaries else
+                                                                                weights[0][0]):
+            boundaries.append(term)
+        running += weight
+
+    plan = []
+    for low, high in zip([None] + boundaries, boundaries + [None]):
+        starts = []
+        for partial, samples in sampled.items():
+            # Start at the last sampled line before the range, or the top if the range starts before every sample
+            position = bisect_left([term for term, _ in samples], low) if low is not None else 0
+            starts.append((partial, samples[position - 1][1] if position else 0))
+        plan.append(((low, high), starts))
+    return plan
+
+
+class Manifest:
+    """
+    Records the shards of the final index: which contiguous term range each covers, its postings file and its
+    lexicon, so a term is routed to its shard by binary search over the first terms of the ranges.
+
+    On disk this is manifest.json, {"shards": [{"low", "postings", "lexicon", "terms", "bytes"}, ...]} in term order.
+    """
+
+    FILE_NAME = "manifest.json"
+
+    def __init__(self, path: pathlib.Path, shards: [dict] = None):
+        self.path = path
+        self.shards = shards or []
+        self.lows = [shard["low"] for shard in self.shards]
+
+    def __len__(self):
+        return len(self.shards)
+
+    def route(self, term: str) -> int:
+        """
+        :return: Number of the shard whose range holds the term
+        """
+        return max(bisect_right(self.lows, term) - 1, 0)
+
+    def write(self):
+        with self.path.open('w', encoding='utf8') as manifest_file:
+            json.dump({"shards": self.shards}, manifest_file, indent=2)
+
+    @classmethod
+    def load(cls, path: pathlib.Path):
+        with path.open('r', encoding='utf8') as manifest_file:
+            return cls(path, json.load(manifest_file)["shards"])
+
+
+class ShardedLexicon:
+    """
+    Lexicon over all shards of a manifest, with the same lookups as Lexicon. A shard's lexicon is only read the first
+    time a term routed to it is looked up.
+    """
+
+    def __init__(self, index_dir: pathlib.Path, manifest: Manifest):
+        self.index_dir = index_dir
+        self.manifest = manifest
+        self.lexicons = [None] * len(manifest)
+
+    def shard_lexicon(self, shard_number: int) -> Lexicon:
+        if self.lexicons[shard_number] is None:
+            self.lexicons[shard_number] = Lexicon.load(self.index_dir / self.manifest.shards[shard_number]["lexicon"])
+        return self.lexicons[shard_number]
+
+    def __len__(self):
+        return sum(shard["terms"] for shard in self.manifest.shards)
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+    def __iter__(self):
+        for shard_number in range(len(self.manifest)):
+            yield from self.shard_lexicon(shard_number)
+
+    def get(self, term: str):
+        """
+        :param term: Stemmed term to look up
+        :return: The LexiconEntry for the term, or None if the term is not indexed
+        """
+        if not self.manifest.shards:
+            return None
+        return self.shard_lexicon(self.manifest.route(term)).get(term)
@@ -0,0 +1,190 @@
+import hashlib
+import pathlib
+import threading
+
+from collections import Counter
+from functools import lru_cache
+from math import log
+
+FINGERPRINT_BITS = 64
+FINGERPRINT_MASK = (1 << FINGERPRINT_BITS) - 1
+
+# Pages whose fingerprints differ in at most this many bits are near duplicates
+MAX_DISTANCE = 2
+
+# The features of a page are its runs of this many words in a row. Single words are shared by any two pages on the
+# same topic or with the same boilerplate around them; runs of words mostly only by pages with the same text.
+SHINGLE_WORDS = 3
+SHINGLE_MULTIPLIER = 0x9E3779B97F4A7C15
+
+# Pages with fewer distinct shingles than this are only compared exactly, their fingerprints are too noisy
+MIN_FEATURES = 8
+
+# While fingerprinting, every bit gets a counter in its own lane of one big int, so a token is added to all 64
+# counters with a few table lookups and one addition instead of a loop over its bits
+LANE_BITS = 40
+LANE_MASK = (1 << LANE_BITS) - 1
+SPREAD = [[sum(1 << ((8 * byte + bit) * LANE_BITS) for bit in range(8) if value >> bit & 1) for value in range(256)]
+          for byte in range(FINGERPRINT_BITS // 8)]
+
+# Features are weighted by 1 + log(count) in steps of 1 / TF_SCALE, so the lane counters stay integers and a shingle
+# repeated all over the page does not outweigh everything else
+TF_SCALE = 16
+
+
+@lru_cache(maxsize=1024)
+def tf_weight(count: int) -> int:
+    return round(TF_SCALE * (1 + log(count)))
+
+
+@lru_cache(maxsize=2 ** 18)
+def feature_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def mix(value: int) -> int:
+    """
+    SplitMix64 finalizer, so every bit of a shingle's hash depends on every word of it
+    """
+    value = (value ^ (value >> 30)) * 0xBF58476D1CE4E5B9 & FINGERPRINT_MASK
+    value = (value ^ (value >> 27)) * 0x94D049BB133111EB & FINGERPRINT_MASK
+    return value ^ (value >> 31)
+
+
+def shingles(tokens: [str], size: int = SHINGLE_WORDS) -> Counter:
+    """
+    :param tokens: Tokens of a page in order
+    :param size: Words per shingle
+    :return: 64-bit hash of every run of size tokens -> number of times it occurs. The word hashes are cached, so
+             per shingle they are only combined and mixed.
+    """
+    hashes = [feature_hash(token) for token in tokens]
+    combined = Counter()
+    for words in zip(*(hashes[_:] for _ in range(size))):
+        value = 0
+        for word_hash in words:
+            value = value * SHINGLE_MULTIPLIER + word_hash
+        combined[mix(value & FINGERPRINT_MASK)] += 1
+    return combined
+
+
+def checksum(tokens: [str]) -> int:
+    """
+    :return: 64-bit checksum of the tokens in order, so pages only differing in markup or whitespace match
+    """
+    return int.from_bytes(hashlib.blake2b(' '.join(tokens).encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def simhash(counts: {int: int}) -> int:
+    """
+    Charikar's SimHash of a bag of features: every bit is set if the features whose hash has it set outweigh the ones
+    whose hash does not, so similar pages get fingerprints that differ in only a few bits. Features weigh in by the
+    log of their count, see tf_weight.
+    :param counts: 64-bit feature hash -> number of occurrences, like shingles() gives
+    :return: 64-bit fingerprint
+    """
+    lanes = 0
+    total = 0
+    for h, count in counts.items():
+        weight = tf_weight(count)
+        spread = 0
+        for byte, table in enumerate(SPREAD):
+            spread |= table[h >> (8 * byte) & 255]
+        lanes += weight * spread
+        total += weight
+
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        if 2 * (lanes >> (bit * LANE_BITS) & LANE_MASK) > total:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def fingerprint(tokens: [str]) -> (int, int):
+    """
+    :param tokens: Tokens of a page in order
+    :return: Checksum and SimHash of the page, the SimHash is None if the page is too short for one
+    """
+    counts = shingles(tokens)
+    return checksum(tokens), simhash(counts) if len(counts) >= MIN_FEATURES else None
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class DuplicateIndex:
+    """
+    Finds pages that were seen before, exactly by checksum or nearly by SimHash. Fingerprints are split into
+    max_distance + 1 bands, and two fingerprints at most max_distance bits apart have to agree on at least one whole
+    band, so only pages sharing a band with a new one are compared instead of every page seen so far.
+
+    Only pages that are not duplicates themselves are kept to compare against. Safe to share between threads.
+    """
+
+    FILE_NAME = "duplicates.txt"
+
+    def __init__(self, max_distance: int = MAX_DISTANCE):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        band_bits = -(-FINGERPRINT_BITS // bands)
+        self.bands = [(start, (1 << min(band_bits, FINGERPRINT_BITS - start)) - 1)
+                      for start in range(0, FINGERPRINT_BITS, band_bits)]
+        self.tables = [{} for _ in self.bands]
+        self.checksums = {}
+        self.duplicates = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.checksums)
+
+    def find(self, page_checksum: int, page_simhash: int = None):
+        """
+        :return: Key of a page the given one duplicates, or None if there is none
+        """
+        original = self.checksums.get(page_checksum)
+        if original is not None or page_simhash is None:
+            return original
+        for table, (start, mask) in zip(self.tables, self.bands):
+            for other_simhash, key in table.get(page_simhash >> start & mask, ()):
+                if hamming_distance(page_simhash, other_simhash) <= self.max_distance:
+                    return key
+        return None
+
+    def add(self, page_checksum: int, page_simhash: int, key):
+        self.checksums[page_checksum] = key
+        if page_simhash is not None:
+            for table, (start, mask) in zip(self.tables, self.bands):
+                table.setdefault(page_simhash >> start & mask, []).append((page_simhash, key))
+
+    def check(self, page_checksum: int, page_simhash: int, key):
+        """
+        Look up a page and remember it if it is new.
+        :param key: What to call the page, like its URL or doc ID
+        :return: Key of the page it duplicates, or None if it is new
+        """
+        with self.lock:
+            original = self.find(page_checksum, page_simhash)
+            if original is None:
+                self.add(page_checksum, page_simhash, key)
+            else:
+                self.duplicates[key] = original
+            return original
+
+    def save(self, path: pathlib.Path):
+        """
+        Write the duplicates found so far as 'key original' lines.
+        """
+        with path.open('w', encoding='utf8') as duplicates_file:
+            for key, original in self.duplicates.items():
+                duplicates_file.write(f"{key} {original}\n")
+
+    @staticmethod
+    def load_duplicates(path: pathlib.Path) -> {int: int}:
+        """
+        :return: Doc ID -> doc ID of the page it duplicates, from a file written by save, empty if there is none
+        """
+        if not path.exists():
+            return {}
+        with path.open('r', encoding='utf8') as duplicates_file:
+            return {int(key): int(original) for key, original in (line.split() for line in duplicates_file)}
@@ -0,0 +1,91 @@
+import pathlib
+import re
+
+from collections import OrderedDict
+
+from nltk.stem import PorterStemmer
+
+# Anything that is not a letter, digit or apostrophe separates tokens
+TOKEN_SPLIT = re.compile(r"[^0-9A-Za-z']+")
+
+
+def tokenize(text: str, min_length: int = 1) -> [str]:
+    """
+    Split text into lowercase tokens. Apostrophes are kept while splitting, so "don't" is one token, and then dropped.
+    This is the one tokenization rule shared by the indexer, the query path and partA.Tokenizer.
+    :param text: Text to tokenize
+    :param min_length: Shortest token to keep
+    :return: Tokens in the order they appear
+    """
+    tokens = []
+    for token in TOKEN_SPLIT.split(text):
+        token = token.replace('\'', '').lower()
+        if len(token) >= min_length:
+            tokens.append(token)
+    return tokens
+
+
+class Stemmer:
+    """
+    Porter stemmer with a bounded memo of word -> stem. Natural language repeats the same words over and over, so
+    most calls are a dict lookup instead of a full stem. When the memo is full, the oldest word makes room. The memo is
+    an OrderedDict because popping the front of a plain dict over and over gets slower the more was popped before.
+
+    The memo can be saved and loaded as 'word<TAB>stem' lines, so the query path can start from the table that was
+    built while indexing.
+    """
+
+    FILE_NAME = "stems.txt"
+
+    def __init__(self, max_size: int = 2 ** 20, track_new: bool = False):
+        """
+        :param max_size: Most words to memoize
+        :param track_new: Remember which words were memoized since the last drain(), only worth it for stemmers whose
+                          entries are handed to another process
+        """
+        self.porter = PorterStemmer()
+        self.max_size = max_size
+        self.table = OrderedDict()
+        self.new_words = [] if track_new else None
+
+    def __len__(self):
+        return len(self.table)
+
+    def stem(self, word: str) -> str:
+        stem = self.table.get(word)
+        if stem is None:
+            stem = self.porter.stem(word)
+            if len(self.table) >= self.max_size:
+                self.table.popitem(last=False)
+            self.table[word] = stem
+            if self.new_words is not None:
+                self.new_words.append(word)
+        return stem
+
+    def drain(self) -> {str: str}:
+        """
+        :return: Entries memoized since the last drain, so worker processes can hand them to the main process
+        """
+        if self.new_words is None:
+            return {}
+        entries = {word: self.table[word] for word in self.new_words if word in self.table}
+        self.new_words = []
+        return entries
+
+    def update(self, entries: {str: str}):
+        for word, stem in entries.items():
+            if word not in self.table:
+                if len(self.table) >= self.max_size:
+                    self.table.popitem(last=False)
+                self.table[word] = stem
+
+    def save(self, path: pathlib.Path):
+        with path.open('w', encoding='utf8') as stem_file:
+            for word, stem in self.table.items():
+                stem_file.write(f"{word}\t{stem}\n")
+
+    def load(self, path: pathlib.Path):
+        with path.open('r', encoding='utf8') as stem_file:
+            self.update(dict(line.rstrip('\n').split('\t') for line in stem_file))
+        if self.new_words is not None:
+            self.new_words = []
@@ -0,0 +1,146 @@
+import heapq
+
+from search.postings import PostingsCursor, PostingsList
+
+END = PostingsCursor.END
+
+
+class TopK:
+    """
+    Bounded min-heap of the k best (doc, score) pairs seen so far. Ties go to the lower doc ID, which is the one that
+    was seen first since postings are walked in doc order.
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        self.heap = []
+
+    def threshold(self) -> float:
+        """
+        :return: The score a doc has to beat to get in, or -1 while the heap still has room
+        """
+        return self.heap[0][0] if len(self.heap) >= self.k else -1.0
+
+    def push(self, doc: int, score: float):
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, (score, -doc))
+        elif score > self.heap[0][0]:
+            heapq.heapreplace(self.heap, (score, -doc))
+
+    def results(self) -> [(int, float)]:
+        """
+        :return: The kept (doc, score) pairs, best first
+        """
+        return [(-doc, score) for score, doc in sorted(self.heap, reverse=True)]
+
+
+def conjunctive_top_k(cursors: [PostingsCursor], k: int, accept=None, static_scores=None) -> [(int, float)]:
+    """
+    Top k docs containing every term. The shortest list leads and the others advance to it through their skip tables.
+    Once the heap is full, whole blocks of the lead list are skipped when even their best doc could not beat the
+    threshold with every other term at its maximum (MaxScore applied per block).
+
+    accept(doc) is an extra, more expensive condition like a phrase match. It is only asked about docs that contain
+    every term and would make it into the heap, with every cursor still on the doc.
+
+    static_scores[doc] is added to every doc's score. Doc IDs have to be in descending static score order (see
+    CrungySearchEngine.process_files), so the current doc's static score bounds every doc after it, and the scan
+    stops as soon as that bound plus the best possible term scores cannot beat the threshold.
+    """
+    cursors = sorted(cursors, key=len)
+    lead, others = cursors[0], cursors[1:]
+    others_max = sum(_.max_score for _ in others)
+    terms_max = lead.max_score + others_max
+    top = TopK(k)
+
+    doc = lead.doc
+    while doc != END:
+        static_max = static_scores[doc] if static_scores is not None else 0.0
+        if static_scores is not None and terms_max + static_max <= top.threshold():
+            # No doc from here on can make it into the top k
+            break
+        if lead.block_max() + others_max + static_max <= top.threshold():
+            doc = lead.next_block()
+            continue
+
+        for cursor in others:
+            if cursor.advance(doc) != doc:
+                doc = lead.advance(cursor.doc)
+                break
+        else:
+            score = lead.score() + sum(_.score() for _ in others) + static_max
+            if score > top.threshold() and (accept is None or accept(doc)):
+                top.push(doc, score)
+            doc = lead.next()
+
+    return top.results()
+
+
+def disjunctive_top_k(cursors: [PostingsCursor], k: int, static_scores=None) -> [(int, float)]:
+    """
+    Top k docs containing any of the terms, using WAND. Cursors are kept in doc order and the pivot is the first
+    cursor at which the summed maximum scores could beat the threshold. Docs before the pivot can never make the top
+    k, so every cursor behind it jumps straight to the pivot doc.
+
+    static_scores[doc] is added to every doc's score, with doc IDs in descending static score order like for
+    conjunctive_top_k. The static score of the first cursor's doc is then part of the bound of every pivot, so once
+    no pivot is left the remaining docs are never looked at.
+    """
+    cursors = [_ for _ in cursors if _.doc != END]
+    top = TopK(k)
+
+    while cursors:
+        cursors.sort(key=lambda _: _.doc)
+
+        # Find the pivot
+        threshold = top.threshold()
+        upper_bound = static_scores[cursors[0].doc] if static_scores is not None else 0.0
+        pivot = None
+        for i, cursor in enumerate(cursors):
+            upper_bound += cursor.max_score
+            if upper_bound > threshold:
+                pivot = i
+                break
+        if pivot is None:
+            break
+
+        pivot_doc = cursors[pivot].doc
+        if cursors[0].doc == pivot_doc:
+            # Every cursor up to the pivot is on the pivot doc, so score it fully
+            score = static_scores[pivot_doc] if static_scores is not None else 0.0
+            for cursor in cursors:
+                if cursor.doc != pivot_doc:
+                    break
+                score += cursor.score()
+                cursor.next()
+            top.push(pivot_doc, score)
+        else:
+            for cursor in cursors[:pivot]:
+                cursor.advance(pivot_doc)
+
+        cursors = [_ for _ in cursors if _.doc != END]
+
+    return top.results()
+
+
+def top_k(postings_lists: [PostingsList], k: int, conjunctive=True, weights: [float] = None,
+          accept=None, static_scores=None) -> [(int, float)]:
+    """
+    Score documents by the summed weights of the query terms and keep only the best k.
+    :param postings_lists: Postings of each (distinct) query term
+    :param k: Number of results to return
+    :param conjunctive: Whether documents must contain every term (AND) or any of them (OR)
+    :param weights: Factor for each term's scores, like an idf applied at query time
+    :param accept: accept(doc, cursors) -> bool, a condition checked on top of containing every term, with the
+                   cursors in the order of postings_lists. Only used by conjunctive queries.
+    :param static_scores: Query independent score of every doc ID to add, like a weighted PageRank. Doc IDs have to be
+                          in descending static score order, which lets the scan stop early.
+    :return: Up to k (doc ID, score) pairs, best first
+    """
+    if not postings_lists or k <= 0:
+        return []
+    cursors = [_.cursor(weight) for _, weight in zip(postings_lists, weights or [1.0] * len(postings_lists))]
+    if conjunctive:
+        return conjunctive_top_k(cursors, k, None if accept is None else lambda doc: accept(doc, cursors),
+                                 static_scores)
+    return disjunctive_top_k(cursors, k, static_scores)
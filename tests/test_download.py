@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from utils.cache_stub import start_stub
+from utils.download import AsyncDownloader
+
+
+def test_async_downloader_decodes_lazily():
+    server = start_stub(pages=5)
+    host, port = server.server_address
+
+    async def fetch_all(urls):
+        async with AsyncDownloader(host, port, "test agent", connections=2) as downloader:
+            return await asyncio.gather(*(downloader.fetch(url) for url in urls))
+
+    try:
+        urls = [f"https://www.ics.uci.edu/p/{page}" for page in range(5)] + ["https://www.ics.uci.edu/missing"]
+        responses = asyncio.run(fetch_all(urls))
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert all(resp._body is not None for resp in responses)
+    assert [resp.status for resp in responses] == [200] * 5 + [404]
+    assert [resp.url for resp in responses] == urls
+    assert b"<title>" in responses[0].raw_response.content
+
+
+def test_async_downloader_closes_connection_on_timeout(monkeypatch):
+    server = start_stub(pages=5, delay_ms=300)
+    host, port = server.server_address
+    writers = []
+    open_connection = asyncio.open_connection
+
+    async def recording_open_connection(*args, **kwargs):
+        reader, writer = await open_connection(*args, **kwargs)
+        writers.append(writer)
+        return reader, writer
+
+    monkeypatch.setattr(asyncio, "open_connection", recording_open_connection)
+
+    async def fetch_slowly():
+        async with AsyncDownloader(host, port, "test agent", connections=1, timeout=0.05) as downloader:
+            for _ in range(3):
+                with pytest.raises(asyncio.TimeoutError):
+                    await downloader.fetch("https://www.ics.uci.edu/p/1")
+            return downloader.idle
+
+    try:
+        idle = asyncio.run(fetch_slowly())
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert idle == []
+    assert len(writers) == 3 and all(writer.is_closing() for writer in writers)
@@ -0,0 +1,93 @@
+import threading
+import time
+
+from crawler.frontier import HostScheduler
+from crawler.frontier_store import LogStore
+
+
+def test_log_store_keeps_only_uncompleted_urls(tmp_path):
+    path = str(tmp_path / "frontier.log")
+    store = LogStore(path, min_compact_records=0, compact_ratio=1.5)
+    for number in range(20):
+        store[f"key{number}"] = (f"https://a.example/{number}", False)
+    for number in range(0, 20, 2):
+        store[f"key{number}"] = (f"https://a.example/{number}", True)
+    store.close()
+
+    store = LogStore(path)
+    assert len(store) == 20
+    assert store.uncompleted == {f"key{number}": f"https://a.example/{number}" for number in range(1, 20, 2)}
+    assert "key4" in store and "key5" in store and "key20" not in store
+    assert store["key4"] == ("https://a.example/4", True)
+    assert store.get("key20") is None
+    assert dict(store.items()) == {f"key{number}": (f"https://a.example/{number}", number % 2 == 0)
+                                   for number in range(20)}
+    store.close()
+
+
+def test_log_store_compaction_keeps_completed_entries(tmp_path):
+    path = str(tmp_path / "frontier.log")
+    store = LogStore(path, batch_records=10, min_compact_records=0, compact_ratio=1.5)
+    for number in range(10):
+        store[f"key{number}"] = (f"https://a.example/{number}", False)
+    for number in range(10):
+        store[f"key{number}"] = (f"https://a.example/{number}", number < 5)
+    assert store.log_records == 10
+    store.close()
+
+    store = LogStore(path)
+    assert sorted(url for url, completed in store.values() if completed) == \
+        sorted(f"https://a.example/{number}" for number in range(5))
+    assert len(store.uncompleted) == 5
+    store.close()
+
+
+def test_host_scheduler_politeness():
+    delay = 0.2
+    scheduler = HostScheduler(delay)
+    for page in range(4):
+        for host in ("a.example", "b.example", "c.example"):
+            scheduler.add(f"https://{host}/{page}")
+
+    fetches = []
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            url = scheduler.get()
+            if url is None:
+                return
+            with lock:
+                fetches.append((time.monotonic(), url.split('/')[2]))
+            scheduler.done(url)
+
+    start = time.monotonic()
+    workers = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join(10)
+    assert len(fetches) == 12 and len(scheduler) == 0
+
+    # Every host gets its first fetch right away, then one per delay, however many workers there are
+    for host in ("a.example", "b.example", "c.example"):
+        times = sorted(fetched for fetched, fetch_host in fetches if fetch_host == host)
+        assert times[0] - start < delay / 2
+        assert all(later - earlier >= delay * 0.99 for earlier, later in zip(times, times[1:]))
+    assert time.monotonic() - start < 4 * delay + 0.5
+
+
+def test_host_scheduler_waits_for_urls_in_flight():
+    scheduler = HostScheduler(0)
+    scheduler.add("https://a.example/")
+    url = scheduler.get()
+    got = []
+    waiting = threading.Thread(target=lambda: got.append(scheduler.get()))
+    waiting.start()
+    time.sleep(0.05)
+    # The URL being crawled may still add more, so the other worker has to wait for it
+    assert waiting.is_alive()
+    scheduler.add("https://a.example/next")
+    scheduler.done(url)
+    waiting.join(5)
+    assert got == ["https://a.example/next"]
@@ -0,0 +1,24 @@
+import search.html_extract
+
+from search import HTMLExtractor, tokenize
+
+
+def extract_tokens(html):
+    extractor = HTMLExtractor()
+    return [(token, weight) for text, weight in extractor.extract(html) for token in tokenize(text)], extractor.title
+
+
+def test_words_across_chunk_boundaries(monkeypatch):
+    monkeypatch.setattr(search.html_extract, "CHUNK_SIZE", 8)
+    tokens, title = extract_tokens("<html><head><title>Crungus search</title></head><body><p>information retrieval"
+                                   "</p><b>bold words</b>tail text</body></html>")
+    assert title == "Crungus search"
+    assert tokens == [("crungus", 15), ("search", 15), ("information", 0), ("retrieval", 0), ("bold", 1),
+                      ("words", 1), ("tail", 0), ("text", 0)]
+
+
+def test_long_page_keeps_whole_words():
+    html = "<html><body><p>" + "word " * 20000 + "</p></body></html>"
+    tokens, _ = extract_tokens(html)
+    assert len(tokens) == 20000
+    assert {token for token, _ in tokens} == {"word"}
@@ -0,0 +1,22 @@
+from search.pagerank import page_scores, pagerank
+from utils.link_graph import pack_link_graph
+
+
+def test_pagerank_sums_to_one_and_favours_linked_pages():
+    # 0 -> 1, 0 -> 2, 1 -> 2, 2 -> 0, and 3 links to 2 but nothing links to it
+    ranks = pagerank([0, 2, 3, 4, 5], [1, 2, 2, 0, 2])
+    assert abs(ranks.sum() - 1) < 1e-9
+    assert ranks.argmax() == 2
+    assert ranks.argmin() == 3
+
+
+def test_page_scores_from_link_log(tmp_path):
+    log_path = tmp_path / "links.log"
+    log_path.write_text("https://a.example/\thttps://b.example/\thttps://c.example/\n"
+                        "https://b.example/\thttps://c.example/\n"
+                        "https://c.example/\thttps://a.example/#top\n")
+    assert pack_link_graph(log_path, tmp_path / "links.graph") == (3, 4)
+    scores = page_scores(tmp_path / "links.graph", ["http://c.example", "https://a.example/", "https://d.example/"])
+    assert scores[0] == 1.0
+    assert 0 < scores[1] < 1
+    assert scores[2] == 0.0
@@ -0,0 +1,43 @@
+import random
+
+from itertools import product
+
+from search.positions import PositionsList, PositionsWriter, phrase_match
+
+
+def brute_force_match(term_positions, slop):
+    return any(all(0 < following - previous <= slop + 1 for previous, following in zip(chain, chain[1:]))
+               for chain in product(*term_positions))
+
+
+def test_later_position_of_a_middle_term():
+    # 1 -> 2 leaves 5 out of reach, 1 -> 3 -> 5 fits
+    assert phrase_match([[1], [2, 3], [5]], 1)
+    assert not phrase_match([[1], [2, 3], [5]], 0)
+
+
+def test_exact_phrase():
+    assert phrase_match([[4, 9], [10], [11]])
+    assert not phrase_match([[4, 9], [11], [12]])
+    assert not phrase_match([[3], [2]])
+
+
+def test_against_brute_force():
+    rng = random.Random(7)
+    for _ in range(2000):
+        term_positions = [sorted(rng.sample(range(30), rng.randint(1, 6))) for _ in range(rng.randint(1, 4))]
+        slop = rng.choice([0, 0, 1, 2, 5])
+        assert phrase_match(term_positions, slop) == brute_force_match(term_positions, slop), (term_positions, slop)
+
+
+def test_positions_round_trip(tmp_path):
+    rng = random.Random(3)
+    doc_positions = [sorted(rng.sample(range(1000), rng.randint(1, 20))) for _ in range(300)]
+    path = tmp_path / "shard_000.pos"
+    with PositionsWriter(path) as writer:
+        writer.add([[0]])
+        offset = writer.add(doc_positions)
+    positions_list = PositionsList(path.read_bytes(), offset)
+    # Forward lookups continue from the last one, going back starts the block over
+    for number in list(range(0, 300, 7)) + [5, 130, 2]:
+        assert positions_list.doc_positions(number // 128, number % 128) == doc_positions[number]
@@ -0,0 +1,93 @@
+import json
+import math
+import os
+import random
+
+from crungus_search import CrungySearchEngine
+from search.segments import tf_weight
+
+
+def write_page(crawl_dir, name, words, mtime):
+    page = crawl_dir / "site" / f"{name}.json"
+    page.parent.mkdir(parents=True, exist_ok=True)
+    page.write_text(json.dumps({"url": f"https://www.ics.uci.edu/{name}",
+                                "content": f"<html><body><p>{' '.join(words)}</p></body></html>"}))
+    os.utime(page, (mtime, mtime))
+
+
+def make_engine(tmp_path):
+    engine = CrungySearchEngine(cache_bytes=0)
+    engine.segment_dir = tmp_path / "segments"
+    engine.index_dir = tmp_path / "final_indices"
+    return engine
+
+
+def brute_force(engine, pages, terms, k, conjunctive):
+    """
+    Score the current pages the way SegmentIndex.top_k is meant to: tombstoned documents count for the number of
+    documents and doc frequencies until they are merged away
+    """
+    segments = engine.segments
+    total_docs = sum(len(_) for _ in segments.segments)
+    idfs = {term: max(0.0, math.log(total_docs / segments.doc_freq(term), 10)) for term in terms
+            if segments.doc_freq(term)}
+    url_ids = {}
+    for doc_id in range(segments.next_doc):
+        try:
+            url_ids[segments.url(doc_id)] = doc_id
+        except KeyError:
+            pass
+    scored = []
+    for name, words in pages.items():
+        present = [term for term in idfs if term in words]
+        if not present or (conjunctive and len(present) < len(idfs)):
+            continue
+        scored.append((sum(tf_weight(words.count(term)) * idfs[term] for term in present),
+                       url_ids[f"https://www.ics.uci.edu/{name}"]))
+    scored.sort(key=lambda _: (-_[0], _[1]))
+    return scored[:k]
+
+
+def test_common_term_after_update(tmp_path):
+    crawl_dir = tmp_path / "crawl"
+    for number in range(5):
+        write_page(crawl_dir, f"p{number}", ["common", f"word{number}"], 1000)
+    engine = make_engine(tmp_path)
+    engine.update_index(crawl_dir)
+    write_page(crawl_dir, "p0", ["common", "changed"], 2000)
+    engine.update_index(crawl_dir)
+
+    results = engine.segments.top_k(["common"], 10)
+    assert len(results) == 5
+    assert all(score >= 0 for _, score in results)
+    engine.close_index()
+
+
+def test_top_k_after_updates_against_brute_force(tmp_path):
+    rng = random.Random(5)
+    vocabulary = [f"w{number}" for number in range(40)]
+    crawl_dir = tmp_path / "crawl"
+    engine = make_engine(tmp_path)
+    pages = {}
+    for update in range(4):
+        # Some new pages, some changed ones and a removed one every round
+        for name in [f"p{update}_{number}" for number in range(15)] + rng.sample(sorted(pages), min(5, len(pages))):
+            pages[name] = [rng.choice(vocabulary) for _ in range(rng.randint(3, 30))]
+            write_page(crawl_dir, name, pages[name], 1000 + update)
+        if update:
+            removed = rng.choice(sorted(pages))
+            (crawl_dir / "site" / f"{removed}.json").unlink()
+            del pages[removed]
+        engine.update_index(crawl_dir)
+        engine.segments.wait()
+
+        for _ in range(20):
+            terms = rng.sample(vocabulary, rng.randint(1, 3))
+            for conjunctive in (True, False):
+                results = engine.segments.top_k(terms, 10, conjunctive)
+                expected = brute_force(engine, pages, terms, 10, conjunctive)
+                assert len(results) == len(expected)
+                # Scores are quantized in the postings, so only compare them approximately
+                for (_, score), (expected_score, _) in zip(results, expected):
+                    assert abs(score - expected_score) < 1e-3
+    engine.close_index()
@@ -0,0 +1,38 @@
+import asyncio
+import json
+
+from concurrent.futures import ThreadPoolExecutor
+
+from search.server import SearchServer
+
+
+async def request(reader, writer, target):
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: test\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) != b'\r\n':
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return status, json.loads(await reader.readexactly(int(headers["content-length"])))
+
+
+def test_engine_error_gets_a_500(tmp_path):
+    search_server = SearchServer(tmp_path, tmp_path / "docID.txt", workers=1)
+    # No worker ever loaded an engine here, so every search raises inside run_search
+    search_server.pool = ThreadPoolExecutor(max_workers=1)
+
+    async def exchange():
+        server = await asyncio.start_server(search_server.handle_connection, "127.0.0.1", 0)
+        async with server:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            answers = [await request(reader, writer, "/search?q=crungus"), await request(reader, writer, "/health")]
+            writer.close()
+            return answers
+
+    try:
+        (status, body), (health_status, _) = asyncio.run(exchange())
+    finally:
+        search_server.pool.shutdown()
+    assert status == 500 and "error" in body
+    assert health_status == 200
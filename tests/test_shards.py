@@ -0,0 +1,25 @@
+from search import plan_shards, read_partial
+
+
+def write_partial(path, terms, first_doc):
+    with path.open('w') as partial_file:
+        for term in terms:
+            partial_file.write(f"{term} - {first_doc}: 1, {first_doc + 1}: 2\n")
+
+
+def test_no_empty_shards(tmp_path):
+    # Both partials start with the same term, like every batch of pages has some common number or word
+    terms = [f"{word}{number}" for word in ("alpha", "beta", "gamma", "delta") for number in range(50)]
+    write_partial(tmp_path / "partial_0.txt", sorted(terms[::2] + ["0"]), 0)
+    write_partial(tmp_path / "partial_1.txt", sorted(terms[1::2] + ["0"]), 10)
+    partials = sorted(tmp_path.iterdir())
+
+    for shard_amount in (2, 3, 4):
+        plan = plan_shards(partials, shard_amount)
+        assert len(plan) == shard_amount
+        seen = []
+        for (low, high), starts in plan:
+            shard_terms = {term for partial, start in starts for term, _ in read_partial(partial, start, low, high)}
+            assert shard_terms
+            seen += shard_terms
+        assert sorted(seen) == sorted(terms + ["0"])
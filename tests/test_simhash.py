@@ -0,0 +1,35 @@
+import random
+
+from search import DuplicateIndex, fingerprint
+
+
+def zipf_page(rng: random.Random, words: int) -> [str]:
+    vocabulary = [f"word{rank}" for rank in range(1, 5001)]
+    return rng.choices(vocabulary, weights=[1 / rank ** 1.1 for rank in range(1, 5001)], k=words)
+
+
+def test_common_words_do_not_make_duplicates():
+    # Pages drawn from the same Zipf distribution share their most common words and nothing else
+    rng = random.Random(7)
+    duplicates = DuplicateIndex()
+    pages = [zipf_page(rng, rng.randint(200, 1500)) for _ in range(100)]
+    assert all(duplicates.check(*fingerprint(page), key) is None for key, page in enumerate(pages))
+
+
+def test_near_duplicate_is_found():
+    rng = random.Random(11)
+    page = zipf_page(rng, 1000)
+    changed = page[:500] + ["edited"] + page[500:]
+    duplicates = DuplicateIndex()
+    assert duplicates.check(*fingerprint(page), "original") is None
+    assert duplicates.check(*fingerprint(changed), "copy") == "original"
+
+
+def test_shared_template_is_not_a_duplicate():
+    # Every page is the same 300 word template around 100 words of its own, from a small vocabulary
+    rng = random.Random(3)
+    template = zipf_page(rng, 300)
+    duplicates = DuplicateIndex()
+    for key in range(300):
+        page = template[:150] + zipf_page(rng, 100) + template[150:]
+        assert duplicates.check(*fingerprint(page), key) is None
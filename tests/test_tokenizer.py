@@ -0,0 +1,24 @@
+from search import Stemmer
+
+
+def test_stemmer_evicts_oldest_word():
+    stemmer = Stemmer(max_size=3)
+    for word in ["running", "jumps", "easily", "cats"]:
+        stemmer.stem(word)
+    stemmer.update({"flies": "fli", "cats": "cat"})
+    assert list(stemmer.table) == ["easily", "cats", "flies"]
+    assert stemmer.stem("running") == "run"
+    assert len(stemmer) == 3
+
+
+def test_stemmer_only_tracks_new_words_when_asked():
+    stemmer = Stemmer(max_size=2)
+    for word in ["running", "jumps", "easily"] * 3:
+        stemmer.stem(word)
+    assert stemmer.new_words is None and stemmer.drain() == {}
+
+    tracking = Stemmer(track_new=True)
+    tracking.stem("running")
+    tracking.stem("running")
+    assert tracking.drain() == {"running": "run"}
+    assert tracking.drain() == {}
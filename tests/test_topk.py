@@ -0,0 +1,71 @@
+import random
+
+from array import array
+
+import pytest
+
+from search.postings import PostingsList, PostingsReader, PostingsWriter
+from search.topk import top_k
+
+
+def write_terms(path, rng, docs, lengths):
+    """
+    :return: Offset of every term written, with that many random docs and scores each
+    """
+    offsets = []
+    with PostingsWriter(path) as writer:
+        for length in lengths:
+            doc_ids = sorted(rng.sample(range(docs), length))
+            offsets.append(writer.add(doc_ids, [rng.uniform(0.01, 5.0) for _ in doc_ids])[0])
+    return offsets
+
+
+def brute_force(postings_lists, k, conjunctive, weights, accept=None, static_scores=None):
+    # Scores as stored, after quantization, so they have to match top_k's exactly
+    term_scores = []
+    for postings, weight in zip(postings_lists, weights):
+        doc_ids, scores = postings.decode()
+        term_scores.append({doc: score * weight for doc, score in zip(doc_ids, scores)})
+    docs = set.intersection(*map(set, term_scores)) if conjunctive else set.union(*map(set, term_scores))
+    scored = []
+    for doc in docs:
+        if accept is not None and not accept(doc):
+            continue
+        score = sum(scores.get(doc, 0.0) for scores in term_scores)
+        scored.append((doc, score + (static_scores[doc] if static_scores is not None else 0.0)))
+    scored.sort(key=lambda _: -_[1])
+    return scored[:k]
+
+
+@pytest.mark.parametrize("conjunctive", [True, False])
+@pytest.mark.parametrize("with_static", [False, True])
+def test_top_k_against_brute_force(tmp_path, conjunctive, with_static):
+    rng = random.Random(5)
+    docs = 3000
+    offsets = write_terms(tmp_path / "shard_000.bin", rng, docs, [5, 90, 400, 1200, 2500])
+    # Static scores have to go down with the doc ID
+    static_scores = array('f', sorted((rng.uniform(0, 2) for _ in range(docs)), reverse=True)) if with_static else None
+    with PostingsReader(tmp_path) as reader:
+        shard = reader.shard("shard_000.bin")
+        for _ in range(40):
+            terms = rng.sample(offsets, rng.randint(1, 4))
+            postings_lists = [PostingsList(shard, offset) for offset in terms]
+            weights = [rng.uniform(0.1, 3.0) for _ in terms]
+            k = rng.choice([1, 10, 50])
+            expected = brute_force(postings_lists, k, conjunctive, weights, static_scores=static_scores)
+            results = top_k(postings_lists, k, conjunctive, weights, static_scores=static_scores)
+            # Ties may come back in another order, the scores may not
+            assert [score for _, score in results] == pytest.approx([score for _, score in expected])
+            scores = dict(brute_force(postings_lists, docs, conjunctive, weights, static_scores=static_scores))
+            assert all(scores[doc] == pytest.approx(score) for doc, score in results)
+
+
+def test_top_k_accept(tmp_path):
+    rng = random.Random(9)
+    offsets = write_terms(tmp_path / "shard_000.bin", rng, 2000, [300, 1500])
+    with PostingsReader(tmp_path) as reader:
+        postings_lists = [PostingsList(reader.shard("shard_000.bin"), offset) for offset in offsets]
+        expected = brute_force(postings_lists, 20, True, [1.0, 1.0], accept=lambda doc: doc % 3 == 0)
+        results = top_k(postings_lists, 20, accept=lambda doc, cursors: doc % 3 == 0)
+    assert [score for _, score in results] == pytest.approx([score for _, score in expected])
+    assert all(doc % 3 == 0 for doc, _ in results)
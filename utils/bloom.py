@@ -0,0 +1,140 @@
+import math
+import threading
+
+from functools import lru_cache
+from hashlib import blake2b
+from struct import Struct
+
+# Chance that a URL never added is taken for a seen one
+DEFAULT_ERROR_RATE = 0.0001
+
+# Serialized layout: error rate, initial capacity, growth, tightening, number of filters, then for every filter its
+# capacity, size in bits, number of hashes, number of items and bits
+CHAIN = Struct("<dQddI")
+FILTER = Struct("<QQIQ")
+
+
+@lru_cache(maxsize=1024)
+def url_hashes(item: str) -> (int, int):
+    """
+    :return: Two independent 64-bit hashes of the item, every position in a filter is derived from these two. The last
+             few are memoized, a URL is usually looked up in a couple of filters in a row.
+    """
+    digest = int.from_bytes(blake2b(item.encode('utf-8'), digest_size=16).digest(), 'little')
+    return digest & 0xFFFFFFFFFFFFFFFF, digest >> 64 | 1
+
+
+class BloomFilter(object):
+    """
+    Fixed size Bloom filter sized for capacity items at error_rate. Bit positions come from double hashing,
+    h1 + i * h2, so an item is hashed once however many positions it needs.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(-(-self.size // 8))
+        self.count = 0
+
+    def __contains__(self, hashes):
+        h1, h2 = hashes
+        bits = self.bits
+        size = self.size
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % size
+            if not bits[position >> 3] & 1 << (position & 7):
+                return False
+        return True
+
+    def add(self, hashes):
+        h1, h2 = hashes
+        bits = self.bits
+        size = self.size
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % size
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+
+class ScalableBloomFilter(object):
+    """
+    Set of strings kept as a chain of Bloom filters (Almeida et al., "Scalable Bloom Filters"). Once the newest filter
+    is full, a bigger one with a tighter error rate is added, so the whole chain stays under error_rate however many
+    items go in, at around 2-3 bytes per item instead of the item itself.
+
+    Membership is approximate: something never added is reported as present at most error_rate of the time, something
+    added always is. Safe to share between threads.
+    """
+
+    def __init__(self, error_rate=DEFAULT_ERROR_RATE, initial_capacity=2 ** 16, growth=2, tightening=0.5):
+        """
+        :param error_rate: Most false positives allowed over the whole chain
+        :param initial_capacity: Items the first filter holds
+        :param growth: How much bigger every next filter is
+        :param tightening: How much smaller the error rate of every next filter is
+        """
+        self.error_rate = error_rate
+        self.initial_capacity = initial_capacity
+        self.growth = growth
+        self.tightening = tightening
+        self.lock = threading.Lock()
+        self.filters = [BloomFilter(initial_capacity, error_rate * (1 - tightening))]
+
+    def __len__(self):
+        return sum(bloom.count for bloom in self.filters)
+
+    def __contains__(self, item):
+        hashes = url_hashes(item)
+        for bloom in reversed(self.filters):
+            if hashes in bloom:
+                return True
+        return False
+
+    def add(self, item) -> bool:
+        """
+        :return: True if the item was new and got added, False if it was (probably) in already
+        """
+        hashes = url_hashes(item)
+        with self.lock:
+            # Newer filters are bigger and hold most items, so they are checked first
+            for bloom in reversed(self.filters):
+                if hashes in bloom:
+                    return False
+            bloom = self.filters[-1]
+            if bloom.count >= bloom.capacity:
+                bloom = BloomFilter(bloom.capacity * self.growth,
+                                    self.error_rate * (1 - self.tightening) * self.tightening ** len(self.filters))
+                self.filters.append(bloom)
+            bloom.add(hashes)
+            return True
+
+    def to_bytes(self) -> bytes:
+        with self.lock:
+            parts = [CHAIN.pack(self.error_rate, self.initial_capacity, self.growth, self.tightening,
+                                len(self.filters))]
+            for bloom in self.filters:
+                parts.append(FILTER.pack(bloom.capacity, bloom.size, bloom.hash_count, bloom.count))
+                parts.append(bytes(bloom.bits))
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        error_rate, initial_capacity, growth, tightening, filter_count = CHAIN.unpack_from(data)
+        chain = cls(error_rate, initial_capacity, growth, tightening)
+        chain.filters = []
+        position = CHAIN.size
+        for _ in range(filter_count):
+            bloom = BloomFilter.__new__(BloomFilter)
+            bloom.capacity, bloom.size, bloom.hash_count, bloom.count = FILTER.unpack_from(data, position)
+            position += FILTER.size
+            bloom.bits = bytearray(data[position:position + -(-bloom.size // 8)])
+            position += len(bloom.bits)
+            chain.filters.append(bloom)
+        return chain
+
+    def memory(self) -> int:
+        """
+        :return: Bytes of filter bits
+        """
+        return sum(len(bloom.bits) for bloom in self.filters)
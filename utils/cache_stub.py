@@ -0,0 +1,162 @@
+# Local stand-in for the course cache server, for running the crawler and the downloaders without the real one.
+# It speaks the same protocol: GET /?q=<url>&u=<user agent> answers with cbor {"url", "status", "response"}, where
+# "response" is a pickled requests.Response.
+#
+# Pages come from a crawl store when one is given (anything not in it is a 404), otherwise every host gets a made up
+# site of --pages pages linking to each other and now and then to the other hosts.
+#
+#   python -m utils.cache_stub --port 9001 --delay-ms 20
+#   python launch.py --cache_server 127.0.0.1:9001
+
+import hashlib
+import pickle
+import pathlib
+import random
+import threading
+import time
+
+import cbor
+import requests
+
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from utils.crawl_store import CrawlStoreReader
+
+WORDS = ("search engine index crawler query token stem posting shard merge segment frontier politeness host cache "
+         "server student faculty research course lecture informatics statistics computer science graduate").split()
+
+
+def synthetic_page(url: str, pages: int, hosts: [str]) -> (int, bytes):
+    """
+    :return: Status and HTML for a url of a made up site, the same every time for the same url
+    """
+    parsed = urlparse(url)
+    path = parsed.path.rstrip('/')
+    if path and not (path.startswith("/p/") and path[3:].isdigit() and int(path[3:]) < pages):
+        return 404, b"<html><body>Not found</body></html>"
+
+    rng = random.Random(hashlib.md5(url.encode('utf-8')).digest())
+    text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(50, 300)))
+    links = []
+    for _ in range(rng.randint(3, 12)):
+        host = rng.choice(hosts) if hosts and rng.random() < 0.1 else parsed.netloc
+        links.append(f'<a href="{parsed.scheme or "https"}://{host}/p/{rng.randrange(pages)}">{rng.choice(WORDS)}</a>')
+    title = " ".join(rng.choice(WORDS) for _ in range(3))
+    return 200, f"<html><head><title>{title}</title></head><body><p>{text}</p>{' '.join(links)}</body></html>" \
+        .encode('utf-8')
+
+
+def pickled_response(url: str, status: int, content: bytes, headers: dict = None, encoding: str = 'utf-8') -> bytes:
+    response = requests.models.Response()
+    response.url = url
+    response.status_code = status
+    response._content = content
+    response.headers.update(headers or {"Content-Type": "text/html; charset=utf-8"})
+    response.encoding = encoding
+    return pickle.dumps(response)
+
+
+class CacheStub(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections when a pipelined client opens many at once
+    request_queue_size = 128
+
+    def __init__(self, address, pages=200, hosts=None, store=None, delay_ms=0):
+        """
+        :param address: (host, port) to listen on, port 0 picks a free one
+        :param pages: Pages per host of the made up sites
+        :param hosts: Hosts the made up sites link across
+        :param store: Crawl store to serve pages from instead
+        :param delay_ms: Time to wait before every answer, to act like a far away server
+        """
+        super().__init__(address, CacheStubHandler)
+        self.pages = pages
+        self.hosts = hosts or []
+        self.delay_ms = delay_ms
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.records = {}
+        self.reader = None
+        if store is not None:
+            self.reader = CrawlStoreReader(store)
+            self.records = {self.reader.read(offset).url: offset for offset in self.reader.offsets()}
+
+    def answer(self, url: str) -> dict:
+        with self.lock:
+            self.requests += 1
+        if self.reader is not None:
+            if url not in self.records:
+                return {"url": url, "status": 404, "response": pickled_response(url, 404, b'')}
+            record = self.reader.read(self.records[url])
+            return {"url": url, "status": record.status,
+                    "response": pickled_response(url, record.status, record.content, record.headers,
+                                                 record.encoding)}
+        status, content = synthetic_page(url, self.pages, self.hosts)
+        return {"url": url, "status": status, "response": pickled_response(url, status, content)}
+
+    def server_close(self):
+        super().server_close()
+        if self.reader is not None:
+            self.reader.close()
+
+
+class CacheStubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep their connections open between requests
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes, with Nagle on every kept-alive request would wait on a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        if "q" not in query or "u" not in query:
+            self.send_error(400, "Expected q and u parameters")
+            return
+        if self.server.delay_ms:
+            time.sleep(self.server.delay_ms / 1000)
+        body = cbor.dumps(self.server.answer(query["q"][0]))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/cbor")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(port=0, **kwargs) -> CacheStub:
+    """
+    Serve a CacheStub on a background thread.
+    :return: The running server, its address is server.server_address and server.shutdown() stops it
+    """
+    server = CacheStub(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--pages", type=int, default=200, help="Pages per host of the made up sites")
+    parser.add_argument("--hosts", type=str, default="www.ics.uci.edu,www.cs.uci.edu,www.informatics.uci.edu,"
+                                                     "www.stat.uci.edu", help="Hosts the made up sites link across")
+    parser.add_argument("--store", type=str, default=None, help="Serve the pages of this crawl store instead")
+    parser.add_argument("--delay-ms", type=int, default=0, help="Wait before every answer")
+    args = parser.parse_args()
+
+    server = CacheStub(("127.0.0.1", args.port), args.pages, args.hosts.split(","),
+                       pathlib.Path(args.store) if args.store else None, args.delay_ms)
+    print(f"Cache stand-in listening on 127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"\tAnswered {server.requests} requests")
+
+
+if __name__ == '__main__':
+    main()
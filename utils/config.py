@@ -8,12 +8,18 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.async_connections = int(config["LOCAL PROPERTIES"].get("ASYNCCONNECTIONS", "0"))
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.save_format = config["LOCAL PROPERTIES"].get("SAVEFORMAT", "shelve").strip().lower()
+        self.crawl_store = config["LOCAL PROPERTIES"].get("CRAWLSTORE", "").strip() or None
+        self.link_graph = config["LOCAL PROPERTIES"].get("LINKGRAPH", "").strip() or None
+        self.checkpoint_interval = float(config["LOCAL PROPERTIES"].get("CHECKPOINT", "60"))
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.seen_error_rate = float(config["CRAWLER"].get("SEENERRORRATE", "0.0001"))
 
         self.cache_server = None
\ No newline at end of file
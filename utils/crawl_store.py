@@ -0,0 +1,221 @@
+# Packed container for crawled pages, written by the crawler workers and read by the indexer.
+# Instead of one small JSON file per page, every page is one compressed, checksummed record appended to a single file:
+#
+#   header   MAGIC
+#   frame    compressed length (u32), crc32 of the compressed bytes (u32), uncompressed length (u32)
+#            zlib(status (u16), crawl time (f64), url length (u32), encoding length (u16), headers length (u32),
+#                 content length (u32), url, encoding, headers as JSON, content)
+#
+# A frame cut short by a crash is dropped the next time the file is opened for writing.
+# Convert a DEV folder with: python -m utils.crawl_store convert DEV crawl.store
+
+import json
+import mmap
+import pathlib
+import threading
+import time
+import zlib
+
+from argparse import ArgumentParser
+from struct import Struct
+from typing import NamedTuple
+
+MAGIC = b"CRNGCRL1"
+FRAME = Struct("<III")
+META = Struct("<HdIHII")
+
+COMPRESSION_LEVEL = 6
+
+
+class CrawlRecord(NamedTuple):
+    url: str
+    status: int
+    headers: dict
+    content: bytes
+    encoding: str
+    crawl_time: float
+
+    def text(self) -> str:
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+
+def pack_record(record: CrawlRecord) -> bytes:
+    url = record.url.encode('utf-8')
+    encoding = (record.encoding or '').encode('utf-8')
+    headers = json.dumps(record.headers or {}).encode('utf-8')
+    payload = META.pack(record.status, record.crawl_time, len(url), len(encoding), len(headers),
+                        len(record.content)) + url + encoding + headers + record.content
+    compressed = zlib.compress(payload, COMPRESSION_LEVEL)
+    return FRAME.pack(len(compressed), zlib.crc32(compressed), len(payload)) + compressed
+
+
+def unpack_record(payload: bytes) -> CrawlRecord:
+    status, crawl_time, url_length, encoding_length, headers_length, content_length = META.unpack_from(payload)
+    position = META.size
+    url = payload[position:position + url_length].decode('utf-8')
+    position += url_length
+    encoding = payload[position:position + encoding_length].decode('utf-8')
+    position += encoding_length
+    headers = json.loads(payload[position:position + headers_length])
+    position += headers_length
+    return CrawlRecord(url, status, headers, payload[position:position + content_length], encoding, crawl_time)
+
+
+def valid_length(path: pathlib.Path) -> int:
+    """
+    :return: Length of the part of the file made of complete frames
+    """
+    with path.open('rb') as store_file:
+        if store_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a crawl store")
+        end = len(MAGIC)
+        while True:
+            header = store_file.read(FRAME.size)
+            if len(header) < FRAME.size:
+                return end
+            compressed_length = FRAME.unpack(header)[0]
+            if len(store_file.read(compressed_length)) < compressed_length:
+                return end
+            end += FRAME.size + compressed_length
+
+
+class CrawlStoreWriter:
+    """
+    Appends pages to a crawl store. One writer can be shared by every crawler thread, each record goes out in a single
+    write under a lock, so records never interleave.
+    """
+
+    def __init__(self, path: pathlib.Path, flush_every: int = 64):
+        """
+        :param path: Crawl store to create or append to
+        :param flush_every: Records between flushes to disk
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.count = 0
+        if path.exists() and path.stat().st_size:
+            # Drop a record a crash left half written
+            end = valid_length(path)
+            self.file = path.open('r+b')
+            self.file.truncate(end)
+            self.file.seek(end)
+        else:
+            self.file = path.open('wb')
+            self.file.write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, url: str, status: int, headers: dict, content: bytes, encoding: str = 'utf-8',
+            crawl_time: float = None):
+        frame = pack_record(CrawlRecord(url, status, dict(headers or {}), content or b'', encoding or '',
+                                        time.time() if crawl_time is None else crawl_time))
+        with self.lock:
+            self.file.write(frame)
+            self.count += 1
+            self.pending += 1
+            if self.pending >= self.flush_every:
+                self.file.flush()
+                self.pending = 0
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+
+class CrawlStoreReader:
+    """
+    Reads a crawl store through one memory map, so going through every page costs no per-page open() or stat().
+    Records are addressed by the offset of their frame.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.file = path.open('rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a crawl store")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self):
+        for offset in self.offsets():
+            yield self.read(offset)
+
+    def offsets(self):
+        """
+        :return: Generator of the offset of every complete frame, only reading the frame headers
+        """
+        offset = len(MAGIC)
+        while offset + FRAME.size <= len(self.map):
+            compressed_length = FRAME.unpack_from(self.map, offset)[0]
+            if offset + FRAME.size + compressed_length > len(self.map):
+                return
+            yield offset
+            offset += FRAME.size + compressed_length
+
+    def read(self, offset: int) -> CrawlRecord:
+        compressed_length, crc, payload_length = FRAME.unpack_from(self.map, offset)
+        compressed = self.map[offset + FRAME.size:offset + FRAME.size + compressed_length]
+        if zlib.crc32(compressed) != crc:
+            raise ValueError(f"Corrupt record at offset {offset} of {self.path}")
+        return unpack_record(zlib.decompress(compressed, bufsize=payload_length))
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def convert_dev(dev_dir: pathlib.Path, store_path: pathlib.Path) -> int:
+    """
+    Pack a DEV folder (one folder per domain, one JSON file with url, content and encoding per page) into a crawl
+    store, in the same sorted order the indexer walks folders in, so doc IDs come out the same either way.
+    :return: Number of pages packed
+    """
+    store_path.unlink(missing_ok=True)
+    with CrawlStoreWriter(store_path) as writer:
+        for folder in sorted(dev_dir.iterdir()):
+            if not folder.is_dir():
+                continue
+            for file in sorted(folder.iterdir()):
+                with file.open() as contents:
+                    page = json.load(contents)
+                # The JSON holds already decoded text, so it is stored as UTF-8 whatever the page was served as
+                writer.add(page["url"], 200, {"declared-encoding": page.get("encoding", '')},
+                           page["content"].encode('utf-8', errors='replace'), 'utf-8', file.stat().st_mtime)
+        return writer.count
+
+
+def main():
+    parser = ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="Pack a DEV folder into a crawl store")
+    convert.add_argument("dev_dir", type=str)
+    convert.add_argument("store", type=str)
+    stats = commands.add_parser("stats", help="Count the records of a crawl store")
+    stats.add_argument("store", type=str)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        start = time.perf_counter()
+        count = convert_dev(pathlib.Path(args.dev_dir), pathlib.Path(args.store))
+        print(f"Packed {count} pages into {args.store} in {time.perf_counter() - start:.3f}s "
+              f"({pathlib.Path(args.store).stat().st_size} bytes)")
+    else:
+        with CrawlStoreReader(pathlib.Path(args.store)) as reader:
+            print(f"{sum(1 for _ in reader.offsets())} records in {args.store}")
+
+
+if __name__ == '__main__':
+    main()
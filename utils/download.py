@@ -1,18 +1,139 @@
+import asyncio
+import threading
 import requests
-import cbor
-import time
+
+from urllib.parse import urlencode
+from requests.adapters import HTTPAdapter
 
 from utils.response import Response
 
+# One keep-alive connection pool to the cache server is shared by every worker thread
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size=16):
+    """
+    The shared session, created on first use with room for pool_size open connections
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
 def download(url, config, logger=None):
     host, port = config.cache_server
-    resp = requests.get(
+    resp = get_session(max(config.threads_count, 1)).get(
         f"http://{host}:{port}/",
         params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
     if resp:
-        return Response(cbor.loads(resp.content))
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
+        return Response(body=resp.content)
+    if logger:
+        logger.error(f"Spacetime Response error {resp} with url {url}.")
     return Response({
         "error": f"Spacetime Response error {resp} with url {url}.",
         "status": resp.status_code,
         "url": url})
+
+
+class AsyncDownloader(object):
+    """
+    asyncio client for the cache server that keeps up to `connections` requests in flight over keep-alive
+    connections, for fetching many URLs from one thread (see crawler.worker.AsyncWorker). Speaks just enough HTTP/1.1
+    for the cache server: Content-Length or chunked bodies, and connections the server closes are reopened.
+    """
+
+    def __init__(self, host, port, user_agent, connections=16, timeout=30):
+        self.host = host
+        self.port = port
+        self.user_agent = user_agent
+        self.connections = connections
+        self.timeout = timeout
+        self.idle = list()
+        self.slots = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def fetch(self, url):
+        """
+        :return: utils.response.Response for the url
+        """
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.connections)
+        async with self.slots:
+            query = urlencode([("q", url), ("u", self.user_agent)])
+            # A pooled connection may have been closed by the server in the meantime, so that gets one retry
+            for attempt in range(2):
+                reader, writer = self.idle.pop() if self.idle else \
+                    await asyncio.open_connection(self.host, self.port)
+                try:
+                    writer.write(f"GET /?{query} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                                 f"Connection: keep-alive\r\n\r\n".encode('latin-1'))
+                    await writer.drain()
+                    status, body, keep_alive = await asyncio.wait_for(self._read_response(reader), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if attempt:
+                        raise
+                    continue
+                except BaseException:
+                    # After a timeout or a garbled answer the connection is in no state to be reused. Closing it frees
+                    # the socket, and the next fetch in this slot opens a fresh one.
+                    writer.close()
+                    raise
+                if keep_alive:
+                    self.idle.append((reader, writer))
+                else:
+                    writer.close()
+                break
+
+        if 200 <= status < 400:
+            return Response(body=body)
+        return Response({
+            "error": f"Spacetime Response error <Response [{status}]> with url {url}.",
+            "status": status,
+            "url": url})
+
+    @staticmethod
+    async def _read_response(reader):
+        status_line = await reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = dict()
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode('latin-1').partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = headers.get("connection", "").lower() != "close" and not status_line.startswith(b"HTTP/1.0")
+        if "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = list()
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if not size:
+                    break
+                chunks.append(chunk[:-2])
+            body = b"".join(chunks)
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return status, body, keep_alive
+
+    async def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = list()
+
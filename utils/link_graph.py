@@ -0,0 +1,190 @@
+# Link graph of the crawl, for static ranks like PageRank (see search/pagerank.py).
+#
+# While crawling, every page's outlinks are appended to a plain text log, one 'page<TAB>link<TAB>link...' line per
+# page. Once the crawl is done the log is packed into compressed sparse row (CSR) form:
+#
+#   header   MAGIC, number of nodes (u64), number of edges (u64), length of the URLs (u64)
+#   offsets  (nodes + 1) * u64, the links of node i are targets[offsets[i]:offsets[i + 1]]
+#   targets  edges * u32, node of every link
+#   URLs     UTF-8 URL of every node, one per line
+#
+# Pack a log with: python -m utils.link_graph pack links.log links.graph
+
+import mmap
+import pathlib
+import threading
+import time
+
+from argparse import ArgumentParser
+from array import array
+from struct import Struct
+
+MAGIC = b"CRNGLNK1"
+HEADER = Struct("<QQQ")
+
+
+def url_key(url: str) -> str:
+    """
+    :return: The node a URL belongs to. Fragments, a trailing / and the scheme do not make a different page.
+    """
+    url = url.split('#')[0].rstrip('/')
+    return url.partition("://")[2] or url
+
+
+class LinkGraphWriter:
+    """
+    Appends the outlinks of crawled pages to a link log. One writer can be shared by every crawler thread.
+    """
+
+    def __init__(self, path: pathlib.Path, flush_every: int = 64):
+        """
+        :param path: Link log to create or append to
+        :param flush_every: Pages between flushes to disk
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.count = 0
+        self.file = path.open('a', encoding='utf-8')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, url: str, links: [str]):
+        # Whitespace has no business in a URL, and a tab or newline would break the line apart
+        line = '\t'.join(' '.join(_.split()) for _ in [url, *links]) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.count += 1
+            self.pending += 1
+            if self.pending >= self.flush_every:
+                self.file.flush()
+                self.pending = 0
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+
+def pack_link_graph(log_path: pathlib.Path, graph_path: pathlib.Path) -> (int, int):
+    """
+    Pack a link log into a CSR link graph. Links from a page to itself and repeated links are dropped, and a page
+    crawled more than once gets the links of every crawl. A line a crash cut short is skipped.
+    :return: Number of nodes and edges
+    """
+    node_ids = {}
+    links = []
+    with log_path.open('r', encoding='utf-8') as log_file:
+        for line in log_file:
+            if not line.endswith('\n'):
+                break
+            page, *page_links = line.rstrip('\n').split('\t')
+            nodes = []
+            for url in [page, *page_links]:
+                key = url_key(url)
+                node = node_ids.get(key)
+                if node is None:
+                    node = node_ids[key] = len(node_ids)
+                    links.append(None)
+                nodes.append(node)
+            source = nodes[0]
+            targets = links[source] if links[source] is not None else set()
+            targets.update(nodes[1:])
+            targets.discard(source)
+            links[source] = targets
+
+    offsets = array('Q', [0])
+    targets = array('I')
+    for node_links in links:
+        targets.extend(sorted(node_links or ()))
+        offsets.append(len(targets))
+    url_bytes = '\n'.join(node_ids).encode('utf-8')
+
+    with graph_path.open('wb') as graph_file:
+        graph_file.write(MAGIC + HEADER.pack(len(node_ids), len(targets), len(url_bytes)))
+        offsets.tofile(graph_file)
+        targets.tofile(graph_file)
+        graph_file.write(url_bytes)
+    return len(node_ids), len(targets)
+
+
+class LinkGraph:
+    """
+    Reads a packed link graph through a memory map. offsets and targets are views into the map, so NumPy can wrap them
+    without a copy, and the URLs are only decoded when asked for.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.file = path.open('rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a link graph")
+        self.nodes, self.edges, url_length = HEADER.unpack_from(self.map, len(MAGIC))
+        start = len(MAGIC) + HEADER.size
+        self.view = view = memoryview(self.map)
+        self.offsets = view[start:start + (self.nodes + 1) * 8].cast('Q')
+        start += (self.nodes + 1) * 8
+        self.targets = view[start:start + self.edges * 4].cast('I')
+        start += self.edges * 4
+        self.url_start, self.url_end = start, start + url_length
+        self._urls = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.nodes
+
+    def urls(self) -> [str]:
+        """
+        :return: The url_key of every node, in node order
+        """
+        if self._urls is None:
+            url_bytes = self.map[self.url_start:self.url_end]
+            self._urls = url_bytes.decode('utf-8').split('\n') if url_bytes else []
+        return self._urls
+
+    def links(self, node: int) -> [int]:
+        return list(self.targets[self.offsets[node]:self.offsets[node + 1]])
+
+    def close(self):
+        # The views have to go before the map can be closed
+        for view in ("offsets", "targets", "view"):
+            if hasattr(self, view):
+                getattr(self, view).release()
+        self.map.close()
+        self.file.close()
+
+
+def main():
+    parser = ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="Pack a link log into a link graph")
+    pack.add_argument("log", type=str)
+    pack.add_argument("graph", type=str)
+    stats = commands.add_parser("stats", help="Count the nodes and edges of a link graph")
+    stats.add_argument("graph", type=str)
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        start = time.perf_counter()
+        nodes, edges = pack_link_graph(pathlib.Path(args.log), pathlib.Path(args.graph))
+        print(f"Packed {nodes} pages and {edges} links into {args.graph} in {time.perf_counter() - start:.3f}s "
+              f"({pathlib.Path(args.graph).stat().st_size} bytes)")
+    else:
+        with LinkGraph(pathlib.Path(args.graph)) as graph:
+            print(f"{graph.nodes} pages and {graph.edges} links in {args.graph}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,53 @@
 import pickle
 
+import cbor
+
 class Response(object):
-    def __init__(self, resp_dict):
-        self.url = resp_dict["url"]
-        self.status = resp_dict["status"]
-        self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+    def __init__(self, resp_dict=None, body=None):
+        """
+        :param resp_dict: Decoded answer of the cache server
+        :param body: Or the cbor encoded answer as it came in, only decoded once one of the fields is used. Whoever
+                     handles the page pays for it, not the thread that downloaded it.
+        """
+        self._body = body
+        if resp_dict is not None:
+            self._load(resp_dict)
+
+    def _load(self, resp_dict):
+        self._url = resp_dict["url"]
+        self._status = resp_dict["status"]
+        self._error = resp_dict["error"] if "error" in resp_dict else None
+        # The pickled page is only loaded the first time raw_response is used, most error pages never need it
+        self._pickled = resp_dict["response"] if "response" in resp_dict else None
+        self._raw_response = None
+
+    def _decode(self):
+        if self._body is not None:
+            self._load(cbor.loads(self._body))
+            self._body = None
+
+    @property
+    def url(self):
+        self._decode()
+        return self._url
+
+    @property
+    def status(self):
+        self._decode()
+        return self._status
+
+    @property
+    def error(self):
+        self._decode()
+        return self._error
+
+    @property
+    def raw_response(self):
+        self._decode()
+        if self._pickled is not None:
+            try:
+                self._raw_response = pickle.loads(self._pickled)
+            except TypeError:
+                self._raw_response = None
+            self._pickled = None
+        return self._raw_response